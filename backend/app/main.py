@@ -1,7 +1,11 @@
-from fastapi import FastAPI, Request
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+import time
+# Measure how long importing the app takes (a large part of a Cloud Run cold start).
+_import_started = time.perf_counter()
+
+import asyncio
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 import os
 from dotenv import load_dotenv
 
@@ -11,9 +15,57 @@ from dotenv import load_dotenv
 # - For Docker: CWD is '/app', .env is found at '/app/.env'.
 load_dotenv()
 
-from app.routers import ads, persona
+from app.routers import ads, bulk, frontend, health, images, metrics, persona, stats
+from app.services import clients, executors, image_renditions, vertex_ai_service
+from app.services.audit_log import audit_logger
+from app.services.bulk_jobs import bulk_job_runner
+from app.services.persona_catalog import persona_catalog
+from app.services.pregeneration import pregenerator
+from app.services.static_assets import static_assets
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create the Vertex AI / BigQuery / Cloud Logging handles in the background so
+    # startup is not delayed; /readyz reports when they are available.
+    # Set CLIENT_WARMUP=false to create them lazily on first use instead.
+    warm_up_task = None
+    if os.getenv("CLIENT_WARMUP", "true").lower() == "true":
+        warm_up_task = asyncio.create_task(
+            executors.run_blocking(
+                "vertex_ai",
+                vertex_ai_service.warm_up_clients,
+                include_bigquery=bool(os.getenv("BIGQUERY_DATASET")),
+            )
+        )
+    else:
+        clients.mark_warm_up_skipped()
+    # Spawn the image process pool in a thread now, rather than on the event loop
+    # when the first rendition is requested.
+    process_pool_task = asyncio.create_task(asyncio.to_thread(image_renditions.warm_up))
+    # Load the persona catalog in the background and keep it fresh.
+    if os.getenv("BIGQUERY_DATASET"):
+        persona_catalog.start()
+    # Read the React build (and its compressed variants) into memory.
+    await asyncio.to_thread(static_assets.load)
+    # Start the background flusher for prompt/response audit logging.
+    audit_logger.start()
+    # Resume bulk jobs that were interrupted by the last shutdown.
+    await bulk_job_runner.start()
+    # Pre-generate popular requests while idle (PREGENERATION_ENABLED=true).
+    pregenerator.start()
+    yield
+    await pregenerator.stop()
+    await bulk_job_runner.stop()
+    await persona_catalog.stop()
+    # Write out audit log records still queued.
+    await asyncio.to_thread(audit_logger.stop)
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    process_pool_task.cancel()
+    # Release the worker threads used for blocking Vertex AI / BigQuery calls.
+    executors.shutdown_executors(wait=False)
 
-app = FastAPI(title="Project Alchemy Task 3 API")
+app = FastAPI(title="Project Alchemy Task 3 API", lifespan=lifespan)
 
 # CORS Middleware (useful for local development if frontend is on a different port)
 # Adjust origins as needed. For Cloud Run with integrated frontend, this might be less critical
@@ -36,46 +88,18 @@ app.add_middleware(
 # API Routers
 app.include_router(ads.router, prefix="/api/v1", tags=["Advertisements"])
 app.include_router(persona.router, prefix="/api/v1", tags=["Persona"])
+app.include_router(images.router, prefix="/api/v1", tags=["Images"])
+app.include_router(bulk.router, prefix="/api/v1", tags=["Bulk Jobs"])
+app.include_router(stats.router, prefix="/api/v1", tags=["Stats"])
+app.include_router(health.router)
+app.include_router(metrics.router)
 
-# Serve static files (React build)
-# The 'directory' path is relative to where main.py is located.
-# If React builds into 'project-alchemy-task3/backend/app/static/', this should be correct.
-static_files_path = os.path.join(os.path.dirname(__file__), "static")
-
-# Mount the 'static' directory from the React build (e.g., for JS, CSS, images within React's static folder)
-# This assumes your React build process creates a 'static' subfolder for assets like CSS and JS.
-# e.g., index.html might refer to <script src="/static/js/main.chunk.js"></script>
-app.mount("/static", StaticFiles(directory=os.path.join(static_files_path, "static")), name="react_static_assets")
-
-@app.get("/{catchall:path}", include_in_schema=False)
-async def serve_react_app(request: Request, catchall: str):
-    """
-    Serve the index.html for any path not caught by API routes or specific static file mounts.
-    This allows React Router to handle client-side routing.
-    """
-    index_file_path = os.path.join(static_files_path, "index.html")
-    if os.path.exists(index_file_path):
-        return FileResponse(index_file_path)
-    # You could return a 404 if index.html is not found, or a more specific error.
-    return FileResponse(os.path.join(os.path.dirname(__file__), "static/index.html_placeholder.html")) # Fallback if no index.html
-
-@app.get("/", include_in_schema=False)
-async def root():
-    """
-    Serve the index.html for the root path.
-    """
-    index_file_path = os.path.join(static_files_path, "index.html")
-    if os.path.exists(index_file_path):
-        return FileResponse(index_file_path)
-    # Placeholder if index.html doesn't exist yet
-    return FileResponse(os.path.join(os.path.dirname(__file__), "static/index.html_placeholder.html"))
+# Serve the React build from memory (precompressed variants, ETags, immutable
+# caching for hashed bundles). Its catch-all route must be registered last.
+app.include_router(frontend.router)
 
-# Placeholder index.html for initial setup until React build is integrated
-# This is just to make the server runnable without the actual frontend build.
-# We'll create this placeholder file next.
-if not os.path.exists(os.path.join(static_files_path, "index.html_placeholder.html")):
-    with open(os.path.join(static_files_path, "index.html_placeholder.html"), "w") as f:
-        f.write("<html><body><h1>FastAPI Backend Running</h1><p>React frontend not built or integrated yet.</p></body></html>")
+health.startup_timing["import_seconds"] = time.perf_counter() - _import_started
+print(f"Application import took {health.startup_timing['import_seconds']:.3f}s")
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 # from enum import Enum # Enum is no longer needed
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 class AdGenerationRequest(BaseModel):
     # customer_type: CustomerType # Removed
@@ -8,10 +8,60 @@ class AdGenerationRequest(BaseModel):
     product_description: str
     persona_description: Optional[str] = Field(None, description="Detailed description of the target persona.")
     number_of_variations: Optional[int] = Field(default=1, description="Number of ad variations to generate. Frontend will send 3 if multiple are desired.")
+    bypass_cache: Optional[bool] = Field(default=False, description="Skip the result cache and always generate fresh creatives.")
+    inline_images: Optional[bool] = Field(default=False, description="Legacy mode: return images as base64 data URIs instead of URLs.")
+    generation_mode: Optional[Literal["batched", "per_variation"]] = Field(default="batched", description="'batched': one Gemini call for all variations (all-or-nothing). 'per_variation': one call per variation with partial retry; successful creatives are returned even if some variations fail.")
 
 class AdCreative(BaseModel):
     ad_text: str = Field(..., description="Generated advertisement text for one creative.")
-    ad_image_data: str = Field(..., description="Generated advertisement image data as a base64 encoded string for one creative.")
+    ad_image_data: str = Field(..., description="URL of the generated advertisement image (/api/v1/images/{digest}, full resolution), or a base64 data URI when inline_images was requested.")
+    ad_image_preview: Optional[str] = Field(None, description="URL of a downscaled preview of the image (WebP or PNG, negotiated), for display.")
+    ad_image_thumbnail: Optional[str] = Field(None, description="URL of a small thumbnail of the image.")
+    variation_index: Optional[int] = Field(None, description="Index of the variation this creative belongs to (per_variation mode).")
+
+class VariationStatus(BaseModel):
+    index: int = Field(..., description="Index of the variation.")
+    status: Literal["ok", "failed"] = Field(..., description="Whether the variation produced a creative.")
+    attempts: int = Field(..., description="Number of generation attempts (0 if served from the cache).")
+    cached: bool = Field(False, description="Whether the variation was served from the result cache.")
+    error: Optional[str] = Field(None, description="Last error for a failed variation.")
 
 class AdGenerationResponse(BaseModel):
     creatives: List[AdCreative] = Field(..., description="List of generated ad creatives.")
+    variations: Optional[List[VariationStatus]] = Field(None, description="Per-variation status (per_variation mode only).")
+
+class BulkProduct(BaseModel):
+    product: str
+    product_description: str
+
+class BulkJobRequest(BaseModel):
+    requests: Optional[List[AdGenerationRequest]] = Field(None, description="Explicit list of generation requests.")
+    products: Optional[List[BulkProduct]] = Field(None, description="Products to cross with the persona segments from BigQuery (one request per product x persona).")
+    persona_limit: Optional[int] = Field(None, description="Only use the first N persona segments when crossing products with personas.")
+    number_of_variations: Optional[int] = Field(default=1, description="Variations per product x persona request.")
+    generation_mode: Optional[Literal["batched", "per_variation"]] = Field(default="batched", description="Generation mode for product x persona requests.")
+
+class BulkJobStatus(BaseModel):
+    job_id: str
+    status: str = Field(..., description="queued, running, completed, completed_with_errors or cancelled.")
+    total: int
+    pending: int
+    running: int
+    succeeded: int
+    failed: int
+    created_at: float
+    updated_at: float
+
+class BulkJobItem(BaseModel):
+    index: int
+    status: str = Field(..., description="pending, running, succeeded or failed.")
+    request: AdGenerationRequest
+    result: Optional[AdGenerationResponse] = None
+    error: Optional[str] = None
+    attempts: int
+
+class BulkJobResultsPage(BaseModel):
+    job: BulkJobStatus
+    offset: int
+    limit: int
+    items: List[BulkJobItem]
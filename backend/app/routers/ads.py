@@ -1,85 +1,168 @@
-from fastapi import APIRouter, HTTPException
-from app.models.ad_models import AdGenerationRequest, AdGenerationResponse, AdCreative # CustomerType is used by services
-from app.services import prompt_service, vertex_ai_service
+from fastapi import APIRouter, HTTPException, Response
+from fastapi.responses import StreamingResponse
+from app.models.ad_models import AdGenerationRequest, AdGenerationResponse, AdCreative, VariationStatus # CustomerType is used by services
+from app.services import ad_generation_service, image_renditions, metrics
+from app.services.image_store import image_store
+from app.services.pregeneration import pregenerator
 from typing import List
+import asyncio
+import json
+import time
 
 router = APIRouter()
 
 # Define the number of variations to generate
 NUM_VARIATIONS = 3
+MAX_VARIATIONS = 4
+
+def _variations_label(num_to_generate: int) -> str:
+    """Metric label for a client-supplied variation count, bounded to the valid values (1-4) plus "invalid"."""
+    return str(num_to_generate) if 1 <= num_to_generate <= MAX_VARIATIONS else "invalid"
 
 @router.post("/generate_ad_content", response_model=AdGenerationResponse)
 async def generate_ad_content_api(request: AdGenerationRequest):
     """
     Endpoint to generate multiple advertisement content variations (text and image)
     based on customer type, product, and product description.
+    Identical requests are served from the result cache unless bypass_cache is set.
+    Images are returned as URLs, or as base64 data URIs if inline_images is set.
+    With generation_mode="per_variation" each variation is generated and retried
+    independently, and the creatives that succeeded are returned with per-variation statuses.
+    Per-stage timings are returned in the Server-Timing header and recorded on /metrics.
     """
-    try:
-        num_to_generate = request.number_of_variations if request.number_of_variations is not None else NUM_VARIATIONS
-        if not (1 <= num_to_generate <= 4): # Imagen 3 supports up to 4, Gemini can do more but let's cap for consistency
-            raise HTTPException(status_code=400, detail="Number of variations must be between 1 and 4.")
+    num_to_generate = request.number_of_variations if request.number_of_variations is not None else NUM_VARIATIONS
+    outcome = "error"
+    with metrics.trace() as trace:
+        try:
+            if not (1 <= num_to_generate <= MAX_VARIATIONS): # Imagen 3 supports up to 4, Gemini can do more but let's cap for consistency
+                raise HTTPException(status_code=400, detail="Number of variations must be between 1 and 4.")
 
-        # 1. Get Gemini prompt for multiple variations
-        gemini_prompt_text = prompt_service.get_gemini_prompt(
-            # request.customer_type, # Removed
-            request.product,
-            request.product_description,
-            persona_description=request.persona_description, # Pass persona_description
-            number_of_variations=num_to_generate
-        )
+            statuses = None
+            if request.generation_mode == "per_variation":
+                generated, statuses = await ad_generation_service.generate_creatives_per_variation(
+                    request.product,
+                    request.product_description,
+                    request.persona_description,
+                    num_to_generate,
+                    bypass_cache=bool(request.bypass_cache),
+                )
+            else:
+                # Build the prompts, run Gemini and Imagen concurrently and pair the results
+                # (see ad_generation_service), or reuse a cached result for the same prompts.
+                generated = await ad_generation_service.generate_creatives(
+                    request.product,
+                    request.product_description,
+                    request.persona_description,
+                    num_to_generate,
+                    bypass_cache=bool(request.bypass_cache),
+                )
 
-        # 2. Generate ad texts using Gemini
-        ad_texts = vertex_ai_service.generate_ad_text_with_gemini(gemini_prompt_text, num_variations=num_to_generate)
-        
-        # Basic error check for the list of texts
-        if not ad_texts or len(ad_texts) < num_to_generate or any("Error:" in text or "Sorry," in text for text in ad_texts):
-            # Consolidate error reporting if texts are missing or contain errors
-            error_detail = "Failed to generate one or more ad texts."
-            if ad_texts: # Some texts might exist, log them or provide more specific errors
-                for i, text in enumerate(ad_texts):
-                    if "Error:" in text or "Sorry," in text:
-                        error_detail += f" Text {i+1}: {text}"
-            raise HTTPException(status_code=500, detail=error_detail)
+            if request.inline_images:
+                # Legacy mode: embed the images as base64 data URIs instead of URLs.
+                with metrics.span("inline_images", variations=num_to_generate):
+                    generated = [
+                        {**creative, "ad_image_data": await asyncio.to_thread(image_store.to_data_uri, creative["ad_image_data"])}
+                        for creative in generated
+                    ]
 
-        # 3. Get Imagen prompt (it's the same prompt, Imagen service handles generating multiple images)
-        imagen_prompt_text = prompt_service.get_imagen_prompt(
-            # request.customer_type, # Removed
-            request.product,
-            request.product_description,
-            persona_description=request.persona_description, # Pass persona_description
-            number_of_variations=num_to_generate 
-        )
+            # Validate and serialize here (rather than in FastAPI) so the cost shows up as its own stage.
+            with metrics.span("serialize", variations=num_to_generate):
+                creatives: List[AdCreative] = [
+                    AdCreative(**creative, **image_renditions.rendition_urls(creative["ad_image_data"]))
+                    for creative in generated
+                ]
+                variations = [VariationStatus(**status) for status in statuses] if statuses is not None else None
+                body = AdGenerationResponse(creatives=creatives, variations=variations).model_dump_json()
+            outcome = "ok"
+            if request.generation_mode != "per_variation" and not request.bypass_cache:
+                # Popularity tracking for speculative pre-generation
+                pregenerator.record_request(
+                    request.product,
+                    request.product_description,
+                    request.persona_description,
+                    num_to_generate,
+                    cache_hit=trace.cache_hit_label() == "true",
+                )
+            return Response(content=body, media_type="application/json", headers={"Server-Timing": trace.server_timing()})
 
-        # 4. Generate ad images using Imagen
-        ad_image_data_list = vertex_ai_service.generate_ad_image_with_imagen(
-            imagen_prompt_text,
-            number_of_images=num_to_generate
-        )
+        # except ValueError as ve: # customer_type is no longer validated here directly
+        #     raise HTTPException(status_code=400, detail=str(ve))
+        except HTTPException:
+            raise
+        except Exception as e:
+            # Log the exception for debugging
+            print(f"An unexpected error occurred: {e}")
+            raise HTTPException(status_code=500, detail="An internal server error occurred.")
+        finally:
+            metrics.request_duration.observe(
+                time.perf_counter() - trace.started,
+                endpoint="generate_ad_content",
+                mode=request.generation_mode,
+                variations=_variations_label(num_to_generate),
+                cache_hit=trace.cache_hit_label(),
+                outcome=outcome,
+            )
 
-        # Basic error check for the list of images
-        if not ad_image_data_list or len(ad_image_data_list) < num_to_generate or any("Error:" in img_data or "Failed" in img_data for img_data in ad_image_data_list):
-            error_detail = "Failed to generate one or more ad images."
-            if ad_image_data_list:
-                 for i, img_data in enumerate(ad_image_data_list):
-                    if "Error:" in img_data or "Failed" in img_data:
-                        error_detail += f" Image {i+1} generation failed."
-            raise HTTPException(status_code=500, detail=error_detail)
+def _format_sse(event: str, data: dict) -> str:
+    """Formats one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-        # 5. Combine texts and images into AdCreative objects
-        creatives: List[AdCreative] = []
-        for i in range(num_to_generate):
-            # Ensure we have both text and image for each creative
-            if i < len(ad_texts) and i < len(ad_image_data_list):
-                creatives.append(AdCreative(ad_text=ad_texts[i], ad_image_data=ad_image_data_list[i]))
-            else:
-                # This case should ideally be caught by earlier checks, but as a safeguard:
-                raise HTTPException(status_code=500, detail=f"Mismatch in generated texts and images count for creative {i+1}.")
-        
-        return AdGenerationResponse(creatives=creatives)
+@router.post("/generate_ad_content/stream")
+async def generate_ad_content_stream_api(request: AdGenerationRequest):
+    """
+    Streaming variant of /generate_ad_content using Server-Sent Events.
+    Emits Gemini text as it arrives ("text_delta", then one "text" event per
+    variation), each image as soon as Imagen returns it ("image", tagged with its
+    variation index), "error" events for failed items and a final "summary" event.
+    """
+    num_to_generate = request.number_of_variations if request.number_of_variations is not None else NUM_VARIATIONS
+    if not (1 <= num_to_generate <= MAX_VARIATIONS): # Imagen 3 supports up to 4, Gemini can do more but let's cap for consistency
+        raise HTTPException(status_code=400, detail="Number of variations must be between 1 and 4.")
+
+    async def event_stream():
+        started = time.perf_counter()
+        outcome, cache_hit = "cancelled", ""
+        try:
+            async for event, data in ad_generation_service.stream_creatives(
+                request.product,
+                request.product_description,
+                request.persona_description,
+                num_to_generate,
+                bypass_cache=bool(request.bypass_cache),
+            ):
+                if event == "image" and request.inline_images:
+                    data = {**data, "ad_image_data": await asyncio.to_thread(image_store.to_data_uri, data["ad_image_data"])}
+                elif event == "image":
+                    data = {**data, **image_renditions.rendition_urls(data["ad_image_data"])}
+                elif event == "summary":
+                    outcome = "ok" if data["errors"] == 0 else "error"
+                    cache_hit = "true" if data["cached"] else ("" if request.bypass_cache else "false")
+                    if not request.bypass_cache:
+                        pregenerator.record_request(
+                            request.product,
+                            request.product_description,
+                            request.persona_description,
+                            num_to_generate,
+                            cache_hit=data["cached"],
+                        )
+                yield _format_sse(event, data)
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band.
+            outcome = "error"
+            print(f"An unexpected error occurred while streaming: {e}")
+            yield _format_sse("error", {"stage": "stream", "index": None, "detail": "An internal server error occurred."})
+        finally:
+            metrics.request_duration.observe(
+                time.perf_counter() - started,
+                endpoint="generate_ad_content_stream",
+                mode="stream",
+                variations=num_to_generate,
+                cache_hit=cache_hit,
+                outcome=outcome,
+            )
 
-    # except ValueError as ve: # customer_type is no longer validated here directly
-    #     raise HTTPException(status_code=400, detail=str(ve))
-    except Exception as e:
-        # Log the exception for debugging
-        print(f"An unexpected error occurred: {e}")
-        raise HTTPException(status_code=500, detail="An internal server error occurred.")
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
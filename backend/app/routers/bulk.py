@@ -0,0 +1,106 @@
+from fastapi import APIRouter, HTTPException, Query
+from app.models.ad_models import BulkJobRequest, BulkJobResultsPage, BulkJobStatus
+from app.services import bulk_jobs
+from app.services.bulk_jobs import bulk_job_runner
+from typing import List, Optional
+import asyncio
+
+router = APIRouter()
+
+# Upper bound on the number of generation requests in a single bulk job
+MAX_BULK_JOB_ITEMS = 5000
+
+async def _get_job_or_404(job_id: str) -> dict:
+    job = await asyncio.to_thread(bulk_job_runner.store.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Bulk job not found.")
+    return job
+
+@router.post("/bulk-jobs", response_model=BulkJobStatus, status_code=202)
+async def create_bulk_job(request: BulkJobRequest):
+    """
+    Submits a bulk generation job: either an explicit list of requests, or a product
+    list crossed with the persona segments from BigQuery. Returns immediately; the
+    job is processed in the background at bulk priority.
+    """
+    if request.requests:
+        items = [item.model_dump() for item in request.requests]
+    elif request.products:
+        options = {
+            "number_of_variations": request.number_of_variations,
+            "generation_mode": request.generation_mode,
+        }
+        items = await bulk_jobs.build_campaign_requests(
+            [product.model_dump() for product in request.products],
+            options,
+            persona_limit=request.persona_limit,
+        )
+        if items is None:
+            raise HTTPException(status_code=500, detail="Failed to retrieve persona data from BigQuery. Check server logs for details.")
+    else:
+        raise HTTPException(status_code=400, detail="Provide either 'requests' or 'products'.")
+
+    if not items:
+        raise HTTPException(status_code=400, detail="The bulk job contains no requests.")
+    if len(items) > MAX_BULK_JOB_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A bulk job may contain at most {MAX_BULK_JOB_ITEMS} requests.")
+    for item in items:
+        if item.get("number_of_variations") is None:
+            item["number_of_variations"] = 1
+        if not (1 <= item["number_of_variations"] <= 4):
+            raise HTTPException(status_code=400, detail="Number of variations must be between 1 and 4.")
+
+    job_id = await bulk_job_runner.submit(items)
+    return await _get_job_or_404(job_id)
+
+@router.get("/bulk-jobs", response_model=List[BulkJobStatus])
+async def list_bulk_jobs(limit: int = Query(50, ge=1, le=500)):
+    """
+    Lists the most recent bulk jobs.
+    """
+    job_ids = await asyncio.to_thread(bulk_job_runner.store.list_job_ids, limit)
+    return [await _get_job_or_404(job_id) for job_id in job_ids]
+
+@router.get("/bulk-jobs/{job_id}", response_model=BulkJobStatus)
+async def get_bulk_job(job_id: str):
+    """
+    Returns the status and progress counters of a bulk job.
+    """
+    return await _get_job_or_404(job_id)
+
+@router.get("/bulk-jobs/{job_id}/results", response_model=BulkJobResultsPage)
+async def get_bulk_job_results(
+    job_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    status: Optional[str] = Query(None, description="Only return items with this status."),
+):
+    """
+    Pages through the items of a bulk job, with their generated creatives or errors.
+    """
+    job = await _get_job_or_404(job_id)
+    items = await asyncio.to_thread(bulk_job_runner.store.get_items, job_id, offset, limit, status)
+    return {"job": job, "offset": offset, "limit": limit, "items": items}
+
+@router.post("/bulk-jobs/{job_id}/resume", response_model=BulkJobStatus)
+async def resume_bulk_job(job_id: str):
+    """
+    Resumes a job: interrupted and failed items are queued again. Jobs left
+    unfinished by a restart are also resumed automatically at startup. Returns 409
+    if another worker process is running the job.
+    """
+    status = await bulk_job_runner.resume(job_id)
+    if status == "not_found":
+        raise HTTPException(status_code=404, detail="Bulk job not found.")
+    if status == "leased":
+        raise HTTPException(status_code=409, detail="Bulk job is being run by another worker; try again once it finishes.")
+    return await _get_job_or_404(job_id)
+
+@router.post("/bulk-jobs/{job_id}/cancel", response_model=BulkJobStatus)
+async def cancel_bulk_job(job_id: str):
+    """
+    Cancels a job. Finished items keep their results; the job can be resumed later.
+    """
+    if not await bulk_job_runner.cancel(job_id):
+        raise HTTPException(status_code=404, detail="Bulk job not found.")
+    return await _get_job_or_404(job_id)
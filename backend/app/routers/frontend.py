@@ -0,0 +1,46 @@
+from fastapi import APIRouter, HTTPException, Request, Response
+from app.services.static_assets import StaticAsset, choose_encoding, static_assets
+
+router = APIRouter()
+
+def _etag_matches(if_none_match: str, etags: list[str]) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")]
+    return any(candidate in etags for candidate in candidates)
+
+def _asset_response(asset: StaticAsset, request: Request) -> Response:
+    """Serves an in-memory asset in the best encoding the client accepts, or 304 if it already has it."""
+    encoding = choose_encoding(asset, request.headers.get("accept-encoding"))
+    headers = {
+        "ETag": asset.etag(encoding),
+        "Cache-Control": asset.cache_control,
+        "Vary": "Accept-Encoding",
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, asset.etags()):
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=asset.variants[encoding], media_type=asset.content_type, headers=headers)
+
+@router.get("/", include_in_schema=False)
+async def root(request: Request):
+    """
+    Serve the index.html for the root path.
+    """
+    return _asset_response(static_assets.index, request)
+
+@router.get("/{catchall:path}", include_in_schema=False)
+async def serve_react_app(request: Request, catchall: str):
+    """
+    Serve a file from the React build (held in memory, see app/services/static_assets.py),
+    or the index.html for any other path not caught by API routes, so React Router
+    can handle client-side routing. Missing hashed bundles under /static are a 404.
+    """
+    asset = static_assets.get(catchall)
+    if asset is not None:
+        return _asset_response(asset, request)
+    if catchall.startswith("static/"):
+        raise HTTPException(status_code=404, detail="Not found.")
+    return _asset_response(static_assets.index, request)
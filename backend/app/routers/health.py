@@ -0,0 +1,26 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.services import clients
+
+router = APIRouter()
+
+# Set by app.main once the application module has finished importing.
+startup_timing = {"import_seconds": None}
+
+@router.get("/healthz", tags=["Health"])
+async def liveness():
+    """
+    Liveness probe: the process is up and serving requests.
+    """
+    return {"status": "ok"}
+
+@router.get("/readyz", tags=["Health"])
+async def readiness():
+    """
+    Readiness probe: reports whether the shared Vertex AI / BigQuery / Cloud Logging
+    handles have been created, plus cold-start timings. Returns 503 until warm-up
+    has finished or if a handle failed to initialize.
+    """
+    report = clients.readiness()
+    report["import_seconds"] = startup_timing["import_seconds"]
+    return JSONResponse(status_code=200 if report["ready"] else 503, content=report)
@@ -0,0 +1,48 @@
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from typing import Literal
+from app.services import image_renditions
+from app.services.image_store import is_valid_digest
+
+router = APIRouter()
+
+# Images are content-addressed, so a URL always refers to the same bytes and can be cached forever.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+@router.get("/images/{digest}", tags=["Images"])
+async def get_image(
+    digest: str,
+    request: Request,
+    rendition: Literal["original", "preview", "thumbnail"] = Query("original", description="original (full resolution, as generated), preview or thumbnail."),
+):
+    """
+    Serves a generated image from the image store by its SHA-256 digest.
+    The preview and thumbnail renditions are downscaled and encoded as WebP when the
+    Accept header allows it (PNG otherwise); they are built once and cached.
+    Supports conditional requests (ETag / If-None-Match -> 304).
+    """
+    if not is_valid_digest(digest):
+        raise HTTPException(status_code=404, detail="Image not found.")
+
+    if rendition == "original":
+        etag = f'"{digest}"'
+        headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+        image_format = None
+    else:
+        image_format = image_renditions.negotiate_format(request.headers.get("accept"))
+        etag = f'"{digest}-{rendition}-{image_format}"'
+        headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL, "Vary": "Accept"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    stored = await image_renditions.get_rendition(digest, rendition, image_format)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Image not found.")
+    data, content_type = stored
+    return Response(content=data, media_type=content_type, headers=headers)
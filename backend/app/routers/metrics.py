@@ -0,0 +1,32 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.services import metrics, upstream_scheduler
+from app.services.audit_log import audit_logger
+from app.services.bulk_jobs import bulk_job_runner
+from app.services.persona_catalog import persona_catalog
+from app.services.pregeneration import pregenerator
+from app.services.result_cache import result_cache
+from app.services.shared_cache import shared_cache
+from app.services.single_flight import generation_flights
+
+router = APIRouter()
+
+# The counters behind /api/v1/stats, exported as gauges.
+metrics.registry.add_collector(metrics.stats_collector("result_cache", result_cache.stats))
+metrics.registry.add_collector(metrics.stats_collector("single_flight", generation_flights.stats))
+metrics.registry.add_collector(metrics.stats_collector("upstream", upstream_scheduler.stats))
+metrics.registry.add_collector(metrics.stats_collector("bulk_jobs", bulk_job_runner.stats))
+metrics.registry.add_collector(metrics.stats_collector("persona_catalog", persona_catalog.stats))
+metrics.registry.add_collector(metrics.stats_collector("audit_log", audit_logger.stats))
+metrics.registry.add_collector(metrics.stats_collector("pregeneration", pregenerator.stats))
+metrics.registry.add_collector(metrics.stats_collector("shared_cache", shared_cache.stats))
+
+@router.get("/metrics", tags=["Metrics"], response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Prometheus text exposition of the per-stage latency histograms
+    (ad_generator_stage_duration_seconds: prompt building, prompt logging, upstream
+    queueing, Gemini, Imagen, image store, serialization, BigQuery, ...), the
+    end-to-end request histogram and the /api/v1/stats counters. Per worker process.
+    """
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
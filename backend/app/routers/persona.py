@@ -1,19 +1,30 @@
-from fastapi import APIRouter, HTTPException
-from app.services import bigquery_service
+from fastapi import APIRouter, HTTPException, Query, Response
+from app.services.persona_catalog import persona_catalog
+from typing import Optional
 
 router = APIRouter()
 
 @router.get("/persona-segments", tags=["Persona"])
-async def get_persona_segments():
+async def get_persona_segments(
+    response: Response,
+    q: Optional[str] = Query(None, description="Keyword search over persona_segment_description (all words must match, as word prefixes)."),
+    age_group: Optional[str] = Query(None, description="Only return rows with this persona_age_group_profile."),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+):
     """
-    Retrieves persona segment data from BigQuery.
+    Retrieves persona segment data from the in-memory persona catalog (loaded from
+    BigQuery and refreshed in the background), as a dictionary of column lists.
+    The total number of matching rows is returned in the X-Total-Count header.
     """
     try:
-        data = bigquery_service.get_persona_data()
-        if data is None:
+        result = await persona_catalog.query(q=q, age_group=age_group, offset=offset, limit=limit)
+        if result is None:
             # This could be due to missing env vars or a query error.
             # The service function already prints a more specific error.
             raise HTTPException(status_code=500, detail="Failed to retrieve persona data from BigQuery. Check server logs for details.")
+        data, total = result
+        response.headers["X-Total-Count"] = str(total)
         return data
     except Exception as e:
         # Catch any other unexpected errors
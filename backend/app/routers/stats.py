@@ -0,0 +1,36 @@
+import os
+from fastapi import APIRouter
+from app.services import upstream_scheduler
+from app.services.audit_log import audit_logger
+from app.services.bulk_jobs import bulk_job_runner
+from app.services.image_store import image_store
+from app.services.persona_catalog import persona_catalog
+from app.services.pregeneration import pregenerator
+from app.services.result_cache import result_cache
+from app.services.shared_cache import shared_cache
+from app.services.single_flight import generation_flights
+from app.services.static_assets import static_assets
+
+router = APIRouter()
+
+@router.get("/stats", tags=["Stats"])
+async def get_stats():
+    """
+    Returns in-process counters for the generation pipeline: result cache hits/misses
+    and request coalescing ("coalesced" is the number of upstream generations saved),
+    plus the upstream scheduler lanes (queue depth, wait times, quota retries).
+    Counters are per worker process (see "worker_pid") and reset on restart.
+    """
+    return {
+        "worker_pid": os.getpid(),
+        "result_cache": result_cache.stats(),
+        "single_flight": generation_flights.stats(),
+        "upstream": upstream_scheduler.stats(),
+        "bulk_jobs": bulk_job_runner.stats(),
+        "persona_catalog": persona_catalog.stats(),
+        "audit_log": audit_logger.stats(),
+        "static_assets": static_assets.stats(),
+        "image_store": image_store.stats(),
+        "pregeneration": pregenerator.stats(),
+        "shared_cache": shared_cache.stats(),
+    }
@@ -0,0 +1,369 @@
+import asyncio
+import os
+import random
+import time
+from typing import Optional
+from app.services import metrics, prompt_service, vertex_ai_service
+from app.services.image_store import image_store
+from app.services.result_cache import make_cache_key, result_cache
+from app.services.single_flight import generation_flights
+from app.services.vertex_ai_service import GenerationError, is_generation_error
+
+# Per-variation mode: cap on concurrent upstream calls it issues (per process),
+# and retry policy for variations whose text or image failed.
+PER_VARIATION_CONCURRENCY = int(os.getenv("PER_VARIATION_CONCURRENCY", "4"))
+VARIATION_MAX_ATTEMPTS = int(os.getenv("VARIATION_MAX_ATTEMPTS", "3"))
+VARIATION_RETRY_BACKOFF_SECONDS = float(os.getenv("VARIATION_RETRY_BACKOFF_SECONDS", "1.0"))
+
+_variation_slots = asyncio.Semaphore(PER_VARIATION_CONCURRENCY)
+
+
+class AdGenerationError(Exception):
+    """Raised when the generated texts or images are missing or contain error messages."""
+
+
+def check_ad_texts(ad_texts: list[str], num_to_generate: int) -> None:
+    """Raises AdGenerationError if any of the generated ad texts is missing or failed (GenerationError)."""
+    # Basic error check for the list of texts
+    if not ad_texts or len(ad_texts) < num_to_generate or any(is_generation_error(text) for text in ad_texts):
+        # Consolidate error reporting if texts are missing or contain errors
+        error_detail = "Failed to generate one or more ad texts."
+        if ad_texts: # Some texts might exist, log them or provide more specific errors
+            for i, text in enumerate(ad_texts):
+                if is_generation_error(text):
+                    error_detail += f" Text {i+1}: {text}"
+        raise AdGenerationError(error_detail)
+
+
+def check_ad_images(ad_image_data_list: list[str], num_to_generate: int) -> None:
+    """Raises AdGenerationError if any of the generated ad images is missing or failed (GenerationError)."""
+    # Basic error check for the list of images
+    if not ad_image_data_list or len(ad_image_data_list) < num_to_generate or any(is_generation_error(img_data) for img_data in ad_image_data_list):
+        error_detail = "Failed to generate one or more ad images."
+        if ad_image_data_list:
+             for i, img_data in enumerate(ad_image_data_list):
+                if is_generation_error(img_data):
+                    error_detail += f" Image {i+1} generation failed."
+        raise AdGenerationError(error_detail)
+
+
+async def _cache_creatives(cache_key: str, creatives: list[dict], value=None) -> bool:
+    """
+    Stores creatives (or value, if given) in the result cache, but only if they pass
+    the same checks that turn a generation into a 500: failed texts or images
+    (GenerationError) are never cached. Returns whether the entry was stored.
+    """
+    try:
+        check_ad_texts([creative["ad_text"] for creative in creatives], len(creatives))
+        check_ad_images([creative["ad_image_data"] for creative in creatives], len(creatives))
+    except AdGenerationError as e:
+        print(f"Warning: not caching failed generation: {e}")
+        return False
+    await result_cache.set(cache_key, creatives if value is None else value)
+    return True
+
+
+async def get_cached_creatives(cache_key: str):
+    """
+    Looks up cache_key in the result cache (and records the lookup). A hit touches
+    its images so the image store does not evict them; an entry whose images were
+    already evicted is dropped and reported as a miss, so it gets regenerated.
+    """
+    cached = await result_cache.get(cache_key)
+    if cached is not None:
+        creatives = cached if isinstance(cached, list) else [cached]
+        if not await asyncio.to_thread(image_store.touch, [creative["ad_image_data"] for creative in creatives]):
+            print(f"Warning: dropping cached creatives {cache_key[:12]} whose images were evicted")
+            await result_cache.delete(cache_key)
+            cached = None
+    metrics.record_cache_lookup(cached is not None)
+    return cached
+
+
+def build_prompts(product: str, product_description: str, persona_description: Optional[str], num_to_generate: int, variation_index: Optional[int] = None) -> tuple[str, str]:
+    """Returns the (Gemini prompt, Imagen prompt) pair for a request."""
+    with metrics.span("prompt_build", variations=num_to_generate):
+        gemini_prompt_text = prompt_service.get_gemini_prompt(
+            product,
+            product_description,
+            persona_description=persona_description,
+            number_of_variations=num_to_generate,
+            variation_index=variation_index
+        )
+        imagen_prompt_text = prompt_service.get_imagen_prompt(
+            product,
+            product_description,
+            persona_description=persona_description,
+            number_of_variations=num_to_generate,
+            variation_index=variation_index
+        )
+    return gemini_prompt_text, imagen_prompt_text
+
+
+def creative_cache_key(gemini_prompt_text: str, imagen_prompt_text: str, num_to_generate: int) -> str:
+    """Cache key for a set of creatives: final prompts, model names, generation config and variation count."""
+    return make_cache_key(
+        gemini_prompt=gemini_prompt_text,
+        imagen_prompt=imagen_prompt_text,
+        gemini_model=vertex_ai_service.GEMINI_MODEL_NAME,
+        imagen_model=vertex_ai_service.IMAGEN_MODEL_NAME,
+        generation_config=vertex_ai_service.generation_config,
+        number_of_variations=num_to_generate,
+    )
+
+
+async def _generate_uncached(gemini_prompt_text: str, imagen_prompt_text: str, num_to_generate: int) -> list[dict]:
+    # Start text (Gemini) and image (Imagen) generation concurrently, so the
+    # request takes as long as the slower of the two instead of their sum.
+    image_task = asyncio.create_task(
+        vertex_ai_service.generate_ad_image_with_imagen_async(
+            imagen_prompt_text,
+            number_of_images=num_to_generate
+        )
+    )
+    try:
+        ad_texts = await vertex_ai_service.generate_ad_text_with_gemini_async(gemini_prompt_text, num_variations=num_to_generate)
+        check_ad_texts(ad_texts, num_to_generate)
+    except BaseException:
+        # Text generation failed hard (or the request was cancelled): abandon the
+        # image job. If it is still queued in the Imagen lane it never reaches Imagen;
+        # a call that has already started runs to completion (the Imagen SDK call
+        # cannot be interrupted) and keeps its lane slot until it returns.
+        image_task.cancel()
+        raise
+
+    ad_image_data_list = await image_task
+    check_ad_images(ad_image_data_list, num_to_generate)
+
+    # Pair texts and images into creatives
+    creatives = []
+    for i in range(num_to_generate):
+        # Ensure we have both text and image for each creative
+        if i < len(ad_texts) and i < len(ad_image_data_list):
+            creatives.append({"ad_text": ad_texts[i], "ad_image_data": ad_image_data_list[i]})
+        else:
+            # This case should ideally be caught by earlier checks, but as a safeguard:
+            raise AdGenerationError(f"Mismatch in generated texts and images count for creative {i+1}.")
+    return creatives
+
+
+async def generate_creatives(product: str, product_description: str, persona_description: Optional[str], num_to_generate: int, bypass_cache: bool = False) -> list[dict]:
+    """
+    Generates num_to_generate creatives ({"ad_text", "ad_image_data"} dicts).
+    Results are served from / stored in the result cache unless bypass_cache is
+    set, in which case fresh creatives are generated (and replace the cached ones).
+    Only successful generations are cached. Concurrent requests for the same key
+    share one upstream generation (and its result or error).
+    """
+    gemini_prompt_text, imagen_prompt_text = build_prompts(product, product_description, persona_description, num_to_generate)
+    cache_key = creative_cache_key(gemini_prompt_text, imagen_prompt_text, num_to_generate)
+
+    if not bypass_cache:
+        cached = await get_cached_creatives(cache_key)
+        if cached is not None:
+            return cached
+
+    async def generate_and_cache():
+        creatives = await _generate_uncached(gemini_prompt_text, imagen_prompt_text, num_to_generate)
+        await _cache_creatives(cache_key, creatives)
+        return creatives
+
+    return await generation_flights.do(cache_key, generate_and_cache)
+
+
+async def stream_creatives(product: str, product_description: str, persona_description: Optional[str], num_to_generate: int, bypass_cache: bool = False):
+    """
+    Async generator of (event, data) tuples for the streaming endpoint:
+
+    - ("text_delta", {"text"}): Gemini output as it arrives
+    - ("text", {"index", "ad_text"}): one parsed ad text per variation
+    - ("image", {"index", "ad_image_data"}): each image as soon as Imagen returns it
+    - ("error", {"stage", "index", "detail"}): a text or image that failed
+    - ("summary", {"creatives", "errors", "cached", "elapsed_seconds"}): always last
+
+    All images come from one Imagen request (one call against the Imagen quota, as
+    in batched mode), and each is emitted as soon as it is stored. Fully successful results are stored in the result cache, and cache hits are
+    replayed as text/image events.
+    """
+    started = time.perf_counter()
+    gemini_prompt_text, imagen_prompt_text = build_prompts(product, product_description, persona_description, num_to_generate)
+    cache_key = creative_cache_key(gemini_prompt_text, imagen_prompt_text, num_to_generate)
+
+    if not bypass_cache:
+        cached = await get_cached_creatives(cache_key)
+        if cached is not None:
+            for i, creative in enumerate(cached):
+                yield "text", {"index": i, "ad_text": creative["ad_text"]}
+            for i, creative in enumerate(cached):
+                yield "image", {"index": i, "ad_image_data": creative["ad_image_data"]}
+            yield "summary", {"creatives": len(cached), "errors": 0, "cached": True, "elapsed_seconds": time.perf_counter() - started}
+            return
+
+    events: asyncio.Queue = asyncio.Queue()
+    ad_texts: dict[int, str] = {}
+    ad_images: dict[int, str] = {}
+
+    async def produce_texts():
+        chunks = []
+        try:
+            async for delta in vertex_ai_service.stream_ad_text_with_gemini_async(gemini_prompt_text):
+                chunks.append(delta)
+                await events.put(("text_delta", {"text": delta}))
+            texts = vertex_ai_service.ad_texts_from_raw_text("".join(chunks), num_to_generate)
+        except Exception as e:
+            print(f"Error streaming from Gemini API: {e}")
+            texts = [GenerationError(f"Error generating ad text: {e}") for _ in range(num_to_generate)]
+        for i in range(num_to_generate):
+            text = texts[i] if i < len(texts) else GenerationError("Error: Ad text not generated for this item.")
+            if is_generation_error(text):
+                await events.put(("error", {"stage": "text", "index": i, "detail": text}))
+            else:
+                ad_texts[i] = text
+                await events.put(("text", {"index": i, "ad_text": text}))
+
+    async def produce_images():
+        async for index, image in vertex_ai_service.stream_ad_images_with_imagen_async(imagen_prompt_text, number_of_images=num_to_generate):
+            if is_generation_error(image):
+                await events.put(("error", {"stage": "image", "index": index, "detail": image}))
+            else:
+                ad_images[index] = image
+                await events.put(("image", {"index": index, "ad_image_data": image}))
+
+    producers = [asyncio.create_task(produce_texts()), asyncio.create_task(produce_images())]
+    pending = set(producers)
+    getter = None
+    try:
+        while True:
+            while not events.empty():
+                yield events.get_nowait()
+            if not pending:
+                break
+            getter = asyncio.ensure_future(events.get())
+            done, _ = await asyncio.wait(pending | {getter}, return_when=asyncio.FIRST_COMPLETED)
+            pending -= done
+            for task in done:
+                if task is not getter and task.exception() is not None:
+                    print(f"Error in streaming generation task: {task.exception()}")
+            if getter in done:
+                yield getter.result()
+            else:
+                getter.cancel()
+    finally:
+        # The client went away (or we are done): stop any work still in flight,
+        # including the pending queue read, and wait for the tasks to finish.
+        tasks = producers if getter is None else [*producers, getter]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    errors = (num_to_generate - len(ad_texts)) + (num_to_generate - len(ad_images))
+    if errors == 0:
+        await _cache_creatives(cache_key, [
+            {"ad_text": ad_texts[i], "ad_image_data": ad_images[i]} for i in range(num_to_generate)
+        ])
+    yield "summary", {
+        "creatives": len(set(ad_texts) & set(ad_images)),
+        "errors": errors,
+        "cached": False,
+        "elapsed_seconds": time.perf_counter() - started,
+    }
+
+
+async def _call_with_slot(coro_function, *args, **kwargs):
+    async with _variation_slots:
+        return await coro_function(*args, **kwargs)
+
+
+async def _generate_variation(index: int, gemini_prompt_text: str, imagen_prompt_text: str) -> dict:
+    """
+    Generates one variation (one text + one image), retrying only the part that
+    failed with exponential backoff and jitter. Returns a status dict with the
+    creative on success or the last error on failure.
+    """
+    ad_text, ad_image_data = None, None
+    last_error = None
+    attempt = 0
+    for attempt in range(1, VARIATION_MAX_ATTEMPTS + 1):
+        jobs = {}
+        if ad_text is None:
+            jobs["text"] = _call_with_slot(vertex_ai_service.generate_ad_text_with_gemini_async, gemini_prompt_text, num_variations=1)
+        if ad_image_data is None:
+            jobs["image"] = _call_with_slot(vertex_ai_service.generate_ad_image_with_imagen_async, imagen_prompt_text, number_of_images=1)
+        results = dict(zip(jobs, await asyncio.gather(*jobs.values())))
+
+        if "text" in results:
+            texts = results["text"]
+            if texts and not is_generation_error(texts[0]):
+                ad_text = texts[0]
+            else:
+                last_error = texts[0] if texts else "Error: No ad text returned."
+        if "image" in results:
+            images = results["image"]
+            if images and not is_generation_error(images[0]):
+                ad_image_data = images[0]
+            else:
+                last_error = images[0] if images else "Error: No image returned."
+
+        if ad_text is not None and ad_image_data is not None:
+            return {
+                "index": index,
+                "status": "ok",
+                "attempts": attempt,
+                "creative": {"ad_text": ad_text, "ad_image_data": ad_image_data, "variation_index": index},
+            }
+        if attempt < VARIATION_MAX_ATTEMPTS:
+            delay = VARIATION_RETRY_BACKOFF_SECONDS * (2 ** (attempt - 1))
+            await asyncio.sleep(delay + random.uniform(0, delay))
+
+    print(f"Variation {index+1} failed after {attempt} attempts: {last_error}")
+    return {"index": index, "status": "failed", "attempts": attempt, "error": last_error}
+
+
+async def _get_or_generate_variation(index: int, product: str, product_description: str, persona_description: Optional[str], bypass_cache: bool) -> dict:
+    gemini_prompt_text, imagen_prompt_text = build_prompts(product, product_description, persona_description, 1, variation_index=index)
+    cache_key = creative_cache_key(gemini_prompt_text, imagen_prompt_text, 1)
+
+    if not bypass_cache:
+        cached = await get_cached_creatives(cache_key)
+        if cached is not None:
+            return {"index": index, "status": "ok", "attempts": 0, "cached": True, "creative": cached}
+
+    async def generate_and_cache():
+        result = await _generate_variation(index, gemini_prompt_text, imagen_prompt_text)
+        if result["status"] == "ok":
+            await _cache_creatives(cache_key, [result["creative"]], value=result["creative"])
+        return result
+
+    return await generation_flights.do(cache_key, generate_and_cache)
+
+
+async def generate_creatives_per_variation(product: str, product_description: str, persona_description: Optional[str], num_to_generate: int, bypass_cache: bool = False) -> tuple[list[dict], list[dict]]:
+    """
+    Per-variation mode: each variation is generated by its own Gemini and Imagen
+    calls, in parallel under PER_VARIATION_CONCURRENCY. Only failed parts are
+    retried, and each successful variation is cached on its own, so a later
+    request only regenerates what is missing.
+
+    Returns (creatives for the variations that succeeded, per-variation statuses).
+    Raises AdGenerationError only if every variation failed.
+    """
+    results = await asyncio.gather(*[
+        _get_or_generate_variation(i, product, product_description, persona_description, bypass_cache)
+        for i in range(num_to_generate)
+    ])
+    creatives = [result["creative"] for result in results if result["status"] == "ok"]
+    statuses = [
+        {
+            "index": result["index"],
+            "status": result["status"],
+            "attempts": result["attempts"],
+            "cached": result.get("cached", False),
+            "error": result.get("error"),
+        }
+        for result in results
+    ]
+    if not creatives:
+        raise AdGenerationError("Failed to generate any ad variation. " + " ".join(
+            f"Variation {status['index']+1}: {status['error']}" for status in statuses
+        ))
+    return creatives, statuses
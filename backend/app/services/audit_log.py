@@ -0,0 +1,244 @@
+import asyncio
+import json
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+from app.services import clients, metrics
+
+# Prompt/response audit logging off the request path. Records go into a bounded
+# in-process queue; a background thread drains it in batches and writes them to
+# the configured sink, so generation latency does not depend on Cloud Logging.
+AUDIT_LOG_SINK = os.getenv("AUDIT_LOG_SINK", "cloud_logging")  # cloud_logging | jsonl | stdout | none
+AUDIT_LOG_FILE = os.getenv("AUDIT_LOG_FILE") or os.path.join(tempfile.gettempdir(), "ad-generator", "audit_log.jsonl")
+AUDIT_LOG_QUEUE_SIZE = int(os.getenv("AUDIT_LOG_QUEUE_SIZE", "10000"))
+AUDIT_LOG_BATCH_SIZE = int(os.getenv("AUDIT_LOG_BATCH_SIZE", "100"))
+AUDIT_LOG_FLUSH_SECONDS = float(os.getenv("AUDIT_LOG_FLUSH_SECONDS", "2.0"))
+# When the queue is full: "drop" the new record (requests never wait), or "block"
+# the caller for up to AUDIT_LOG_BLOCK_TIMEOUT_SECONDS and drop it after that.
+AUDIT_LOG_POLICY = os.getenv("AUDIT_LOG_POLICY", "drop")
+AUDIT_LOG_BLOCK_TIMEOUT_SECONDS = float(os.getenv("AUDIT_LOG_BLOCK_TIMEOUT_SECONDS", "1.0"))
+
+
+# Sinks: write_batch() receives a list of record dicts and may raise.
+
+class CloudLoggingSink:
+    """Writes structured entries to the prompt log in Cloud Logging, one API call per batch."""
+
+    def write_batch(self, records: list[dict]) -> None:
+        logger = clients.get_prompt_logger()
+        if not hasattr(logger, "batch"):
+            for record in records:
+                logger.log_struct(record)
+            return
+        batch = logger.batch()
+        for record in records:
+            batch.log_struct(record)
+        batch.commit()
+
+    def close(self) -> None:
+        pass
+
+
+class JsonlFileSink:
+    """
+    Appends one JSON object per line to a local file. Each batch is a single
+    unbuffered append, so several worker processes can share the file without
+    interleaving lines.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "ab", buffering=0)
+
+    def write_batch(self, records: list[dict]) -> None:
+        self._file.write("".join(json.dumps(record, default=str) + "\n" for record in records).encode("utf-8"))
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class StdoutSink:
+    def write_batch(self, records: list[dict]) -> None:
+        sys.stdout.write("".join(json.dumps(record, default=str) + "\n" for record in records))
+        sys.stdout.flush()
+
+    def close(self) -> None:
+        pass
+
+
+class NullSink:
+    def write_batch(self, records: list[dict]) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def create_sink(name: str):
+    if name == "cloud_logging":
+        return CloudLoggingSink()
+    if name == "jsonl":
+        return JsonlFileSink(AUDIT_LOG_FILE)
+    if name == "stdout":
+        return StdoutSink()
+    if name == "none":
+        return NullSink()
+    raise ValueError(f"Unknown AUDIT_LOG_SINK: {name}")
+
+
+_STOP = object()
+
+
+class AuditLogger:
+    """
+    Bounded queue plus a background flusher thread. record() never does I/O;
+    the flusher writes a batch when batch_size records are queued or every
+    flush_seconds, and drains the queue on stop(). Sink errors are counted and
+    the batch is dropped, so a logging outage cannot affect ad generation.
+    """
+
+    def __init__(self, sink_factory, queue_size: int, batch_size: int, flush_seconds: float, policy: str = "drop", block_timeout_seconds: float = 1.0):
+        self._sink_factory = sink_factory
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_seconds
+        self.policy = policy
+        self.block_timeout_seconds = block_timeout_seconds
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        # Counters are updated from request threads, the event loop and the flusher thread.
+        self._counters_lock = threading.Lock()
+        self._counters = {"recorded": 0, "dropped": 0, "written": 0, "batches": 0, "write_errors": 0}
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="audit-log-flusher", daemon=True)
+                self._thread.start()
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._counters_lock:
+            self._counters[name] += amount
+
+    def _entry(self, event: str, fields: dict) -> dict:
+        return {"event": event, "timestamp": time.time(), **fields}
+
+    def _offer(self, entry: dict) -> bool:
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            return False
+        self._count("recorded")
+        return True
+
+    def _put_blocking(self, entry: dict) -> None:
+        try:
+            self._queue.put(entry, timeout=self.block_timeout_seconds)
+        except queue.Full:
+            self._count("dropped")
+            return
+        self._count("recorded")
+
+    def record(self, event: str, **fields) -> None:
+        """Queues an audit record. Under the "block" policy a full queue blocks the calling thread."""
+        entry = self._entry(event, fields)
+        if self._offer(entry):
+            return
+        if self.policy == "block":
+            self._put_blocking(entry)
+        else:
+            self._count("dropped")
+
+    async def record_async(self, event: str, **fields) -> None:
+        """Like record(), but a "block" wait happens in a worker thread instead of on the event loop."""
+        entry = self._entry(event, fields)
+        if self._offer(entry):
+            return
+        if self.policy == "block":
+            await asyncio.to_thread(self._put_blocking, entry)
+        else:
+            self._count("dropped")
+
+    def _write(self, sink, batch: list[dict]) -> None:
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            sink.write_batch(batch)
+            self._count("written", len(batch))
+        except Exception as e:
+            outcome = "error"
+            self._count("write_errors")
+            self._count("dropped", len(batch))
+            print(f"Warning: failed to write {len(batch)} audit log records: {e}")
+        self._count("batches")
+        metrics.observe_stage("audit_log_flush", time.perf_counter() - started, outcome=outcome)
+
+    def _run(self) -> None:
+        try:
+            sink = self._sink_factory()
+        except Exception as e:
+            print(f"Warning: audit log sink unavailable, records will be dropped: {e}")
+            sink = NullSink()
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                try:
+                    entry = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            if stopping:
+                # Drain whatever is left before exiting.
+                while True:
+                    try:
+                        entry = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if entry is not _STOP:
+                        batch.append(entry)
+            for start in range(0, len(batch), self.batch_size):
+                self._write(sink, batch[start:start + self.batch_size])
+        sink.close()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Flushes queued records and stops the flusher. Blocking; call from a worker thread."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        # The stop marker may wait for queue space; the flusher keeps draining meanwhile.
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        thread.join(timeout)
+        if thread.is_alive():
+            print("Warning: audit log flusher did not finish in time; some records may be lost.")
+        self._thread = None
+
+    def stats(self) -> dict:
+        with self._counters_lock:
+            stats = dict(self._counters)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["policy"] = self.policy
+        return stats
+
+
+audit_logger = AuditLogger(
+    lambda: create_sink(AUDIT_LOG_SINK),
+    queue_size=AUDIT_LOG_QUEUE_SIZE,
+    batch_size=AUDIT_LOG_BATCH_SIZE,
+    flush_seconds=AUDIT_LOG_FLUSH_SECONDS,
+    policy=AUDIT_LOG_POLICY,
+    block_timeout_seconds=AUDIT_LOG_BLOCK_TIMEOUT_SECONDS,
+)
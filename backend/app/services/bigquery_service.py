@@ -1,7 +1,16 @@
 import os
-from google.cloud import bigquery
+from typing import Optional
+from app.services import clients, executors, metrics
 
-def get_persona_data():
+def _persona_table():
+    """Returns (dataset_id, table_id) from the environment, or None if not configured."""
+    dataset_id = os.getenv("BIGQUERY_DATASET")
+    table_id = os.getenv("BIGQUERY_TABLE_PERSONA") # Using a more specific name for the table env var
+    if not dataset_id or not table_id:
+        return None
+    return dataset_id, table_id
+
+def get_persona_data(limit: Optional[int] = 30):
     """
     Fetches persona data from BigQuery.
 
@@ -9,42 +18,79 @@ def get_persona_data():
     - BIGQUERY_DATASET
     - BIGQUERY_TABLE_PERSONA
 
+    Args:
+        limit: Maximum number of rows to fetch, or None for the whole table.
+
     Returns:
         dict: A dictionary where keys are column names and values are lists of column values.
               Returns None if there's an error or if environment variables are not set.
     """
-    dataset_id = os.getenv("BIGQUERY_DATASET")
-    table_id = os.getenv("BIGQUERY_TABLE_PERSONA") # Using a more specific name for the table env var
-
-    if not dataset_id or not table_id:
+    table = _persona_table()
+    if table is None:
         print("Error: BIGQUERY_DATASET or BIGQUERY_TABLE_PERSONA environment variables not set.")
         # In a real application, you might raise an exception or handle this more gracefully.
         return None
+    dataset_id, table_id = table
 
-    client = bigquery.Client()
+    client = clients.get_bigquery_client()
 
     query = f"""
         SELECT persona_age_group_profile, persona_segment_description
         FROM `{client.project}.{dataset_id}.{table_id}`
-        LIMIT 30
+        {f"LIMIT {int(limit)}" if limit is not None else ""}
     """
 
+    with metrics.span("bigquery_query", model="bigquery") as span:
+        data = _run_persona_query(client, query)
+        if data is None:
+            span.outcome = "error"
+    return data
+
+def _run_persona_query(client, query: str):
+    """Runs the persona query and returns the rows as a dict of column lists (None on error)."""
     try:
         query_job = client.query(query)
         results = query_job.result()  # Waits for the job to complete.
 
-        # Convert results to a dictionary of lists
-        data = {}
+        # Convert results to a dictionary of lists (column names come from the schema,
+        # so each row only appends its values)
+        data = {field.name: [] for field in results.schema}
+        columns = list(data.values())
         for row in results:
-            for key, value in row.items():
-                if key not in data:
-                    data[key] = []
-                data[key].append(value)
+            for column, value in zip(columns, row.values()):
+                column.append(value)
         return data
     except Exception as e:
         print(f"An error occurred while querying BigQuery: {e}")
         return None
 
+def get_persona_table_modified():
+    """
+    Returns the last-modified time of the persona table (a cheap metadata call,
+    used as a change marker), or None if it cannot be determined.
+    """
+    table = _persona_table()
+    if table is None:
+        return None
+    dataset_id, table_id = table
+    try:
+        client = clients.get_bigquery_client()
+        return client.get_table(f"{client.project}.{dataset_id}.{table_id}").modified
+    except Exception as e:
+        print(f"An error occurred while reading BigQuery table metadata: {e}")
+        return None
+
+async def get_persona_data_async(limit: Optional[int] = 30):
+    """
+    Async variant of get_persona_data. The BigQuery client is blocking, so the
+    query runs on the bounded "bigquery" thread pool instead of the event loop.
+    """
+    return await executors.run_blocking("bigquery", get_persona_data, limit)
+
+async def get_persona_table_modified_async():
+    """Async variant of get_persona_table_modified (runs on the "bigquery" pool)."""
+    return await executors.run_blocking("bigquery", get_persona_table_modified)
+
 if __name__ == '__main__':
     # This is for local testing of the service, requires GOOGLE_APPLICATION_CREDENTIALS
     # and the necessary environment variables to be set.
@@ -0,0 +1,395 @@
+import asyncio
+import contextlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+from typing import Optional
+from app.services import ad_generation_service
+from app.services.image_store import FilesystemImageBackend, image_store
+from app.services.persona_catalog import persona_catalog
+from app.services.shared_cache import shared_cache
+from app.services.upstream_scheduler import PRIORITY_BULK, use_priority
+
+# Bulk campaign generation: jobs and their items are persisted in SQLite, so
+# progress and results survive a restart and interrupted jobs are resumed at
+# startup. The images of finished items are copied out of the (evicting) image
+# store into an archive next to the database, so the result URLs stay valid for
+# as long as the jobs are kept; their /api/v1/images/{digest} URLs are unchanged.
+BULK_JOBS_DB = os.getenv("BULK_JOBS_DB") or os.path.join(tempfile.gettempdir(), "ad-generator", "bulk_jobs.sqlite3")
+BULK_JOB_IMAGES_DIR = os.getenv("BULK_JOB_IMAGES_DIR") or os.path.join(os.path.dirname(os.path.abspath(BULK_JOBS_DB)), "bulk_job_images")
+# Items generated concurrently across all bulk jobs in this process.
+BULK_JOB_CONCURRENCY = int(os.getenv("BULK_JOB_CONCURRENCY", "2"))
+# With several worker processes (SHARED_CACHE_ENABLED=true), the worker running a
+# job holds a lease on it, renewed every third of this period. Unfinished jobs
+# whose lease has lapsed (their worker died) are picked up by another worker.
+BULK_JOB_LEASE_SECONDS = float(os.getenv("BULK_JOB_LEASE_SECONDS", "60"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bulk_jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bulk_job_items (
+    job_id TEXT NOT NULL,
+    item_index INTEGER NOT NULL,
+    request_json TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result_json TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, item_index)
+);
+CREATE INDEX IF NOT EXISTS bulk_job_items_status ON bulk_job_items (job_id, status);
+"""
+
+# Job statuses: queued -> running -> completed | completed_with_errors | cancelled
+# Item statuses: pending -> running -> succeeded | failed
+_FINISHED_JOB_STATUSES = ("completed", "completed_with_errors", "cancelled")
+
+
+class BulkJobStore:
+    """SQLite persistence for bulk jobs. Blocking; call through asyncio.to_thread."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _connection(self):
+        """A short-lived autocommit connection (cheap for SQLite, and safe across threads)."""
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def create_job(self, requests: list[dict], job_id: Optional[str] = None) -> str:
+        job_id = job_id or uuid.uuid4().hex
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO bulk_jobs (id, status, total, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, len(requests), now, now),
+            )
+            conn.executemany(
+                "INSERT INTO bulk_job_items (job_id, item_index, request_json, status, updated_at) VALUES (?, ?, ?, 'pending', ?)",
+                [(job_id, i, json.dumps(request), now) for i, request in enumerate(requests)],
+            )
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        with self._connection() as conn:
+            job = conn.execute("SELECT * FROM bulk_jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = dict(conn.execute(
+                "SELECT status, COUNT(*) FROM bulk_job_items WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+        return {
+            "job_id": job["id"],
+            "status": job["status"],
+            "total": job["total"],
+            "pending": counts.get("pending", 0),
+            "running": counts.get("running", 0),
+            "succeeded": counts.get("succeeded", 0),
+            "failed": counts.get("failed", 0),
+            "created_at": job["created_at"],
+            "updated_at": job["updated_at"],
+        }
+
+    def list_job_ids(self, limit: int = 50) -> list[str]:
+        with self._connection() as conn:
+            rows = conn.execute("SELECT id FROM bulk_jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [row["id"] for row in rows]
+
+    def unfinished_job_ids(self) -> list[str]:
+        with self._connection() as conn:
+            rows = conn.execute(
+                f"SELECT id FROM bulk_jobs WHERE status NOT IN ({','.join('?' * len(_FINISHED_JOB_STATUSES))}) ORDER BY created_at",
+                _FINISHED_JOB_STATUSES,
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def set_job_status(self, job_id: str, status: str) -> None:
+        with self._connection() as conn:
+            conn.execute("UPDATE bulk_jobs SET status = ?, updated_at = ? WHERE id = ?", (status, time.time(), job_id))
+
+    def complete_job(self, job_id: str) -> None:
+        """Marks a running job completed (or completed_with_errors); leaves it alone if it was cancelled meanwhile."""
+        with self._transaction() as conn:
+            failed = conn.execute("SELECT COUNT(*) FROM bulk_job_items WHERE job_id = ? AND status = 'failed'", (job_id,)).fetchone()[0]
+            conn.execute(
+                "UPDATE bulk_jobs SET status = ?, updated_at = ? WHERE id = ? AND status = 'running'",
+                ("completed_with_errors" if failed else "completed", time.time(), job_id),
+            )
+
+    def requeue_items(self, job_id: str, include_failed: bool = False) -> None:
+        """Puts interrupted (and optionally failed) items back to pending."""
+        statuses = ("running", "failed") if include_failed else ("running",)
+        with self._connection() as conn:
+            conn.execute(
+                f"UPDATE bulk_job_items SET status = 'pending', updated_at = ? WHERE job_id = ? AND status IN ({','.join('?' * len(statuses))})",
+                (time.time(), job_id, *statuses),
+            )
+
+    def claim_next_item(self, job_id: str) -> Optional[tuple[int, dict]]:
+        """
+        Atomically marks the next pending item as running and returns (index, request).
+        None when no item is pending or the job was cancelled (possibly by another worker).
+        """
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT item_index, request_json FROM bulk_job_items WHERE job_id = ? AND status = 'pending'"
+                " AND EXISTS (SELECT 1 FROM bulk_jobs WHERE id = ? AND status != 'cancelled') ORDER BY item_index LIMIT 1",
+                (job_id, job_id),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE bulk_job_items SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE job_id = ? AND item_index = ?",
+                (time.time(), job_id, row["item_index"]),
+            )
+        return row["item_index"], json.loads(row["request_json"])
+
+    def finish_item(self, job_id: str, item_index: int, result: Optional[dict], error: Optional[str]) -> None:
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE bulk_job_items SET status = ?, result_json = ?, error = ?, updated_at = ? WHERE job_id = ? AND item_index = ?",
+                ("failed" if error else "succeeded", json.dumps(result) if result is not None else None, error, now, job_id, item_index),
+            )
+            conn.execute("UPDATE bulk_jobs SET updated_at = ? WHERE id = ?", (now, job_id))
+
+    def get_items(self, job_id: str, offset: int, limit: int, status: Optional[str] = None) -> list[dict]:
+        query = "SELECT * FROM bulk_job_items WHERE job_id = ?"
+        params: list = [job_id]
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        query += " ORDER BY item_index LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        with self._connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [
+            {
+                "index": row["item_index"],
+                "status": row["status"],
+                "request": json.loads(row["request_json"]),
+                "result": json.loads(row["result_json"]) if row["result_json"] else None,
+                "error": row["error"],
+                "attempts": row["attempts"],
+            }
+            for row in rows
+        ]
+
+
+class BulkJobRunner:
+    """Processes bulk jobs in the background, BULK_JOB_CONCURRENCY items at a time."""
+
+    def __init__(self, store: BulkJobStore, concurrency: int, lease_seconds: float = BULK_JOB_LEASE_SECONDS, image_archive: Optional[FilesystemImageBackend] = None):
+        self.store = store
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.image_archive = image_archive
+        self._slots = asyncio.Semaphore(concurrency)
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._adopt_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _lease_name(job_id: str) -> str:
+        return f"bulk_job:{job_id}"
+
+    async def _acquire(self, job_id: str) -> bool:
+        """Takes the job's lease; False if another worker process is running it."""
+        return await asyncio.to_thread(shared_cache.acquire_lease, self._lease_name(job_id), self.lease_seconds)
+
+    async def submit(self, requests: list[dict]) -> str:
+        # Lease first, so no other worker adopts the job before it starts here.
+        job_id = uuid.uuid4().hex
+        await self._acquire(job_id)
+        await asyncio.to_thread(self.store.create_job, requests, job_id)
+        self._start(job_id)
+        return job_id
+
+    async def resume(self, job_id: str, include_failed: bool = True) -> str:
+        """
+        Re-queues interrupted (and failed) items of a job and processes them again.
+        Returns "resumed", "running" (already running in this process), "leased"
+        (another worker process holds the job's lease, nothing was changed) or
+        "not_found".
+        """
+        job = await asyncio.to_thread(self.store.get_job, job_id)
+        if job is None:
+            return "not_found"
+        if job_id in self._tasks:
+            return "running"
+        if not await self._acquire(job_id):
+            return "leased"
+        await asyncio.to_thread(self.store.requeue_items, job_id, include_failed)
+        await asyncio.to_thread(self.store.set_job_status, job_id, "queued")
+        self._start(job_id)
+        return "resumed"
+
+    async def cancel(self, job_id: str) -> bool:
+        job = await asyncio.to_thread(self.store.get_job, job_id)
+        if job is None:
+            return False
+        task = self._tasks.pop(job_id, None)
+        if task is not None:
+            task.cancel()
+        await asyncio.to_thread(self.store.requeue_items, job_id)
+        await asyncio.to_thread(self.store.set_job_status, job_id, "cancelled")
+        return True
+
+    async def _adopt_unfinished_jobs(self) -> None:
+        """Resumes unfinished jobs that no worker process is running (e.g. after a restart)."""
+        for job_id in await asyncio.to_thread(self.store.unfinished_job_ids):
+            if job_id in self._tasks or not await self._acquire(job_id):
+                continue
+            await asyncio.to_thread(self.store.requeue_items, job_id)
+            print(f"Resuming bulk job {job_id}")
+            self._start(job_id)
+
+    async def _adopt_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds)
+            try:
+                await self._adopt_unfinished_jobs()
+            except Exception as e:
+                print(f"Warning: could not check for orphaned bulk jobs: {e}")
+
+    async def start(self) -> None:
+        """Called at startup: resumes every job that was not finished before the restart."""
+        await self._adopt_unfinished_jobs()
+        # Other worker processes may die while running a job; take over their jobs.
+        if shared_cache.enabled and self._adopt_task is None:
+            self._adopt_task = asyncio.create_task(self._adopt_loop())
+
+    async def stop(self) -> None:
+        """Called at shutdown. Running items are re-queued on the next start."""
+        tasks = list(self._tasks.values())
+        if self._adopt_task is not None:
+            tasks.append(self._adopt_task)
+            self._adopt_task = None
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _start(self, job_id: str) -> None:
+        task = asyncio.create_task(self._run_job(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda t: self._tasks.pop(job_id, None) if self._tasks.get(job_id) is t else None)
+
+    async def _renew_lease(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await self._acquire(job_id)
+
+    async def _run_job(self, job_id: str) -> None:
+        renew_task = asyncio.create_task(self._renew_lease(job_id)) if shared_cache.enabled else None
+        try:
+            await asyncio.to_thread(self.store.set_job_status, job_id, "running")
+            # Bulk work yields to interactive requests in the upstream scheduler.
+            with use_priority(PRIORITY_BULK):
+                workers = [asyncio.create_task(self._worker(job_id)) for _ in range(self.concurrency)]
+                try:
+                    await asyncio.gather(*workers)
+                finally:
+                    for worker in workers:
+                        worker.cancel()
+            await asyncio.to_thread(self.store.complete_job, job_id)
+        finally:
+            if renew_task is not None:
+                renew_task.cancel()
+            await asyncio.to_thread(shared_cache.release_lease, self._lease_name(job_id))
+
+    async def _worker(self, job_id: str) -> None:
+        while True:
+            async with self._slots:
+                claimed = await asyncio.to_thread(self.store.claim_next_item, job_id)
+                if claimed is None:
+                    return
+                item_index, request = claimed
+                result, error = await self._generate(request)
+                if result is not None and self.image_archive is not None:
+                    await asyncio.to_thread(self._archive_images, result)
+                await asyncio.to_thread(self.store.finish_item, job_id, item_index, result, error)
+
+    def _archive_images(self, result: dict) -> None:
+        missing = image_store.archive([creative["ad_image_data"] for creative in result["creatives"]], self.image_archive)
+        if missing:
+            print(f"Warning: {missing} bulk job images were evicted before they could be archived")
+
+    @staticmethod
+    async def _generate(request: dict) -> tuple[Optional[dict], Optional[str]]:
+        try:
+            if request.get("generation_mode") == "per_variation":
+                creatives, statuses = await ad_generation_service.generate_creatives_per_variation(
+                    request["product"],
+                    request["product_description"],
+                    request.get("persona_description"),
+                    request["number_of_variations"],
+                    bypass_cache=bool(request.get("bypass_cache")),
+                )
+                return {"creatives": creatives, "variations": statuses}, None
+            creatives = await ad_generation_service.generate_creatives(
+                request["product"],
+                request["product_description"],
+                request.get("persona_description"),
+                request["number_of_variations"],
+                bypass_cache=bool(request.get("bypass_cache")),
+            )
+            return {"creatives": creatives}, None
+        except Exception as e:
+            print(f"Bulk job item failed: {e}")
+            return None, str(e)
+
+    def stats(self) -> dict:
+        return {"active_jobs": len(self._tasks), "concurrency": self.concurrency}
+
+
+async def build_campaign_requests(products: list[dict], options: dict, persona_limit: Optional[int] = None) -> Optional[list[dict]]:
+    """
+    Crosses a product list with the persona segments from the persona catalog: one
+    generation request per (product, persona) pair, each carrying the given request
+    options. Returns None if the persona data could not be loaded.
+    """
+    snapshot = await persona_catalog.get_snapshot()
+    if snapshot is None:
+        return None
+    persona_descriptions = snapshot.column("persona_segment_description")
+    if persona_limit is not None:
+        persona_descriptions = persona_descriptions[:persona_limit]
+    return [
+        {**options, "product": product["product"], "product_description": product["product_description"], "persona_description": persona_description}
+        for product in products
+        for persona_description in persona_descriptions
+    ]
+
+
+_bulk_job_images = FilesystemImageBackend(BULK_JOB_IMAGES_DIR)
+image_store.add_archive(_bulk_job_images)
+bulk_job_runner = BulkJobRunner(BulkJobStore(BULK_JOBS_DB), BULK_JOB_CONCURRENCY, image_archive=_bulk_job_images)
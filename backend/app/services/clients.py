@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+
+# Process-wide registry of Google Cloud handles (Vertex AI models, BigQuery and
+# Cloud Logging clients). Each handle is created once, on first use or from the
+# lifespan warm-up, and then reused by every request. The SDK imports live inside
+# the factories so importing the app stays cheap on Cloud Run cold starts.
+# USE_FAKE_BACKENDS=true swaps every handle for the local stand-ins in
+# app/services/fakes.py (offline development and benchmarks).
+USE_FAKE_BACKENDS = os.getenv("USE_FAKE_BACKENDS", "false").lower() == "true"
+
+PROJECT_ID = os.getenv("GCP_PROJECT_ID") or ("local-fake-project" if USE_FAKE_BACKENDS else None)
+LOCATION = os.getenv("GCP_REGION", "us-central1")
+
+# The name of the Cloud Logging log that prompts are written to
+PROMPT_LOG_NAME = "gemini-imagen-prompts"
+
+
+class _ClientHandle:
+    """A lazily created, thread-safe singleton plus the bookkeeping needed for readiness checks."""
+
+    def __init__(self, name: str, factory):
+        self.name = name
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._value = None
+        self._ready = False
+        self.error = None
+        self.init_seconds = None
+
+    def get(self):
+        if self._ready:
+            return self._value
+        with self._lock:
+            if not self._ready:
+                started = time.perf_counter()
+                try:
+                    self._value = self._factory()
+                except Exception as e:
+                    # Keep the error for /readyz and let the next call retry.
+                    self.error = str(e)
+                    raise
+                self.init_seconds = time.perf_counter() - started
+                self.error = None
+                self._ready = True
+        return self._value
+
+    def status(self) -> dict:
+        return {"ready": self._ready, "error": self.error, "init_seconds": self.init_seconds}
+
+
+_handles: dict[str, _ClientHandle] = {}
+_handles_lock = threading.Lock()
+_warm_up_state = {"finished": False, "seconds": None}
+
+
+def _get(name: str, factory):
+    handle = _handles.get(name)
+    if handle is None:
+        with _handles_lock:
+            handle = _handles.setdefault(name, _ClientHandle(name, factory))
+    return handle.get()
+
+
+def _init_vertexai():
+    import vertexai
+
+    if PROJECT_ID:
+        vertexai.init(project=PROJECT_ID, location=LOCATION)
+    else:
+        print("Warning: GCP_PROJECT_ID not set. Vertex AI calls may fail if not running in a GCP environment with default credentials.")
+    return True
+
+
+def _create_gemini_model(model_name: str):
+    if USE_FAKE_BACKENDS:
+        from app.services.fakes import FakeGenerativeModel
+        return FakeGenerativeModel(model_name)
+    _get("vertexai", _init_vertexai)
+    from vertexai.generative_models import GenerativeModel
+
+    return GenerativeModel(model_name)
+
+
+def _create_imagen_model(model_name: str):
+    if USE_FAKE_BACKENDS:
+        from app.services.fakes import FakeImageGenerationModel
+        return FakeImageGenerationModel.from_pretrained(model_name)
+    _get("vertexai", _init_vertexai)
+    from vertexai.vision_models import ImageGenerationModel
+
+    return ImageGenerationModel.from_pretrained(model_name)
+
+
+def _create_bigquery_client():
+    if USE_FAKE_BACKENDS:
+        from app.services.fakes import FakeBigQueryClient
+        return FakeBigQueryClient()
+    from google.cloud import bigquery
+
+    return bigquery.Client()
+
+
+def _create_prompt_logger():
+    if USE_FAKE_BACKENDS:
+        from app.services.fakes import FakeLogger
+        return FakeLogger()
+    import google.cloud.logging
+
+    logging_client = google.cloud.logging.Client(project=PROJECT_ID)
+    return logging_client.logger(PROMPT_LOG_NAME)
+
+
+def get_gemini_model(model_name: str):
+    """Returns the shared GenerativeModel for the given model name."""
+    return _get(f"gemini:{model_name}", lambda: _create_gemini_model(model_name))
+
+
+def get_imagen_model(model_name: str):
+    """Returns the shared ImageGenerationModel for the given model name."""
+    return _get(f"imagen:{model_name}", lambda: _create_imagen_model(model_name))
+
+
+def get_bigquery_client():
+    """Returns the shared BigQuery client."""
+    return _get("bigquery", _create_bigquery_client)
+
+
+def get_prompt_logger():
+    """Returns the shared Cloud Logging logger used by the audit log (app/services/audit_log.py)."""
+    return _get("prompt_logger", _create_prompt_logger)
+
+
+def warm_up(gemini_model_name: str, imagen_model_name: str, include_bigquery: bool = True, include_prompt_logger: bool = True) -> None:
+    """
+    Creates every handle ahead of the first request. Blocking; the lifespan hook
+    runs it on an executor. Failures are recorded for /readyz, not raised.
+    """
+    started = time.perf_counter()
+    getters = [
+        lambda: get_gemini_model(gemini_model_name),
+        lambda: get_imagen_model(imagen_model_name),
+    ]
+    if include_prompt_logger:
+        getters.append(get_prompt_logger)
+    if include_bigquery:
+        getters.append(get_bigquery_client)
+    for getter in getters:
+        try:
+            getter()
+        except Exception as e:
+            print(f"Warning: client warm-up failed: {e}")
+    _warm_up_state["seconds"] = time.perf_counter() - started
+    _warm_up_state["finished"] = True
+
+
+def readiness() -> dict:
+    """
+    Reports the state of every handle created so far. The service is ready once
+    warm-up has finished (or was skipped) and no handle is in an error state.
+    """
+    handles = {name: handle.status() for name, handle in list(_handles.items())}
+    ready = _warm_up_state["finished"] and not any(status["error"] for status in handles.values())
+    return {
+        "ready": ready,
+        "warm_up_finished": _warm_up_state["finished"],
+        "warm_up_seconds": _warm_up_state["seconds"],
+        "clients": handles,
+        "fake_backends": USE_FAKE_BACKENDS,
+    }
+
+
+def mark_warm_up_skipped() -> None:
+    """Used when warm-up is disabled: handles are then created on first use only."""
+    _warm_up_state["finished"] = True
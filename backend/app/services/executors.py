@@ -0,0 +1,87 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# The Vertex AI Imagen SDK and the BigQuery client only expose blocking calls.
+# They run on bounded thread pools so the event loop keeps serving other
+# requests (static assets, persona list, ...) while a model call is in flight.
+# Each upstream gets its own pool so a burst of slow Imagen calls cannot starve
+# BigQuery lookups, and vice versa.
+EXECUTOR_SIZES = {
+    "vertex_ai": int(os.getenv("VERTEX_AI_MAX_WORKERS", "16")),
+    "bigquery": int(os.getenv("BIGQUERY_MAX_WORKERS", "4")),
+}
+
+# CPU-bound work (image resizing / encoding) runs in worker processes instead, so
+# it neither blocks the event loop nor holds the GIL. Created and warmed up at
+# startup (warm_up_process_pool), since spawning the processes is slow.
+PROCESS_POOL_SIZE = int(os.getenv("IMAGE_PROCESS_WORKERS", "0")) or min(4, os.cpu_count() or 1)
+
+_executors: dict[str, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+_process_pool = None
+
+
+def get_executor(name: str) -> ThreadPoolExecutor:
+    """Returns the thread pool for the given upstream, creating it on first use."""
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=EXECUTOR_SIZES[name],
+                    thread_name_prefix=f"{name}-worker",
+                )
+                _executors[name] = executor
+    return executor
+
+
+async def run_blocking(name: str, func, *args, **kwargs):
+    """Runs a blocking callable on the named pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(name), functools.partial(func, *args, **kwargs))
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Returns the process pool for CPU-bound work, creating it on first use."""
+    global _process_pool
+    if _process_pool is None:
+        with _executors_lock:
+            if _process_pool is None:
+                # "spawn": forking a process that already runs threads is unsafe.
+                _process_pool = ProcessPoolExecutor(max_workers=PROCESS_POOL_SIZE, mp_context=multiprocessing.get_context("spawn"))
+    return _process_pool
+
+
+def warm_up_process_pool(func) -> None:
+    """
+    Creates the process pool and starts its workers by running func (a picklable
+    top-level function without arguments) once per worker. Blocking; the lifespan
+    runs it in a thread so spawning never happens on the event loop.
+    """
+    pool = get_process_pool()
+    for future in [pool.submit(func) for _ in range(PROCESS_POOL_SIZE)]:
+        future.result()
+
+
+async def run_in_process(func, *args):
+    """Runs a picklable top-level function in the process pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), func, *args)
+
+
+def shutdown_executors(wait: bool = True) -> None:
+    """Shuts down all pools. Called from the application lifespan on shutdown."""
+    global _process_pool
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+        if _process_pool is not None:
+            executors.append(_process_pool)
+            _process_pool = None
+    for executor in executors:
+        executor.shutdown(wait=wait, cancel_futures=True)
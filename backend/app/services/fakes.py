@@ -0,0 +1,262 @@
+import asyncio
+import datetime
+import os
+import random
+import struct
+import time
+import zlib
+
+# Local stand-ins for the Vertex AI GenerativeModel / ImageGenerationModel, the
+# BigQuery client and the Cloud Logging logger. Enabled with USE_FAKE_BACKENDS=true
+# (see app/services/clients.py), they let the service run and be load-tested
+# offline, without credentials or quota. Latency, payload size and error rates
+# come from the environment and can also be changed at runtime via fake_config.
+
+
+class FakeConfig:
+    def __init__(self):
+        self.gemini_latency_seconds = float(os.getenv("FAKE_GEMINI_LATENCY_SECONDS", "1.0"))
+        self.gemini_stream_chunks = int(os.getenv("FAKE_GEMINI_STREAM_CHUNKS", "20"))
+        self.imagen_latency_seconds = float(os.getenv("FAKE_IMAGEN_LATENCY_SECONDS", "3.0"))
+        self.image_size_px = int(os.getenv("FAKE_IMAGEN_IMAGE_SIZE", "512"))
+        self.bigquery_latency_seconds = float(os.getenv("FAKE_BIGQUERY_LATENCY_SECONDS", "0.3"))
+        self.bigquery_rows = int(os.getenv("FAKE_BIGQUERY_ROWS", "200"))
+        self.logging_latency_seconds = float(os.getenv("FAKE_LOGGING_LATENCY_SECONDS", "0.05"))
+        # +/- fraction applied to every latency
+        self.latency_jitter = float(os.getenv("FAKE_LATENCY_JITTER", "0.2"))
+        # Probability that a call fails with a generic error / a quota (429) error
+        self.error_rate = float(os.getenv("FAKE_ERROR_RATE", "0"))
+        self.quota_error_rate = float(os.getenv("FAKE_QUOTA_ERROR_RATE", "0"))
+
+
+fake_config = FakeConfig()
+
+
+class ResourceExhausted(Exception):
+    """Mimics google.api_core.exceptions.ResourceExhausted (matched by class name)."""
+
+
+def _latency(seconds: float) -> float:
+    jitter = fake_config.latency_jitter
+    return max(0.0, seconds * random.uniform(1 - jitter, 1 + jitter))
+
+
+def _maybe_fail(service: str) -> None:
+    roll = random.random()
+    if roll < fake_config.quota_error_rate:
+        raise ResourceExhausted(f"429 Resource exhausted: fake {service} quota exceeded.")
+    if roll < fake_config.quota_error_rate + fake_config.error_rate:
+        raise RuntimeError(f"Fake {service} error (injected).")
+
+
+# Gemini
+
+class _Part:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _Content:
+    def __init__(self, text: str):
+        self.parts = [_Part(text)]
+
+
+class _Candidate:
+    def __init__(self, text: str):
+        self.content = _Content(text)
+
+
+class FakeGenerationResponse:
+    def __init__(self, text: str):
+        self.candidates = [_Candidate(text)]
+
+
+def _fake_ad_copy(prompt: str) -> str:
+    # Mirrors the shape the prompts ask for: a numbered list when several variations are requested.
+    count = 1
+    for word in prompt.split():
+        if word.isdigit():
+            count = max(1, min(int(word), 4))
+            break
+    if "variations" not in prompt:
+        count = 1
+    ads = [
+        f"## Fake ad #{i+1}\nThis locally generated ad copy stands in for Gemini output so the "
+        f"service can be benchmarked offline. Token {random.getrandbits(32):08x}."
+        for i in range(count)
+    ]
+    if count == 1:
+        return ads[0]
+    return "\n".join(f"{i+1}. {ad.replace(chr(10), ' ')}" for i, ad in enumerate(ads))
+
+
+class FakeGenerativeModel:
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        time.sleep(_latency(fake_config.gemini_latency_seconds))
+        _maybe_fail("Gemini")
+        return FakeGenerationResponse(_fake_ad_copy(contents[0]))
+
+    async def generate_content_async(self, contents, generation_config=None, stream=False):
+        if stream:
+            _maybe_fail("Gemini")
+            return self._stream(_fake_ad_copy(contents[0]))
+        await asyncio.sleep(_latency(fake_config.gemini_latency_seconds))
+        _maybe_fail("Gemini")
+        return FakeGenerationResponse(_fake_ad_copy(contents[0]))
+
+    async def _stream(self, text: str):
+        chunks = max(1, fake_config.gemini_stream_chunks)
+        size = max(1, len(text) // chunks + 1)
+        delay = _latency(fake_config.gemini_latency_seconds) / chunks
+        for start in range(0, len(text), size):
+            await asyncio.sleep(delay)
+            yield FakeGenerationResponse(text[start:start + size])
+
+
+# Imagen
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+_png_cache: dict[int, bytes] = {}
+
+
+def _noise_png(size_px: int) -> bytes:
+    """A valid RGB PNG of random noise (about as large as a real photo of that size). Built once per size."""
+    if size_px not in _png_cache:
+        row_length = size_px * 3
+        raw = b"".join(b"\x00" + os.urandom(row_length) for _ in range(size_px))
+        _png_cache[size_px] = (
+            _png_chunk(b"IHDR", struct.pack(">IIBBBBB", size_px, size_px, 8, 2, 0, 0, 0))
+            + _png_chunk(b"IDAT", zlib.compress(raw, 1))
+        )
+    return _png_cache[size_px]
+
+
+def fake_png(size_px: int) -> bytes:
+    """A unique PNG per call: shared pixel data plus a random tEXt chunk, so content digests differ."""
+    nonce = _png_chunk(b"tEXt", b"nonce\x00" + os.urandom(8).hex().encode())
+    body = _noise_png(size_px)
+    ihdr_length = 25  # length + type + 13 bytes + crc
+    return b"\x89PNG\r\n\x1a\n" + body[:ihdr_length] + nonce + body[ihdr_length:] + _png_chunk(b"IEND", b"")
+
+
+class _FakeImage:
+    def __init__(self, image_bytes: bytes):
+        self._image_bytes = image_bytes
+
+
+class FakeImageGenerationResponse:
+    def __init__(self, images):
+        self.images = images
+
+
+class FakeImageGenerationModel:
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    @classmethod
+    def from_pretrained(cls, model_name: str):
+        return cls(model_name)
+
+    def generate_images(self, prompt: str, number_of_images: int = 1, aspect_ratio: str = "1:1", **kwargs):
+        time.sleep(_latency(fake_config.imagen_latency_seconds))
+        _maybe_fail("Imagen")
+        return FakeImageGenerationResponse([_FakeImage(fake_png(fake_config.image_size_px)) for _ in range(number_of_images)])
+
+
+# BigQuery
+
+class _SchemaField:
+    def __init__(self, name: str):
+        self.name = name
+
+
+class _Row:
+    def __init__(self, fields, values):
+        self._fields = fields
+        self._values = values
+
+    def values(self):
+        return self._values
+
+    def items(self):
+        return zip(self._fields, self._values)
+
+
+class _RowIterator:
+    def __init__(self, fields, rows):
+        self.schema = [_SchemaField(name) for name in fields]
+        self._fields = fields
+        self._rows = rows
+
+    def __iter__(self):
+        return (_Row(self._fields, values) for values in self._rows)
+
+
+class _QueryJob:
+    def __init__(self, sql: str):
+        self.sql = sql
+
+    def result(self):
+        time.sleep(_latency(fake_config.bigquery_latency_seconds))
+        _maybe_fail("BigQuery")
+        rows = fake_config.bigquery_rows
+        if "LIMIT" in self.sql:
+            rows = min(rows, int(self.sql.split("LIMIT")[1].split()[0]))
+        age_groups = ["18-24", "25-34", "35-44", "45-54", "55+"]
+        interests = ["running", "cooking", "travel", "gaming", "gardening", "fashion", "finance", "fitness"]
+        fields = ["persona_age_group_profile", "persona_segment_description"]
+        return _RowIterator(fields, [
+            (
+                f"{age_groups[i % len(age_groups)]} segment {i}",
+                f"Customers aged {age_groups[i % len(age_groups)]} interested in "
+                f"{interests[i % len(interests)]} and {interests[(i * 3 + 1) % len(interests)]}.",
+            )
+            for i in range(rows)
+        ])
+
+
+class _Table:
+    def __init__(self):
+        self.modified = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+class FakeBigQueryClient:
+    project = "local-fake-project"
+
+    def query(self, sql: str):
+        return _QueryJob(sql)
+
+    def get_table(self, table_ref: str):
+        return _Table()
+
+
+# Cloud Logging
+
+class _FakeBatch:
+    def __init__(self):
+        self.entries = []
+
+    def log_struct(self, info: dict, **kwargs):
+        self.entries.append(info)
+
+    def commit(self):
+        # One API round trip for the whole batch
+        time.sleep(_latency(fake_config.logging_latency_seconds))
+        _maybe_fail("Cloud Logging")
+
+
+class FakeLogger:
+    def log_text(self, text: str, **kwargs):
+        time.sleep(_latency(fake_config.logging_latency_seconds))
+
+    def log_struct(self, info: dict, **kwargs):
+        time.sleep(_latency(fake_config.logging_latency_seconds))
+
+    def batch(self):
+        return _FakeBatch()
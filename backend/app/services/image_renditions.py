@@ -0,0 +1,127 @@
+import asyncio
+import io
+import os
+from typing import Optional
+from app.services import executors, metrics
+from app.services.image_store import image_store
+from app.services.single_flight import SingleFlight
+
+# Downscaled, re-encoded versions of the generated images. The UI shows Imagen's
+# full-resolution PNGs as small cards, so it loads a "preview" (or "thumbnail")
+# rendition instead, as WebP when the browser accepts it and PNG otherwise; the
+# "original" is only fetched for downloads. Renditions are built in the process
+# pool (Pillow encoding is CPU-bound) and cached next to the original, keyed by
+# its content digest.
+RENDITION_SIZES = {
+    "thumbnail": int(os.getenv("IMAGE_THUMBNAIL_SIZE", "256")),
+    "preview": int(os.getenv("IMAGE_PREVIEW_SIZE", "640")),
+}
+RENDITIONS = ("original",) + tuple(RENDITION_SIZES)
+IMAGE_WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", "80"))
+# Build the preview and thumbnail (WebP) as soon as an image is generated, so the
+# first view does not wait for encoding.
+IMAGE_EAGER_RENDITIONS = os.getenv("IMAGE_EAGER_RENDITIONS", "true").lower() == "true"
+
+FORMATS = {"webp": "image/webp", "png": "image/png"}
+
+_flights = SingleFlight()
+_background_tasks: set = set()
+
+
+def render(data: bytes, max_edge: int, image_format: str, webp_quality: int = IMAGE_WEBP_QUALITY) -> bytes:
+    """
+    Downscales an image so its longer edge is at most max_edge (never upscales) and
+    encodes it as WebP or PNG. CPU-bound; runs in the process pool.
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        if image_format == "webp":
+            image.save(output, format="WEBP", quality=webp_quality, method=4)
+        else:
+            image.save(output, format="PNG", optimize=True)
+        return output.getvalue()
+
+
+def _warm_up_worker() -> None:
+    """Runs once in each pool process at startup: imports Pillow and loads its WebP codec."""
+    from PIL import features
+
+    features.check("webp")
+
+
+def warm_up() -> None:
+    """Starts the image process pool's workers ahead of the first rendition. Blocking."""
+    try:
+        executors.warm_up_process_pool(_warm_up_worker)
+    except Exception as e:
+        # Not fatal: the pool is created on first use instead.
+        print(f"Warning: image process pool warm-up failed: {e}")
+
+
+def negotiate_format(accept: Optional[str]) -> str:
+    """WebP if the client accepts it, PNG otherwise."""
+    return "webp" if accept and "image/webp" in accept else "png"
+
+
+def rendition_urls(image_ref: str) -> dict:
+    """
+    Preview and thumbnail URLs for an image-store URL ({} for anything else, e.g.
+    data URIs or error messages).
+    """
+    if image_store.digest_from_url(image_ref) is None:
+        return {}
+    return {
+        "ad_image_preview": f"{image_ref}?rendition=preview",
+        "ad_image_thumbnail": f"{image_ref}?rendition=thumbnail",
+    }
+
+
+async def get_rendition(digest: str, rendition: str, image_format: str) -> Optional[tuple[bytes, str]]:
+    """
+    Returns (data, content_type) for a rendition of the stored image, building and
+    caching it on first use. The "original" is returned as stored. None if the
+    image does not exist.
+    """
+    if rendition == "original":
+        return await asyncio.to_thread(image_store.get, digest)
+    name = f"{rendition}.{image_format}"
+    cached = await asyncio.to_thread(image_store.get_rendition, digest, name)
+    if cached is not None:
+        return cached
+
+    async def build():
+        stored = await asyncio.to_thread(image_store.get, digest)
+        if stored is None:
+            return None
+        with metrics.span("image_rendition"):
+            data = await executors.run_in_process(render, stored[0], RENDITION_SIZES[rendition], image_format)
+        await asyncio.to_thread(image_store.put_rendition, digest, name, data, FORMATS[image_format])
+        return data, FORMATS[image_format]
+
+    # Concurrent requests for the same rendition share one encode.
+    return await _flights.do(f"{digest}:{name}", build)
+
+
+async def _prepare(digests: list[str]) -> None:
+    for digest in digests:
+        for rendition in RENDITION_SIZES:
+            try:
+                await get_rendition(digest, rendition, "webp")
+            except Exception as e:
+                print(f"Warning: could not build {rendition} rendition for image {digest}: {e}")
+
+
+def prepare_in_background(image_refs: list[str]) -> None:
+    """Starts building the WebP preview/thumbnail of newly stored images without waiting for them."""
+    if not IMAGE_EAGER_RENDITIONS:
+        return
+    digests = [digest for digest in map(image_store.digest_from_url, image_refs) if digest]
+    if not digests:
+        return
+    task = asyncio.create_task(_prepare(digests))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
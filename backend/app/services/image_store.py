@@ -0,0 +1,364 @@
+import base64
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Optional
+
+# URL prefix under which stored images are served (see app/routers/images.py)
+IMAGE_URL_PREFIX = "/api/v1/images/"
+
+# Retention for the filesystem store. On Cloud Run the default directory is in
+# memory, so the store must not grow without bound: images (with their
+# renditions) unused for longer than the max age are deleted, and beyond the
+# size cap the least recently used ones go first. 0 disables a limit. Result
+# cache hits touch their images (and entries whose images are gone are dropped),
+# see ad_generation_service.get_cached_creatives.
+IMAGE_STORE_MAX_MB = float(os.getenv("IMAGE_STORE_MAX_MB", "256"))
+IMAGE_STORE_MAX_AGE_SECONDS = float(os.getenv("IMAGE_STORE_MAX_AGE_SECONDS", "86400"))
+# Age-based sweeps run at most this often (size-based ones whenever the cap is exceeded).
+IMAGE_STORE_SWEEP_SECONDS = float(os.getenv("IMAGE_STORE_SWEEP_SECONDS", "300"))
+# A size-triggered sweep frees space down to this fraction of the cap, so it does not rerun on every write.
+_LOW_WATERMARK = 0.9
+
+_DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+_EXTENSIONS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/webp": ".webp",
+}
+
+
+def is_valid_digest(digest: str) -> bool:
+    return bool(_DIGEST_PATTERN.match(digest))
+
+
+class ImageStoreBackend:
+    """Interface for image storage backends. Implementations must be thread-safe."""
+
+    def put(self, digest: str, data: bytes, content_type: str) -> None:
+        raise NotImplementedError
+
+    def get(self, digest: str) -> Optional[tuple[bytes, str]]:
+        """Returns (data, content_type), or None if the digest is unknown."""
+        raise NotImplementedError
+
+    def exists(self, digest: str) -> bool:
+        return self.get(digest) is not None
+
+    def touch(self, digest: str) -> bool:
+        """Marks the image as recently used (for eviction); returns whether it exists."""
+        return self.exists(digest)
+
+    def put_rendition(self, digest: str, name: str, data: bytes, content_type: str) -> None:
+        """Stores a derived version of an image (e.g. "preview.webp"), keyed by the source digest."""
+        raise NotImplementedError
+
+    def get_rendition(self, digest: str, name: str) -> Optional[tuple[bytes, str]]:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+
+class FilesystemImageBackend(ImageStoreBackend):
+    """
+    Stores each image as <root>/<first two hex chars>/<digest><ext>. Writes are
+    atomic (temp file + rename), and since content is addressed by its digest an
+    existing file never needs to be rewritten.
+
+    Retention is least-recently-used over file mtimes (reads touch the file): an
+    image and its renditions are evicted together once unused for max_age_seconds,
+    or oldest first while the directory holds more than max_bytes.
+    """
+
+    def __init__(self, root: str, max_bytes: int = 0, max_age_seconds: float = 0, sweep_interval_seconds: float = 300):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self._lock = threading.Lock()
+        self._bytes: Optional[int] = None  # estimate between sweeps; None until the first one
+        self._last_sweep = 0.0
+        self._sweeping = False
+        self._counters = {"sweeps": 0, "evicted_images": 0, "evicted_bytes": 0}
+        os.makedirs(self.root, exist_ok=True)
+
+    def _directory(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2])
+
+    def _find(self, digest: str) -> Optional[tuple[str, str]]:
+        directory = self._directory(digest)
+        for content_type, extension in _EXTENSIONS.items():
+            path = os.path.join(directory, digest + extension)
+            if os.path.exists(path):
+                return path, content_type
+        return None
+
+    def put(self, digest: str, data: bytes, content_type: str) -> None:
+        if self._find(digest) is not None:
+            return
+        directory = self._directory(digest)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, digest + _EXTENSIONS.get(content_type, ".png"))
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._after_write(len(data))
+
+    def get(self, digest: str) -> Optional[tuple[bytes, str]]:
+        found = self._find(digest)
+        if found is None:
+            return None
+        path, content_type = found
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        self._touch(path)
+        return data, content_type
+
+    def exists(self, digest: str) -> bool:
+        return self._find(digest) is not None
+
+    def touch(self, digest: str) -> bool:
+        found = self._find(digest)
+        if found is None:
+            return False
+        self._touch(found[0])
+        return True
+
+    def _rendition_path(self, digest: str, name: str) -> str:
+        # <digest>.<name>, e.g. ab/abcd....preview.webp, next to the original
+        return os.path.join(self._directory(digest), f"{digest}.{name}")
+
+    def put_rendition(self, digest: str, name: str, data: bytes, content_type: str) -> None:
+        path = self._rendition_path(digest, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._after_write(len(data))
+
+    def get_rendition(self, digest: str, name: str) -> Optional[tuple[bytes, str]]:
+        extension = "." + name.rsplit(".", 1)[-1]
+        content_type = next((ct for ct, ext in _EXTENSIONS.items() if ext == extension), "application/octet-stream")
+        path = self._rendition_path(digest, name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        self._touch(path)
+        return data, content_type
+
+    # Retention
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        # Bump the mtime so eviction is least-recently-used, not oldest-written.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _after_write(self, size: int) -> None:
+        if not self.max_bytes and not self.max_age_seconds:
+            return
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += size
+            due = (
+                self._bytes is None
+                or (self.max_bytes and self._bytes > self.max_bytes)
+                or (self.max_age_seconds and time.monotonic() - self._last_sweep >= self.sweep_interval_seconds)
+            )
+            if not due or self._sweeping:
+                return
+            self._sweeping = True
+        try:
+            self.sweep()
+        except OSError as e:
+            print(f"Warning: image store sweep failed: {e}")
+        finally:
+            with self._lock:
+                self._sweeping = False
+
+    def _scan(self) -> dict[str, list]:
+        """digest -> [latest mtime, total size, paths] for every image and its renditions."""
+        groups: dict[str, list] = {}
+        for directory in os.scandir(self.root):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                digest = entry.name[:64]
+                if entry.name.endswith(".tmp") or not is_valid_digest(digest):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                group = groups.setdefault(digest, [0.0, 0, []])
+                group[0] = max(group[0], stat.st_mtime)
+                group[1] += stat.st_size
+                group[2].append(entry.path)
+        return groups
+
+    def sweep(self) -> None:
+        """
+        Deletes images unused for longer than max_age_seconds, then the least recently
+        used ones while the store is over max_bytes (down to 90% of it). Blocking.
+        """
+        groups = self._scan()
+        total = sum(group[1] for group in groups.values())
+        now = time.time()
+        evicted = evicted_bytes = 0
+        for digest, (mtime, size, paths) in sorted(groups.items(), key=lambda item: item[1][0]):
+            expired = self.max_age_seconds and now - mtime > self.max_age_seconds
+            over_budget = self.max_bytes and total > self.max_bytes * _LOW_WATERMARK
+            if not expired and not over_budget:
+                break
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+            evicted += 1
+            evicted_bytes += size
+        with self._lock:
+            self._bytes = total
+            self._last_sweep = time.monotonic()
+            self._counters["sweeps"] += 1
+            self._counters["evicted_images"] += evicted
+            self._counters["evicted_bytes"] += evicted_bytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["bytes"] = self._bytes
+        stats["max_bytes"] = self.max_bytes
+        stats["max_age_seconds"] = self.max_age_seconds
+        return stats
+
+
+class ImageStore:
+    """
+    Content-addressed image store: images are keyed by the SHA-256 of their bytes.
+
+    New images go to the (evicting) backend. Images that must outlive eviction,
+    such as bulk job results, are copied into an archive backend with archive();
+    lookups fall back to the archives, so their URLs keep working.
+    """
+
+    def __init__(self, backend: ImageStoreBackend):
+        self.backend = backend
+        self.archives: list[ImageStoreBackend] = []
+
+    def add_archive(self, backend: ImageStoreBackend) -> None:
+        self.archives.append(backend)
+
+    def put(self, data: bytes, content_type: str = "image/png") -> str:
+        """Stores the image and returns its digest. Blocking (backend I/O)."""
+        digest = hashlib.sha256(data).hexdigest()
+        self.backend.put(digest, data, content_type)
+        return digest
+
+    def get(self, digest: str) -> Optional[tuple[bytes, str]]:
+        """Returns (data, content_type) for a digest, or None. Blocking (backend I/O)."""
+        if not is_valid_digest(digest):
+            return None
+        stored = self.backend.get(digest)
+        for archive in self.archives:
+            if stored is not None:
+                break
+            stored = archive.get(digest)
+        return stored
+
+    def archive(self, image_refs: list[str], archive: ImageStoreBackend) -> int:
+        """
+        Copies the images behind these URLs into archive (never evicted), so the URLs
+        stay valid. Returns how many could not be copied because they were already
+        evicted. Blocking (backend I/O).
+        """
+        missing = 0
+        for image_ref in image_refs:
+            digest = self.digest_from_url(image_ref)
+            if digest is None or archive.exists(digest):
+                continue
+            stored = self.backend.get(digest)
+            if stored is None:
+                missing += 1
+                continue
+            archive.put(digest, *stored)
+        return missing
+
+    def put_rendition(self, digest: str, name: str, data: bytes, content_type: str) -> None:
+        """Caches a derived version of the image with the given digest. Blocking (backend I/O)."""
+        self.backend.put_rendition(digest, name, data, content_type)
+
+    def get_rendition(self, digest: str, name: str) -> Optional[tuple[bytes, str]]:
+        """Returns a cached derived version (data, content_type), or None. Blocking (backend I/O)."""
+        if not is_valid_digest(digest):
+            return None
+        return self.backend.get_rendition(digest, name)
+
+    def touch(self, image_refs: list[str]) -> bool:
+        """
+        Marks the images behind these URLs as recently used, so eviction keeps them.
+        Returns False if any of them is no longer stored. Refs that are not image
+        store URLs (data URIs) are ignored. Blocking (backend I/O).
+        """
+        present = True
+        for image_ref in image_refs:
+            digest = self.digest_from_url(image_ref)
+            if digest is not None and not self.backend.touch(digest) and not any(archive.exists(digest) for archive in self.archives):
+                present = False
+        return present
+
+    @staticmethod
+    def url_for(digest: str) -> str:
+        return f"{IMAGE_URL_PREFIX}{digest}"
+
+    @staticmethod
+    def digest_from_url(url: str) -> Optional[str]:
+        if not url.startswith(IMAGE_URL_PREFIX):
+            return None
+        digest = url[len(IMAGE_URL_PREFIX):]
+        return digest if is_valid_digest(digest) else None
+
+    def stats(self) -> dict:
+        return self.backend.stats()
+
+    def to_data_uri(self, image_ref: str) -> str:
+        """
+        Converts an image URL from this store into a base64 data URI (legacy inline
+        mode). Anything else (already a data URI, an error message) is returned as is.
+        Blocking (backend I/O).
+        """
+        digest = self.digest_from_url(image_ref)
+        if digest is None:
+            return image_ref
+        stored = self.get(digest)
+        if stored is None:
+            return f"Error: Image {digest} is no longer available."
+        data, content_type = stored
+        return f"data:{content_type};base64,{base64.b64encode(data).decode('utf-8')}"
+
+
+# Process-wide store. Other backends (e.g. a GCS bucket) can be plugged in by
+# constructing ImageStore with a different ImageStoreBackend.
+image_store = ImageStore(
+    FilesystemImageBackend(
+        os.getenv("IMAGE_STORE_DIR") or os.path.join(tempfile.gettempdir(), "ad-generator", "images"),
+        max_bytes=int(IMAGE_STORE_MAX_MB * 1024 * 1024),
+        max_age_seconds=IMAGE_STORE_MAX_AGE_SECONDS,
+        sweep_interval_seconds=IMAGE_STORE_SWEEP_SECONDS,
+    )
+)
@@ -0,0 +1,275 @@
+import asyncio
+import contextlib
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+# In-process metrics in the Prometheus text format, served on /metrics. No client
+# library or Cloud Monitoring is needed, so the numbers are available locally too.
+# Values are per worker process and reset on restart (like /api/v1/stats).
+
+# Latency buckets in seconds, from in-memory work (prompt building, cache hits)
+# up to slow multi-image Imagen calls.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        # Missing labels are exported as "" so every series of a family has the same label set.
+        unknown = set(labels) - set(self.labelnames)
+        if unknown:
+            raise ValueError(f"Unknown labels for {self.name}: {sorted(unknown)}")
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [count per bucket (non-cumulative, last one is +Inf), sum]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            snapshot = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+        lines = []
+        for key, (counts, total) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector) -> None:
+        """collector() returns extra exposition lines, computed at scrape time (e.g. gauges from stats())."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                print(f"Warning: metrics collector failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_duration = registry.register(Histogram(
+    "ad_generator_stage_duration_seconds",
+    "Time spent in one stage of the generation pipeline.",
+    ("stage", "model", "variations", "outcome"),
+))
+request_duration = registry.register(Histogram(
+    "ad_generator_request_duration_seconds",
+    "End-to-end latency of the generation endpoints.",
+    ("endpoint", "mode", "variations", "cache_hit", "outcome"),
+))
+cache_lookups = registry.register(Counter(
+    "ad_generator_cache_lookups_total",
+    "Result cache lookups made while serving generation requests.",
+    ("result",),
+))
+
+
+# Tracing: every request handled under trace() collects the spans recorded by the
+# code it calls (including tasks it starts), for the Server-Timing header and logs.
+
+class Span:
+    def __init__(self, stage: str, labels: dict):
+        self.stage = stage
+        self.labels = labels
+        self.outcome = "ok"
+        self.duration = 0.0
+
+
+class Trace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: list[Span] = []
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def cache_hit_label(self) -> str:
+        """"true" / "false" if every / no cache lookup hit, "partial" for a mix, "" if the cache was not used."""
+        if self.cache_hits and self.cache_misses:
+            return "partial"
+        if self.cache_hits:
+            return "true"
+        if self.cache_misses:
+            return "false"
+        return ""
+
+    def server_timing(self) -> str:
+        """Total time per stage as a Server-Timing header value (browser dev tools show it)."""
+        totals: dict[str, float] = {}
+        for span in self.spans:
+            totals[span.stage] = totals.get(span.stage, 0.0) + span.duration
+        return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("metrics_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextlib.contextmanager
+def trace():
+    """Starts a trace for the enclosed request handling and yields it."""
+    current = Trace()
+    token = _current_trace.set(current)
+    try:
+        yield current
+    finally:
+        _current_trace.reset(token)
+
+
+def observe_stage(stage: str, seconds: float, outcome: str = "ok", **labels) -> None:
+    """Records a stage duration measured elsewhere (e.g. upstream queue wait)."""
+    stage_duration.observe(seconds, stage=stage, outcome=outcome, **labels)
+    current = _current_trace.get()
+    if current is not None:
+        recorded = Span(stage, labels)
+        recorded.outcome = outcome
+        recorded.duration = seconds
+        current.spans.append(recorded)
+
+
+@contextlib.contextmanager
+def span(stage: str, **labels):
+    """
+    Times the enclosed block as one pipeline stage. The outcome is "error" if the
+    block raises, "cancelled" if it is cancelled, and can be set explicitly on the
+    yielded span (e.g. when a service returns GenerationError strings instead of raising).
+    """
+    current = Span(stage, labels)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.outcome = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+        raise
+    finally:
+        current.duration = time.perf_counter() - started
+        observe_stage(stage, current.duration, outcome=current.outcome, **labels)
+
+
+def record_cache_lookup(hit: bool) -> None:
+    cache_lookups.inc(result="hit" if hit else "miss")
+    current = _current_trace.get()
+    if current is not None:
+        if hit:
+            current.cache_hits += 1
+        else:
+            current.cache_misses += 1
+
+
+def stats_collector(name: str, get_stats):
+    """
+    Returns a collector exporting every numeric value of get_stats() (a nested
+    dict, as returned by the stats() methods) as a gauge,
+    ad_generator_<name>{key="path.to.value"}.
+    """
+    metric_name = f"ad_generator_{name}"
+
+    def flatten(prefix: str, value, out: list) -> None:
+        if isinstance(value, dict):
+            for key, item in value.items():
+                flatten(f"{prefix}.{key}" if prefix else str(key), item, out)
+        elif isinstance(value, (int, float)):  # bools export as 0/1
+            out.append((prefix, float(value)))
+
+    def collect() -> list[str]:
+        values: list = []
+        flatten("", get_stats(), values)
+        lines = [f"# HELP {metric_name} {name} counters from /api/v1/stats.", f"# TYPE {metric_name} gauge"]
+        lines.extend(f'{metric_name}{{key="{_escape(key)}"}} {_format_value(value)}' for key, value in values)
+        return lines
+
+    return collect
@@ -0,0 +1,238 @@
+import asyncio
+import bisect
+import os
+import re
+import sys
+import time
+from array import array
+from typing import Optional
+from app.services import bigquery_service, metrics
+from app.services.shared_cache import shared_cache
+
+# In-memory persona catalog: the persona table is loaded once (in full, unless
+# PERSONA_CATALOG_MAX_ROWS is set), kept as columns plus precomputed indexes, and
+# refreshed in the background when the table changes or the TTL expires.
+PERSONA_CATALOG_MAX_ROWS = int(os.getenv("PERSONA_CATALOG_MAX_ROWS", "0")) or None
+PERSONA_CATALOG_TTL_SECONDS = float(os.getenv("PERSONA_CATALOG_TTL_SECONDS", "3600"))
+# How often the background task checks the table's last-modified marker.
+PERSONA_CATALOG_CHECK_SECONDS = float(os.getenv("PERSONA_CATALOG_CHECK_SECONDS", "60"))
+# With several workers (SHARED_CACHE_ENABLED=true) one of them queries BigQuery and
+# publishes the rows in the shared cache; the others wait up to this long for them.
+PERSONA_CATALOG_LOAD_LEASE_SECONDS = float(os.getenv("PERSONA_CATALOG_LOAD_LEASE_SECONDS", "120"))
+
+_SHARED_NAMESPACE = "persona_catalog"
+_SHARED_KEY = "rows"
+_LOAD_LEASE = "persona_catalog_load"
+
+SEARCH_COLUMN = "persona_segment_description"
+FILTER_COLUMN = "persona_age_group_profile"
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+class PersonaSnapshot:
+    """
+    Immutable, compact view of the persona table: one tuple per column, an
+    inverted index (token -> sorted row ids) over the description column and a
+    value index over the age-group column. Refreshes swap in a new snapshot.
+    """
+
+    def __init__(self, data: dict, marker=None, loaded_at: Optional[float] = None):
+        # Repeated values (e.g. age groups) share a single string object.
+        self.columns = {
+            name: tuple(sys.intern(value) if isinstance(value, str) else value for value in values)
+            for name, values in data.items()
+        }
+        self.row_count = len(next(iter(self.columns.values()), ()))
+        self.marker = marker
+        self.loaded_at = time.time() if loaded_at is None else loaded_at
+        self._token_index = self._build_token_index(self.columns.get(SEARCH_COLUMN, ()))
+        self._sorted_tokens = sorted(self._token_index)
+        self._value_index = self._build_value_index(self.columns.get(FILTER_COLUMN, ()))
+
+    @staticmethod
+    def _build_token_index(values) -> dict[str, array]:
+        index: dict[str, array] = {}
+        for row_id, value in enumerate(values):
+            for token in set(tokenize(value or "")):
+                index.setdefault(token, array("I")).append(row_id)
+        return index
+
+    @staticmethod
+    def _build_value_index(values) -> dict[str, array]:
+        index: dict[str, array] = {}
+        for row_id, value in enumerate(values):
+            index.setdefault(value, array("I")).append(row_id)
+        return index
+
+    def _rows_with_prefix(self, prefix: str) -> set:
+        """Rows containing any indexed token that starts with prefix ("run" matches "runners")."""
+        rows = set()
+        start = bisect.bisect_left(self._sorted_tokens, prefix)
+        for token in self._sorted_tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            rows.update(self._token_index[token])
+        return rows
+
+    def _matching_rows(self, q: Optional[str], age_group: Optional[str]):
+        """Row ids matching every query word (AND, prefix match) and the age group, or None for "all rows"."""
+        candidates = None
+        if age_group is not None:
+            candidates = set(self._value_index.get(age_group, ()))
+        for token in tokenize(q or ""):
+            rows = self._rows_with_prefix(token)
+            candidates = set(rows) if candidates is None else candidates.intersection(rows)
+            if not candidates:
+                break
+        return None if candidates is None else sorted(candidates)
+
+    def query(self, q: Optional[str] = None, age_group: Optional[str] = None, offset: int = 0, limit: Optional[int] = None) -> tuple[dict, int]:
+        """Returns (page as a dict of column lists, total number of matching rows)."""
+        rows = self._matching_rows(q, age_group)
+        total = self.row_count if rows is None else len(rows)
+        end = total if limit is None else min(total, offset + limit)
+        if rows is None:
+            return {name: list(values[offset:end]) for name, values in self.columns.items()}, total
+        page = rows[offset:end]
+        return {name: [values[row_id] for row_id in page] for name, values in self.columns.items()}, total
+
+    def column(self, name: str) -> tuple:
+        return self.columns.get(name, ())
+
+
+class PersonaCatalog:
+    def __init__(self, max_rows: Optional[int], ttl_seconds: float, check_seconds: float):
+        self.max_rows = max_rows
+        self.ttl_seconds = ttl_seconds
+        self.check_seconds = check_seconds
+        self._snapshot: Optional[PersonaSnapshot] = None
+        self._load_lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._counters = {"loads": 0, "shared_loads": 0, "load_errors": 0, "queries": 0}
+
+    async def _shared_rows(self, marker) -> Optional[tuple[dict, float]]:
+        """(data, loaded_at) published by another worker for this table version, if any."""
+        entry = await asyncio.to_thread(shared_cache.get, _SHARED_NAMESPACE, _SHARED_KEY)
+        if entry is None:
+            return None
+        value, created_at, _ = entry
+        if value["max_rows"] != self.max_rows or (marker is not None and value["marker"] != str(marker)):
+            return None
+        return value["data"], created_at
+
+    async def _fetch_rows(self, marker) -> Optional[tuple[dict, float]]:
+        """
+        Returns (data, loaded_at): the rows another worker already loaded, or a fresh
+        BigQuery query. Only the holder of the load lease queries; the others wait for
+        its result (and query themselves if it does not arrive in time).
+        """
+        shared = await self._shared_rows(marker)
+        if shared is not None:
+            self._counters["shared_loads"] += 1
+            return shared
+        deadline = time.monotonic() + PERSONA_CATALOG_LOAD_LEASE_SECONDS
+        while not await asyncio.to_thread(shared_cache.acquire_lease, _LOAD_LEASE, PERSONA_CATALOG_LOAD_LEASE_SECONDS):
+            if time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(1)
+            shared = await self._shared_rows(marker)
+            if shared is not None:
+                self._counters["shared_loads"] += 1
+                return shared
+        try:
+            data = await bigquery_service.get_persona_data_async(limit=self.max_rows)
+            if data is None:
+                return None
+            loaded_at = time.time()
+            # Values that are not JSON types (dates, decimals) are shared as strings.
+            await asyncio.to_thread(
+                shared_cache.set,
+                _SHARED_NAMESPACE,
+                _SHARED_KEY,
+                {"marker": str(marker) if marker is not None else None, "max_rows": self.max_rows, "data": data},
+                loaded_at + self.ttl_seconds,
+            )
+            return data, loaded_at
+        finally:
+            await asyncio.to_thread(shared_cache.release_lease, _LOAD_LEASE)
+
+    async def _load(self) -> Optional[PersonaSnapshot]:
+        marker = await bigquery_service.get_persona_table_modified_async()
+        rows = await self._fetch_rows(marker)
+        if rows is None:
+            self._counters["load_errors"] += 1
+            return None
+        data, loaded_at = rows
+        # Building the indexes is CPU work proportional to the table; keep it off the loop.
+        with metrics.span("persona_index_build"):
+            snapshot = await asyncio.to_thread(PersonaSnapshot, data, marker, loaded_at)
+        self._snapshot = snapshot
+        self._counters["loads"] += 1
+        return snapshot
+
+    async def get_snapshot(self) -> Optional[PersonaSnapshot]:
+        """Returns the current snapshot, loading it on first use. None if BigQuery is unavailable."""
+        if self._snapshot is not None:
+            return self._snapshot
+        async with self._load_lock:
+            if self._snapshot is not None:
+                return self._snapshot
+            return await self._load()
+
+    async def refresh_if_stale(self) -> None:
+        """Reloads the catalog if the table changed (marker) or the TTL expired."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            await self.get_snapshot()
+            return
+        expired = time.time() - snapshot.loaded_at >= self.ttl_seconds
+        if not expired:
+            marker = await bigquery_service.get_persona_table_modified_async()
+            if marker is None or marker == snapshot.marker:
+                return
+        async with self._load_lock:
+            if self._snapshot is snapshot:
+                # On failure the previous snapshot keeps being served.
+                await self._load()
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                await self.refresh_if_stale()
+            except Exception as e:
+                print(f"Warning: persona catalog refresh failed: {e}")
+            await asyncio.sleep(self.check_seconds)
+
+    def start(self) -> None:
+        """Starts the background load/refresh task (from the application lifespan)."""
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+            self._refresh_task = None
+
+    async def query(self, q: Optional[str] = None, age_group: Optional[str] = None, offset: int = 0, limit: Optional[int] = None) -> Optional[tuple[dict, int]]:
+        snapshot = await self.get_snapshot()
+        if snapshot is None:
+            return None
+        self._counters["queries"] += 1
+        with metrics.span("persona_search"):
+            return snapshot.query(q=q, age_group=age_group, offset=offset, limit=limit)
+
+    def stats(self) -> dict:
+        stats = dict(self._counters)
+        snapshot = self._snapshot
+        stats["rows"] = snapshot.row_count if snapshot else 0
+        stats["age_seconds"] = time.time() - snapshot.loaded_at if snapshot else None
+        return stats
+
+
+persona_catalog = PersonaCatalog(PERSONA_CATALOG_MAX_ROWS, PERSONA_CATALOG_TTL_SECONDS, PERSONA_CATALOG_CHECK_SECONDS)
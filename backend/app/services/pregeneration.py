@@ -0,0 +1,244 @@
+import asyncio
+import collections
+import os
+import time
+from typing import Optional
+from app.services import ad_generation_service, metrics, upstream_scheduler
+from app.services.bulk_jobs import bulk_job_runner
+from app.services.result_cache import make_cache_key, result_cache
+from app.services.shared_cache import shared_cache
+
+# Speculative pre-generation: interactive requests are counted per combination of
+# product, description, persona and variation count (a decayed frequency). While
+# the service is idle, a background task generates creatives for the top-K
+# combinations that are not cached (or about to expire) at bulk priority, within
+# an hourly budget, so popular requests are served from the result cache.
+# With several worker processes only the holder of the "pregeneration" lease runs
+# passes (so the budget is not multiplied); it ranks combinations by the requests
+# it served itself, a representative sample when traffic is spread evenly.
+PREGENERATION_ENABLED = os.getenv("PREGENERATION_ENABLED", "false").lower() == "true"
+PREGENERATION_TOP_K = int(os.getenv("PREGENERATION_TOP_K", "10"))
+# Creative sets generated per hour at most (each costs one Gemini and one Imagen call).
+PREGENERATION_MAX_PER_HOUR = int(os.getenv("PREGENERATION_MAX_PER_HOUR", "30"))
+PREGENERATION_INTERVAL_SECONDS = float(os.getenv("PREGENERATION_INTERVAL_SECONDS", "30"))
+# Idle means every upstream lane is below this load (in flight + queued / max concurrency)
+# and no bulk job is running.
+PREGENERATION_MAX_LOAD = float(os.getenv("PREGENERATION_MAX_LOAD", "0.5"))
+# A combination must have this (decayed) request count to be pre-generated; the
+# default means "requested more than once recently".
+PREGENERATION_MIN_REQUESTS = float(os.getenv("PREGENERATION_MIN_REQUESTS", "1.5"))
+PREGENERATION_HALF_LIFE_SECONDS = float(os.getenv("PREGENERATION_HALF_LIFE_SECONDS", "3600"))
+# Regenerate cached entries that expire within this many seconds.
+PREGENERATION_REFRESH_SECONDS = float(os.getenv("PREGENERATION_REFRESH_SECONDS", "300"))
+PREGENERATION_MAX_TRACKED = int(os.getenv("PREGENERATION_MAX_TRACKED", "1000"))
+_LEASE = "pregeneration"
+
+pregenerated_total = metrics.registry.register(metrics.Counter(
+    "ad_generator_pregenerated_creatives_total",
+    "Creatives generated ahead of time by the pre-generation worker.",
+    ("outcome",),
+))
+pregenerated_served_total = metrics.registry.register(metrics.Counter(
+    "ad_generator_pregenerated_creatives_served_total",
+    "Creatives served from the result cache that were pre-generated.",
+))
+
+
+class RequestFrequencyTracker:
+    """Exponentially decayed request counts per key, bounded to max_keys (least popular dropped)."""
+
+    def __init__(self, half_life_seconds: float, max_keys: int):
+        self.half_life_seconds = half_life_seconds
+        self.max_keys = max_keys
+        # key -> [score, last update time, request parameters]
+        self._entries: dict[str, list] = {}
+
+    def _decayed(self, score: float, updated_at: float, now: float) -> float:
+        return score * 0.5 ** ((now - updated_at) / self.half_life_seconds)
+
+    def record(self, key: str, params: dict, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        entry = self._entries.get(key)
+        if entry is None:
+            if len(self._entries) >= self.max_keys:
+                self._evict(now)
+            self._entries[key] = [1.0, now, params]
+        else:
+            entry[0] = self._decayed(entry[0], entry[1], now) + 1.0
+            entry[1] = now
+
+    def _evict(self, now: float) -> None:
+        # Drop the least popular tenth in one go so eviction stays rare.
+        ranked = sorted(self._entries, key=lambda key: self._decayed(*self._entries[key][:2], now))
+        for key in ranked[:max(1, self.max_keys // 10)]:
+            del self._entries[key]
+
+    def top(self, k: int, min_score: float = 0.0, now: Optional[float] = None) -> list[tuple[str, dict, float]]:
+        """The k most requested keys as (key, params, score), most popular first."""
+        now = time.time() if now is None else now
+        scored = [(key, params, self._decayed(score, updated_at, now)) for key, (score, updated_at, params) in self._entries.items()]
+        scored = [item for item in scored if item[2] >= min_score]
+        scored.sort(key=lambda item: item[2], reverse=True)
+        return scored[:k]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class Pregenerator:
+    def __init__(self, enabled: bool, top_k: int, max_per_hour: int, interval_seconds: float, max_load: float, min_requests: float, refresh_seconds: float, tracker: RequestFrequencyTracker):
+        self.enabled = enabled
+        self.top_k = top_k
+        self.max_per_hour = max_per_hour
+        self.interval_seconds = interval_seconds
+        self.max_load = max_load
+        self.min_requests = min_requests
+        self.refresh_seconds = refresh_seconds
+        self.tracker = tracker
+        self._generated_at: collections.deque = collections.deque()  # start times within the last hour
+        self._pregenerated: dict[str, int] = {}  # tracking key -> times served since pre-generated
+        self._task: Optional[asyncio.Task] = None
+        self._counters = {
+            "runs": 0,
+            "skipped_busy": 0,
+            "skipped_not_leader": 0,
+            "generated": 0,
+            "generated_creatives": 0,
+            "errors": 0,
+            "served": 0,
+            "served_creatives": 0,
+            "used": 0,
+        }
+
+    @staticmethod
+    def request_key(product: str, product_description: str, persona_description: Optional[str], num_to_generate: int) -> str:
+        return make_cache_key(
+            product=product,
+            product_description=product_description,
+            persona_description=persona_description,
+            number_of_variations=num_to_generate,
+        )
+
+    def record_request(self, product: str, product_description: str, persona_description: Optional[str], num_to_generate: int, cache_hit: bool) -> None:
+        """Counts an interactive request (batched or streaming, not bypass_cache) and whether it hit the cache."""
+        if not self.enabled:
+            return
+        key = self.request_key(product, product_description, persona_description, num_to_generate)
+        self.tracker.record(key, {
+            "product": product,
+            "product_description": product_description,
+            "persona_description": persona_description,
+            "number_of_variations": num_to_generate,
+        })
+        if cache_hit and key in self._pregenerated:
+            if self._pregenerated[key] == 0:
+                self._counters["used"] += 1
+            self._pregenerated[key] += 1
+            self._counters["served"] += 1
+            self._counters["served_creatives"] += num_to_generate
+            pregenerated_served_total.inc(num_to_generate)
+
+    def _is_idle(self) -> bool:
+        return upstream_scheduler.max_load() < self.max_load and bulk_job_runner.stats()["active_jobs"] == 0
+
+    def _budget_left(self) -> int:
+        cutoff = time.monotonic() - 3600
+        while self._generated_at and self._generated_at[0] < cutoff:
+            self._generated_at.popleft()
+        return self.max_per_hour - len(self._generated_at)
+
+    async def _needs_generation(self, params: dict) -> bool:
+        gemini_prompt_text, imagen_prompt_text = ad_generation_service.build_prompts(
+            params["product"], params["product_description"], params["persona_description"], params["number_of_variations"]
+        )
+        cache_key = ad_generation_service.creative_cache_key(gemini_prompt_text, imagen_prompt_text, params["number_of_variations"])
+        remaining = await result_cache.ttl(cache_key)
+        return remaining is None or remaining < self.refresh_seconds
+
+    async def _generate(self, key: str, params: dict) -> None:
+        self._generated_at.append(time.monotonic())
+        try:
+            # Bulk priority: interactive requests keep going ahead in the upstream lanes.
+            with upstream_scheduler.use_priority(upstream_scheduler.PRIORITY_BULK):
+                await ad_generation_service.generate_creatives(
+                    params["product"],
+                    params["product_description"],
+                    params["persona_description"],
+                    params["number_of_variations"],
+                    bypass_cache=True,
+                )
+        except Exception as e:
+            self._counters["errors"] += 1
+            pregenerated_total.inc(params["number_of_variations"], outcome="error")
+            print(f"Warning: pre-generation failed: {e}")
+            return
+        self._pregenerated[key] = 0
+        if len(self._pregenerated) > self.tracker.max_keys:
+            self._pregenerated.pop(next(iter(self._pregenerated)))
+        self._counters["generated"] += 1
+        self._counters["generated_creatives"] += params["number_of_variations"]
+        pregenerated_total.inc(params["number_of_variations"], outcome="ok")
+
+    async def run_once(self) -> int:
+        """One pass over the top-K combinations. Returns the number of creative sets generated."""
+        # The lease outlives a couple of missed passes, so leadership only moves when a worker stops.
+        if not await asyncio.to_thread(shared_cache.acquire_lease, _LEASE, self.interval_seconds * 3):
+            self._counters["skipped_not_leader"] += 1
+            return 0
+        self._counters["runs"] += 1
+        generated = 0
+        for key, params, _ in self.tracker.top(self.top_k, min_score=self.min_requests):
+            if self._budget_left() <= 0:
+                break
+            if not self._is_idle():
+                self._counters["skipped_busy"] += 1
+                break
+            if not await self._needs_generation(params):
+                continue
+            # Renew the lease: a long pass must not let another worker start one too.
+            if not await asyncio.to_thread(shared_cache.acquire_lease, _LEASE, self.interval_seconds * 3):
+                break
+            await self._generate(key, params)
+            generated += 1
+        return generated
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Warning: pre-generation pass failed: {e}")
+
+    def start(self) -> None:
+        """Starts the background worker (from the application lifespan) if enabled."""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            await asyncio.to_thread(shared_cache.release_lease, _LEASE)
+
+    def stats(self) -> dict:
+        stats = dict(self._counters)
+        stats["enabled"] = self.enabled
+        stats["tracked_combinations"] = len(self.tracker)
+        stats["budget_left_this_hour"] = self._budget_left()
+        generated = stats["generated"]
+        stats["used_ratio"] = stats["used"] / generated if generated else 0.0
+        return stats
+
+
+pregenerator = Pregenerator(
+    enabled=PREGENERATION_ENABLED,
+    top_k=PREGENERATION_TOP_K,
+    max_per_hour=PREGENERATION_MAX_PER_HOUR,
+    interval_seconds=PREGENERATION_INTERVAL_SECONDS,
+    max_load=PREGENERATION_MAX_LOAD,
+    min_requests=PREGENERATION_MIN_REQUESTS,
+    refresh_seconds=PREGENERATION_REFRESH_SECONDS,
+    tracker=RequestFrequencyTracker(PREGENERATION_HALF_LIFE_SECONDS, PREGENERATION_MAX_TRACKED),
+)
@@ -1,7 +1,14 @@
 # from app.models.ad_models import CustomerType # Removed CustomerType import
 from typing import Optional
 
-def get_gemini_prompt(product: str, product_description: str, persona_description: Optional[str] = None, number_of_variations: int = 1) -> str: # Removed customer_type
+def _variation_instruction(variation_index: Optional[int]) -> str:
+    # Used when each variation is generated by its own call (per-variation mode),
+    # so independent calls still aim for different creative angles.
+    if variation_index is None:
+        return ""
+    return f"This is variation #{variation_index + 1} of the ad: take a distinct creative angle (headline, hook and emphasis) from other variations. "
+
+def get_gemini_prompt(product: str, product_description: str, persona_description: Optional[str] = None, number_of_variations: int = 1, variation_index: Optional[int] = None) -> str: # Removed customer_type
     markdown_format_instruction = (
         "Format the output as markdown. It should include a compelling title (H2 level, e.g., '## Title') "
         "followed by 4-5 paragraphs of detailed and engaging content. Make the copy attractive and persuasive to encourage purchase."
@@ -20,12 +27,13 @@ def get_gemini_prompt(product: str, product_description: str, persona_descriptio
         f"{f'Tailor the message for the following Target Persona: {persona_description}. ' if persona_description else 'The ad should be generally appealing. '}"
         f"Focus on highlighting benefits and encouraging engagement. "
         f"Ensure each variation is unique if multiple are requested. "
+        f"{_variation_instruction(variation_index)}"
         f"{output_only_instruction} " # Added instruction here
         f"Tone: Persuasive, engaging, and aligned with the product and persona. "
         f"{markdown_format_instruction if number_of_variations <=1 else 'Format each variation as markdown, including a compelling title (H2 level, e.g., ## Title) followed by 4-5 sentences of detailed and engaging content. Make the copy attractive and persuasive to encourage purchase.'}"
     )
 
-def get_imagen_prompt(product: str, product_description: str, persona_description: Optional[str] = None, number_of_variations: int = 1) -> str: # Removed customer_type
+def get_imagen_prompt(product: str, product_description: str, persona_description: Optional[str] = None, number_of_variations: int = 1, variation_index: Optional[int] = None) -> str: # Removed customer_type
     return (
         f"Generate a high-quality advertisement image for the product: '{product}' "
         f"(Description: '{product_description}'). "
@@ -33,4 +41,5 @@ def get_imagen_prompt(product: str, product_description: str, persona_descriptio
         f"The image should showcase the product's best features or the positive experience it offers. "
         f"Style: Clean, modern, visually appealing. No text in image. "
         f"If generating multiple variations, ensure diversity in composition and perspective."
+        f"{' ' + _variation_instruction(variation_index).strip() if variation_index is not None else ''}"
     )
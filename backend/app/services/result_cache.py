@@ -0,0 +1,249 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from app.services.shared_cache import SharedCache, shared_cache
+
+
+def make_cache_key(**parts) -> str:
+    """
+    Content-addressed cache key: a SHA-256 over everything that determines the
+    generated output (final prompt strings, model names, generation config,
+    variation count, ...). Callers pass those as keyword arguments.
+    """
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache for generated ad creatives.
+
+    - Memory tier: bounded LRU (OrderedDict), entries expire after ttl_seconds.
+    - Disk tier (optional): one JSON file per key under disk_dir. Survives
+      restarts; least recently used files are removed beyond disk_max_entries.
+    - Shared tier (optional): the SQLite shared cache, so a creative generated
+      by one worker process is a hit in the others. Checked before the disk tier.
+
+    Values must be JSON serializable. Only the memory tier is touched on the
+    event loop; disk and shared reads/writes run in a worker thread.
+    """
+
+    SHARED_NAMESPACE = "result_cache"
+
+    def __init__(self, max_entries: int = 128, ttl_seconds: float = 3600, disk_dir: str = None, disk_max_entries: int = 2048, enabled: bool = True, shared: SharedCache = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries
+        self.enabled = enabled
+        self.shared = shared if shared is not None and shared.enabled else None
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    # Memory tier
+
+    def _get_memory(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                self._counters["expirations"] += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set_memory(self, key: str, value, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    # Disk tier
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _get_disk(self, key: str):
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        if entry["expires_at"] < time.time():
+            self._remove_disk(path)
+            with self._lock:
+                self._counters["expirations"] += 1
+            return None, None
+        # Bump the mtime so disk eviction is least-recently-used, not oldest-written.
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry["value"], entry["expires_at"]
+
+    def _set_disk(self, key: str, value, expires_at: float) -> None:
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": expires_at, "value": value}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: could not write result cache entry to disk: {e}")
+            self._remove_disk(tmp_path)
+            return
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        try:
+            names = [name for name in os.listdir(self.disk_dir) if name.endswith(".json")]
+        except OSError:
+            return
+        overflow = len(names) - self.disk_max_entries
+        if overflow <= 0:
+            return
+        paths = [os.path.join(self.disk_dir, name) for name in names]
+        paths.sort(key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0)
+        for path in paths[:overflow]:
+            self._remove_disk(path)
+            with self._lock:
+                self._counters["evictions"] += 1
+
+    @staticmethod
+    def _remove_disk(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    # Public API
+
+    async def get(self, key: str):
+        """Returns the cached value for key, or None on a miss."""
+        if not self.enabled:
+            return None
+        value = self._get_memory(key)
+        if value is not None:
+            with self._lock:
+                self._counters["hits"] += 1
+                self._counters["memory_hits"] += 1
+            return value
+        if self.shared:
+            entry = await asyncio.to_thread(self.shared.get, self.SHARED_NAMESPACE, key)
+            if entry is not None:
+                value, _, expires_at = entry
+                self._set_memory(key, value, expires_at)
+                with self._lock:
+                    self._counters["hits"] += 1
+                    self._counters["shared_hits"] += 1
+                return value
+        if self.disk_dir:
+            value, expires_at = await asyncio.to_thread(self._get_disk, key)
+            if value is not None:
+                # Promote to the memory tier for the remainder of its TTL.
+                self._set_memory(key, value, expires_at)
+                with self._lock:
+                    self._counters["hits"] += 1
+                    self._counters["disk_hits"] += 1
+                return value
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    async def set(self, key: str, value) -> None:
+        """Stores value under key in the memory tier (and the shared and disk tiers, if configured)."""
+        if not self.enabled:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        self._set_memory(key, value, expires_at)
+        with self._lock:
+            self._counters["sets"] += 1
+        if self.shared:
+            await asyncio.to_thread(self.shared.set, self.SHARED_NAMESPACE, key, value, expires_at)
+        if self.disk_dir:
+            await asyncio.to_thread(self._set_disk, key, value, expires_at)
+
+    async def delete(self, key: str) -> None:
+        """Removes key from every tier (e.g. a cached value that is no longer usable)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._counters["invalidations"] += 1
+        if self.shared:
+            await asyncio.to_thread(self.shared.delete, self.SHARED_NAMESPACE, key)
+        if self.disk_dir:
+            await asyncio.to_thread(self._remove_disk, self._disk_path(key))
+
+    async def ttl(self, key: str):
+        """
+        Seconds until the entry for key expires, or None if it is not cached.
+        Does not count as a lookup (used by background pre-generation).
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            remaining = entry[0] - time.time()
+            return remaining if remaining > 0 else None
+        if self.shared:
+            shared_entry = await asyncio.to_thread(self.shared.get, self.SHARED_NAMESPACE, key)
+            if shared_entry is not None:
+                return shared_entry[2] - time.time()
+        if self.disk_dir:
+            _, expires_at = await asyncio.to_thread(self._get_disk, key)
+            if expires_at is not None:
+                return expires_at - time.time()
+        return None
+
+    def clear(self) -> None:
+        """Drops every entry from the memory tier (the disk and shared tiers are left alone)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        stats["enabled"] = self.enabled
+        stats["disk_enabled"] = bool(self.disk_dir)
+        stats["shared_enabled"] = self.shared is not None
+        return stats
+
+
+# Process-wide cache for generated creatives, configured from the environment
+# (shared across worker processes when SHARED_CACHE_ENABLED=true).
+result_cache = ResultCache(
+    max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "128")),
+    ttl_seconds=float(os.getenv("RESULT_CACHE_TTL_SECONDS", "3600")),
+    disk_dir=os.getenv("RESULT_CACHE_DIR") or None,
+    disk_max_entries=int(os.getenv("RESULT_CACHE_DISK_MAX_ENTRIES", "2048")),
+    enabled=os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true",
+    shared=shared_cache,
+)
@@ -0,0 +1,217 @@
+import contextlib
+import json
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Optional
+
+# Cross-process cache for running several workers on one instance (see
+# gunicorn_conf.py): a SQLite database in WAL mode on local disk, which every
+# worker process opens. It holds JSON values with an expiry time (the result
+# cache's second tier, persona catalog data) and short leases that let exactly
+# one worker own a piece of background work (a bulk job, pre-generation, the
+# persona load). Disabled by default: with a single worker the in-process
+# state is enough, and every lease is granted.
+SHARED_CACHE_ENABLED = os.getenv("SHARED_CACHE_ENABLED", "false").lower() == "true"
+SHARED_CACHE_DB = os.getenv("SHARED_CACHE_DB") or os.path.join(tempfile.gettempdir(), "ad-generator", "shared_cache.sqlite3")
+SHARED_CACHE_MAX_ENTRIES = int(os.getenv("SHARED_CACHE_MAX_ENTRIES", "4096"))
+# Expired and surplus entries are removed every this many writes.
+_TRIM_EVERY_WRITES = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value_json TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS cache_entries_expires_at ON cache_entries (expires_at);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class SharedCache:
+    """
+    SQLite-backed key/value store shared by the worker processes of one instance.
+    Blocking; call through asyncio.to_thread. Each thread keeps its own connection.
+    """
+
+    def __init__(self, path: str, enabled: bool = True, max_entries: int = 4096):
+        self.path = path
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        # Row count as of the last trim, so stats() (called on the event loop by
+        # /metrics and /api/v1/stats) never queries SQLite.
+        self._entries: Optional[int] = None
+        self._counters = {"hits": 0, "misses": 0, "sets": 0, "errors": 0, "leases_acquired": 0, "leases_denied": 0}
+        if self.enabled:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._connection().executescript(_SCHEMA)
+            self._count_entries()
+
+    @property
+    def owner(self) -> str:
+        """Identifies this worker process as a lease owner."""
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL keeps readers and the (single) writer from blocking each other;
+            # NORMAL sync is durable enough for a cache and much cheaper.
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    # Values
+
+    def get(self, namespace: str, key: str) -> Optional[tuple[object, float, float]]:
+        """Returns (value, created_at, expires_at), or None if missing or expired."""
+        if not self.enabled:
+            return None
+        try:
+            row = self._connection().execute(
+                "SELECT value_json, created_at, expires_at FROM cache_entries WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, key, time.time()),
+            ).fetchone()
+        except sqlite3.Error as e:
+            self._count("errors")
+            print(f"Warning: shared cache read failed: {e}")
+            return None
+        if row is None:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return json.loads(row[0]), row[1], row[2]
+
+    def set(self, namespace: str, key: str, value, expires_at: float) -> None:
+        """Stores a JSON-serializable value until expires_at (a time.time() timestamp)."""
+        if not self.enabled:
+            return
+        value_json = json.dumps(value, default=str)
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries (namespace, key, value_json, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                    (namespace, key, value_json, time.time(), expires_at),
+                )
+        except sqlite3.Error as e:
+            self._count("errors")
+            print(f"Warning: shared cache write failed: {e}")
+            return
+        self._count("sets")
+        with self._lock:
+            self._writes += 1
+            trim = self._writes % _TRIM_EVERY_WRITES == 0
+        if trim:
+            self.trim()
+
+    def delete(self, namespace: str, key: str) -> None:
+        if not self.enabled:
+            return
+        try:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (namespace, key))
+        except sqlite3.Error as e:
+            self._count("errors")
+            print(f"Warning: shared cache delete failed: {e}")
+
+    def trim(self) -> None:
+        """Removes expired entries, then the ones closest to expiry beyond max_entries."""
+        try:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),))
+                conn.execute(
+                    "DELETE FROM cache_entries WHERE rowid IN (SELECT rowid FROM cache_entries ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+        except sqlite3.Error as e:
+            self._count("errors")
+            print(f"Warning: shared cache trim failed: {e}")
+            return
+        self._count_entries()
+
+    def _count_entries(self) -> None:
+        try:
+            entries = self._connection().execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        with self._lock:
+            self._entries = entries
+
+    # Leases
+
+    def acquire_lease(self, name: str, ttl_seconds: float) -> bool:
+        """
+        Takes (or renews) the lease called name for ttl_seconds. True if this process
+        now holds it; False while another live process does. Always True when disabled.
+        """
+        if not self.enabled:
+            return True
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                row = conn.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+                if row is not None and row[0] != self.owner and row[1] > now:
+                    acquired = False
+                else:
+                    conn.execute("INSERT OR REPLACE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)", (name, self.owner, now + ttl_seconds))
+                    acquired = True
+        except sqlite3.Error as e:
+            self._count("errors")
+            print(f"Warning: could not acquire lease {name}: {e}")
+            return False
+        self._count("leases_acquired" if acquired else "leases_denied")
+        return acquired
+
+    def release_lease(self, name: str) -> None:
+        """Gives up the lease if this process holds it."""
+        if not self.enabled:
+            return
+        try:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, self.owner))
+        except sqlite3.Error as e:
+            print(f"Warning: could not release lease {name}: {e}")
+
+    def stats(self) -> dict:
+        """Counters of this process. "entries" is the row count as of the last trim (no I/O here)."""
+        with self._lock:
+            stats = dict(self._counters)
+            if self.enabled:
+                stats["entries"] = self._entries
+        stats["enabled"] = self.enabled
+        return stats
+
+
+shared_cache = SharedCache(SHARED_CACHE_DB, enabled=SHARED_CACHE_ENABLED, max_entries=SHARED_CACHE_MAX_ENTRIES)
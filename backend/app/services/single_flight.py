@@ -0,0 +1,52 @@
+import asyncio
+import os
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into a single upstream call.
+
+    The first caller for a key (the leader) starts the work as a task; callers
+    arriving while it is in flight await the same task and receive the same
+    result, or the same exception. The task is shielded, so a caller that
+    disconnects does not cancel the work for the others.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._in_flight: dict[str, asyncio.Task] = {}
+        self._counters = {"calls": 0, "leaders": 0, "coalesced": 0, "errors": 0}
+
+    async def do(self, key: str, factory):
+        """Runs factory() (a coroutine function) once per key among concurrent callers."""
+        self._counters["calls"] += 1
+        if not self.enabled:
+            self._counters["leaders"] += 1
+            return await factory()
+
+        task = self._in_flight.get(key)
+        if task is None:
+            self._counters["leaders"] += 1
+            task = asyncio.create_task(factory())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._on_done(key, t))
+        else:
+            self._counters["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def _on_done(self, key: str, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled() and task.exception() is not None:
+            # Counted once per upstream failure; every waiter still receives it.
+            self._counters["errors"] += 1
+
+    def stats(self) -> dict:
+        stats = dict(self._counters)
+        stats["in_flight"] = len(self._in_flight)
+        stats["enabled"] = self.enabled
+        return stats
+
+
+# Coalesces identical creative generations (same prompt/cache key) within this process.
+generation_flights = SingleFlight(enabled=os.getenv("COALESCE_REQUESTS", "true").lower() == "true")
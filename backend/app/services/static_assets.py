@@ -0,0 +1,194 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import sys
+import time
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip variants are served
+    brotli = None
+
+# In-memory catalog of the React build (app/static): every file is read once at
+# startup together with its gzip / brotli variants, so serving the frontend costs
+# no disk access, no per-request compression and (with ETags) no re-sending of
+# bundles the browser already has. Variants built ahead of time (file.js.gz /
+# file.js.br next to file.js, see the __main__ block below) are used as-is;
+# missing ones are compressed at load time.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static")
+
+# create-react-app puts a content hash in every file name under static/, so those
+# URLs never change content and can be cached for a year. Everything else
+# (index.html, manifest.json, ...) must be revalidated (cheap with ETags).
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+_HASHED_NAME = re.compile(r"\.[0-9a-f]{8,}\.")
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml", "application/manifest+json")
+MIN_COMPRESS_BYTES = 1024
+_PRECOMPRESSED_SUFFIXES = {".gz": "gzip", ".br": "br"}
+
+PLACEHOLDER_HTML = b"<html><body><h1>FastAPI Backend Running</h1><p>React frontend not built or integrated yet.</p></body></html>"
+
+mimetypes.add_type("application/javascript", ".js")
+mimetypes.add_type("application/json", ".map")
+mimetypes.add_type("application/manifest+json", ".webmanifest")
+
+
+def _is_compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def _compress(data: bytes, encoding: str, build_time: bool = False) -> Optional[bytes]:
+    if encoding == "gzip":
+        # mtime=0 keeps the output (and thus the ETag) stable across restarts
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == "br" and brotli is not None:
+        # Quality 11 is slow; at startup a lower quality keeps boot fast.
+        return brotli.compress(data, quality=11 if build_time else 5)
+    return None
+
+
+class StaticAsset:
+    def __init__(self, path: str, body: bytes, content_type: str, cache_control: str):
+        self.path = path
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.etag_base = hashlib.sha256(body).hexdigest()[:32]
+        # encoding ("identity", "br", "gzip") -> bytes
+        self.variants: dict[str, bytes] = {"identity": body}
+
+    def add_variant(self, encoding: str, data: Optional[bytes]) -> None:
+        # Only worth keeping if it is actually smaller
+        if data is not None and len(data) < len(self.variants["identity"]):
+            self.variants[encoding] = data
+
+    def etag(self, encoding: str) -> str:
+        return f'"{self.etag_base}"' if encoding == "identity" else f'"{self.etag_base}-{encoding}"'
+
+    def etags(self) -> list[str]:
+        return [self.etag(encoding) for encoding in self.variants]
+
+    def size(self) -> int:
+        return sum(len(data) for data in self.variants.values())
+
+
+def _accepted_encodings(accept_encoding: str) -> set:
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            accepted.add(name)
+    return accepted
+
+
+def choose_encoding(asset: StaticAsset, accept_encoding: Optional[str]) -> str:
+    """Picks the smallest representation the client accepts (brotli, then gzip, then identity)."""
+    if not accept_encoding:
+        return "identity"
+    accepted = _accepted_encodings(accept_encoding)
+    for encoding in ("br", "gzip"):
+        if encoding in asset.variants and (encoding in accepted or "*" in accepted):
+            return encoding
+    return "identity"
+
+
+class StaticAssetCatalog:
+    def __init__(self, root: str):
+        self.root = root
+        self._assets: dict[str, StaticAsset] = {}
+        self.index: StaticAsset = StaticAsset("index.html", PLACEHOLDER_HTML, "text/html; charset=utf-8", REVALIDATE_CACHE_CONTROL)
+        self.load_seconds = None
+
+    def _load_file(self, relative_path: str, full_path: str) -> StaticAsset:
+        with open(full_path, "rb") as f:
+            body = f.read()
+        content_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+            content_type += "; charset=utf-8"
+        hashed = relative_path.startswith("static/") and _HASHED_NAME.search(os.path.basename(relative_path))
+        asset = StaticAsset(relative_path, body, content_type, IMMUTABLE_CACHE_CONTROL if hashed else REVALIDATE_CACHE_CONTROL)
+        if _is_compressible(content_type) and len(body) >= MIN_COMPRESS_BYTES:
+            for suffix, encoding in _PRECOMPRESSED_SUFFIXES.items():
+                precompressed = full_path + suffix
+                if os.path.exists(precompressed):
+                    with open(precompressed, "rb") as f:
+                        asset.add_variant(encoding, f.read())
+                else:
+                    asset.add_variant(encoding, _compress(body, encoding))
+        return asset
+
+    def load(self) -> None:
+        """Reads (and compresses) the whole build directory. Blocking; run it off the event loop."""
+        started = time.perf_counter()
+        assets = {}
+        if os.path.isdir(self.root):
+            for directory, _, files in os.walk(self.root):
+                for name in files:
+                    if os.path.splitext(name)[1] in _PRECOMPRESSED_SUFFIXES or name.startswith("."):
+                        continue
+                    full_path = os.path.join(directory, name)
+                    relative_path = os.path.relpath(full_path, self.root).replace(os.sep, "/")
+                    try:
+                        assets[relative_path] = self._load_file(relative_path, full_path)
+                    except OSError as e:
+                        print(f"Warning: could not load static file {full_path}: {e}")
+        self._assets = assets
+        if "index.html" in assets:
+            self.index = assets["index.html"]
+        self.load_seconds = time.perf_counter() - started
+
+    def get(self, path: str) -> Optional[StaticAsset]:
+        return self._assets.get(path.lstrip("/"))
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self._assets),
+            "bytes_in_memory": sum(asset.size() for asset in self._assets.values()),
+            "brotli_available": brotli is not None,
+            "load_seconds": self.load_seconds,
+        }
+
+
+static_assets = StaticAssetCatalog(os.getenv("STATIC_DIR", STATIC_DIR))
+
+
+def precompress_directory(root: str) -> int:
+    """Writes .gz (and, with brotli installed, .br) files next to every compressible file. Returns the count written."""
+    written = 0
+    for directory, _, files in os.walk(root):
+        for name in files:
+            if os.path.splitext(name)[1] in _PRECOMPRESSED_SUFFIXES:
+                continue
+            full_path = os.path.join(directory, name)
+            content_type = mimetypes.guess_type(full_path)[0] or ""
+            if not _is_compressible(content_type) or os.path.getsize(full_path) < MIN_COMPRESS_BYTES:
+                continue
+            with open(full_path, "rb") as f:
+                body = f.read()
+            for suffix, encoding in _PRECOMPRESSED_SUFFIXES.items():
+                data = _compress(body, encoding, build_time=True)
+                if data is not None and len(data) < len(body):
+                    with open(full_path + suffix, "wb") as f:
+                        f.write(data)
+                    written += 1
+    return written
+
+
+if __name__ == "__main__":
+    # Build-time precompression (used by the Dockerfile):
+    #   python -m app.services.static_assets [directory]
+    target = sys.argv[1] if len(sys.argv) > 1 else STATIC_DIR
+    count = precompress_directory(target)
+    print(f"Wrote {count} precompressed files under {target}" + ("" if brotli else " (brotli not installed: gzip only)"))
@@ -0,0 +1,254 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import os
+import random
+import time
+from contextvars import ContextVar
+from app.services import metrics
+
+# Lower value = served first. Interactive requests (the UI) go ahead of bulk jobs.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+# Priority of upstream calls made from the current task. Set it with use_priority();
+# context variables propagate into tasks created from the current one.
+current_priority: ContextVar[int] = ContextVar("upstream_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextlib.contextmanager
+def use_priority(priority: int):
+    """Runs the enclosed upstream calls at the given priority."""
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+def is_quota_error(error: Exception) -> bool:
+    """True for Vertex AI 429 / RESOURCE_EXHAUSTED / quota errors (google.api_core or plain messages)."""
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    message = str(error).lower()
+    return "429" in message or "resource exhausted" in message or "resource_exhausted" in message or "quota" in message
+
+
+class UpstreamLane:
+    """
+    Admission control for one upstream model.
+
+    - at most max_concurrency calls in flight,
+    - at most requests_per_minute call starts (token bucket, 0 = unlimited),
+    - waiting calls are admitted by priority, then arrival order,
+    - on a quota error the lane pauses for a jittered exponential backoff and the
+      call is queued again, up to max_attempts in total.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float, max_concurrency: int, max_attempts: int = 4, backoff_base_seconds: float = 1.0, backoff_max_seconds: float = 30.0):
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+
+        self._active = 0
+        self._waiters: list = []  # heap of (priority, sequence, future)
+        self._sequence = itertools.count()
+        self._tokens = float(max(1, max_concurrency))
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._wakeup = None
+        self._counters = {
+            "started": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "retries": 0,
+            "quota_errors": 0,
+        }
+        self._wait_count = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    # Admission
+
+    def _refill(self, now: float) -> None:
+        if self.requests_per_minute <= 0:
+            return
+        capacity = float(max(1, self.max_concurrency))
+        self._tokens = min(capacity, self._tokens + (now - self._last_refill) * self.requests_per_minute / 60.0)
+        self._last_refill = now
+
+    def _next_start_delay(self, now: float) -> float:
+        """Seconds until a call may start (0 if one may start now), ignoring concurrency."""
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self.requests_per_minute <= 0:
+            return 0.0
+        self._refill(now)
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) * 60.0 / self.requests_per_minute
+
+    def _take_slot(self) -> None:
+        self._active += 1
+        if self.requests_per_minute > 0:
+            self._tokens -= 1
+
+    def _dispatch(self) -> None:
+        self._wakeup = None
+        while self._waiters and self._active < self.max_concurrency:
+            _, _, future = self._waiters[0]
+            if future.done():  # cancelled while queued
+                heapq.heappop(self._waiters)
+                continue
+            delay = self._next_start_delay(time.monotonic())
+            if delay > 0:
+                self._wakeup = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self._take_slot()
+            future.set_result(None)
+
+    async def _acquire(self, priority: int) -> None:
+        queued_at = time.monotonic()
+        if not self._waiters and self._active < self.max_concurrency and self._next_start_delay(queued_at) == 0:
+            self._take_slot()
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+            if self._wakeup is None:
+                self._dispatch()
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Granted a slot at the same moment we were cancelled: give it back.
+                    self._release()
+                raise
+        waited = time.monotonic() - queued_at
+        self._wait_count += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        metrics.observe_stage("upstream_queue", waited, model=self.name)
+
+    def _release(self) -> None:
+        self._active -= 1
+        if self._wakeup is None:
+            self._dispatch()
+
+    def _pause_for_backoff(self, attempt: int) -> None:
+        ceiling = min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** (attempt - 1)))
+        delay = random.uniform(ceiling / 2, ceiling)
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+
+    # Public API
+
+    def _release_after_call(self, call: asyncio.Future) -> None:
+        if not call.cancelled():
+            call.exception()  # retrieved, so an abandoned call's error is not reported as unhandled
+        self._release()
+
+    async def submit(self, factory, priority: int = None, blocking: bool = False):
+        """
+        Runs factory() (a coroutine function performing one upstream call) under the
+        lane's limits, retrying on quota errors. Other errors are raised unchanged.
+
+        Set blocking when factory runs a blocking call on a thread pool: such a call
+        cannot be interrupted, so if the caller is cancelled once it has started, the
+        call runs to completion and keeps its slot until it returns.
+        """
+        if priority is None:
+            priority = current_priority.get()
+        attempt = 0
+        while True:
+            attempt += 1
+            await self._acquire(priority)
+            self._counters["started"] += 1
+            release = True
+            try:
+                if blocking:
+                    call = asyncio.ensure_future(factory())
+                    try:
+                        result = await asyncio.shield(call)
+                    except asyncio.CancelledError:
+                        if not call.done():
+                            release = False
+                            call.add_done_callback(self._release_after_call)
+                        raise
+                else:
+                    result = await factory()
+            except Exception as e:
+                if not is_quota_error(e):
+                    self._counters["failed"] += 1
+                    raise
+                self._counters["quota_errors"] += 1
+                self._pause_for_backoff(attempt)
+                if attempt >= self.max_attempts:
+                    self._counters["failed"] += 1
+                    raise
+                self._counters["retries"] += 1
+                print(f"Warning: {self.name} quota error (attempt {attempt}/{self.max_attempts}), backing off: {e}")
+                continue
+            finally:
+                if release:
+                    self._release()
+            self._counters["succeeded"] += 1
+            return result
+
+    def load(self) -> float:
+        """Calls in flight plus queued, relative to max_concurrency (1.0 = saturated)."""
+        queued = sum(1 for _, _, future in self._waiters if not future.done())
+        return (self._active + queued) / max(1, self.max_concurrency)
+
+    def stats(self) -> dict:
+        stats = dict(self._counters)
+        stats.update({
+            "queue_depth": sum(1 for _, _, future in self._waiters if not future.done()),
+            "active": self._active,
+            "requests_per_minute": self.requests_per_minute,
+            "max_concurrency": self.max_concurrency,
+            "paused_seconds": max(0.0, self._paused_until - time.monotonic()),
+            "wait_count": self._wait_count,
+            "wait_seconds_avg": self._wait_total / self._wait_count if self._wait_count else 0.0,
+            "wait_seconds_max": self._wait_max,
+        })
+        return stats
+
+
+def _lane_from_env(name: str, prefix: str, default_rpm: str, default_concurrency: str) -> UpstreamLane:
+    return UpstreamLane(
+        name,
+        requests_per_minute=float(os.getenv(f"{prefix}_REQUESTS_PER_MINUTE", default_rpm)),
+        max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", default_concurrency)),
+        max_attempts=int(os.getenv("UPSTREAM_MAX_ATTEMPTS", "4")),
+        backoff_base_seconds=float(os.getenv("UPSTREAM_BACKOFF_BASE_SECONDS", "1.0")),
+        backoff_max_seconds=float(os.getenv("UPSTREAM_BACKOFF_MAX_SECONDS", "30.0")),
+    )
+
+
+# One lane per upstream model, shared by every request in this process. The
+# default limits are repeated in gunicorn_conf.py (split between workers there).
+lanes = {
+    "gemini": _lane_from_env("gemini", "GEMINI", "60", "8"),
+    "imagen": _lane_from_env("imagen", "IMAGEN", "20", "4"),
+}
+
+
+async def submit(lane: str, factory, priority: int = None, blocking: bool = False):
+    """Runs factory() through the named lane ("gemini" or "imagen"), see UpstreamLane.submit."""
+    return await lanes[lane].submit(factory, priority=priority, blocking=blocking)
+
+
+def max_load() -> float:
+    """The highest load() across lanes; background work uses it to detect idle periods."""
+    return max(lane.load() for lane in lanes.values())
+
+
+def stats() -> dict:
+    return {name: lane.stats() for name, lane in lanes.items()}
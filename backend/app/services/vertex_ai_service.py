@@ -1,32 +1,17 @@
-import vertexai
-from vertexai.generative_models import GenerativeModel, GenerationConfig, Part
-from vertexai.vision_models import ImageGenerationModel # Corrected import
 import os
-import base64 # Added for base64 encoding
 from dotenv import load_dotenv
-import google.cloud.logging # Import the logging library
 
 # Load environment variables from .env file for local development
 load_dotenv()
 
-# Initialize Vertex AI SDK
-# These will be automatically picked up if running on GCP (e.g. Cloud Run)
+# The Vertex AI SDK, the model handles and the Cloud Logging logger are created
+# lazily (once per process) by the client registry, see app/services/clients.py.
+# PROJECT_ID / LOCATION are picked up automatically on GCP (e.g. Cloud Run)
 # or can be set in the environment for local testing.
-PROJECT_ID = os.getenv("GCP_PROJECT_ID")
-LOCATION = os.getenv("GCP_REGION", "us-central1")
-
-# Initialize Google Cloud Logging client
-logging_client = google.cloud.logging.Client(project=PROJECT_ID)
-# The name of the log to write to
-# You can choose a name that makes sense for your application
-log_name = "gemini-imagen-prompts"
-# Selects the log to write to
-logger = logging_client.logger(log_name)
-
-if PROJECT_ID:
-    vertexai.init(project=PROJECT_ID, location=LOCATION)
-else:
-    print("Warning: GCP_PROJECT_ID not set. Vertex AI calls may fail if not running in a GCP environment with default credentials.")
+from app.services import clients, executors, image_renditions, metrics, upstream_scheduler
+from app.services.audit_log import AUDIT_LOG_SINK, audit_logger
+from app.services.image_store import image_store
+from app.services.clients import PROJECT_ID
 
 import re # Added for parsing Gemini response
 
@@ -35,12 +20,53 @@ GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-2.0-flash") # Using a
 IMAGEN_MODEL_NAME = os.getenv("IMAGEN_MODEL_NAME", "imagen-3.0-generate-002") # Updated to a common Imagen model version
 
 
-generation_config = GenerationConfig(
+# Passed as a plain dict (accepted by generate_content) so this module does not
+# need to import the Vertex AI SDK at startup.
+generation_config = dict(
             temperature=1.5,
             top_p=0.9,
             max_output_tokens=2048,
         )
 
+def warm_up_clients(include_bigquery: bool = True) -> None:
+    """Creates the model and logger handles used by this module ahead of the first request."""
+    clients.warm_up(
+        GEMINI_MODEL_NAME,
+        IMAGEN_MODEL_NAME,
+        include_bigquery=include_bigquery,
+        include_prompt_logger=AUDIT_LOG_SINK == "cloud_logging",
+    )
+
+def _call_imagen(prompt: str, aspect_ratio: str, number_of_images: int):
+    """Single blocking Imagen request; raises on API errors (quota errors included)."""
+    model = clients.get_imagen_model(IMAGEN_MODEL_NAME)
+    # Imagen's generate_images can take number_of_images directly
+    return model.generate_images(
+        prompt=prompt,
+        number_of_images=number_of_images, 
+        aspect_ratio=aspect_ratio,
+        # output_file_format="png", # Recommended
+        # safety_filter_level="block_most", # Example
+    )
+
+def _get_gemini_model():
+    """Returns the shared Gemini model. Blocks only while the handle is first created."""
+    return clients.get_gemini_model(GEMINI_MODEL_NAME)
+
+class GenerationError(str):
+    """
+    A text or image slot that could not be generated. It is still a str (the error
+    message, which is logged and reported to clients), but callers recognise
+    failures by type with is_generation_error() rather than by matching the text.
+    """
+
+
+def is_generation_error(value) -> bool:
+    return isinstance(value, GenerationError)
+
+def _has_errors(results: list[str]) -> bool:
+    return not results or any(is_generation_error(result) for result in results)
+
 def parse_gemini_list_response(text_response: str, num_variations: int) -> list[str]:
     """
     Parses a text response that is expected to be a numbered list.
@@ -76,86 +102,191 @@ def parse_gemini_list_response(text_response: str, num_variations: int) -> list[
     # If we have more items than requested, truncate. If fewer, the caller must handle.
     return items[:num_variations] if items else []
 
-def generate_ad_text_with_gemini(prompt: str, num_variations: int = 1) -> list[str]:
-    """Generates ad text using the Gemini model. Expects a list of strings if num_variations > 1."""
+def ad_texts_from_raw_text(raw_text: str, num_variations: int) -> list[str]:
+    """Splits the raw Gemini output into num_variations ad texts (or error strings)."""
+    if num_variations > 1:
+        parsed_texts = parse_gemini_list_response(raw_text, num_variations)
+        if len(parsed_texts) == num_variations:
+            return parsed_texts
+        elif parsed_texts: # Got some, but not all
+             print(f"Warning: Expected {num_variations} ad texts, but parsed {len(parsed_texts)}. Response: {raw_text}")
+             # Pad with error messages or handle as per requirements
+             # For now, return what was parsed, router might need to check length
+             return parsed_texts 
+        else: # Parsing failed completely
+            print(f"Error: Failed to parse {num_variations} ad texts from Gemini response: {raw_text}")
+            return [GenerationError(f"Error: Could not parse {num_variations} ad texts from response.") for _ in range(num_variations)]
+    else: # Single variation requested
+        if not raw_text.strip():
+            return [GenerationError("Error: Gemini returned an empty response.")]
+        return [raw_text.strip()]
+
+def _ad_texts_from_gemini_response(response, num_variations: int) -> list[str]:
+    """Extracts the list of ad texts from a Gemini response (shared by the sync and async paths)."""
+    if response.candidates and response.candidates[0].content.parts:
+        raw_text = response.candidates[0].content.parts[0].text
+        return ad_texts_from_raw_text(raw_text, num_variations)
+    else:
+        print(f"Gemini response did not contain expected text: {response}")
+        return [GenerationError(f"Sorry, I couldn't generate ad text for {num_variations} variations at this moment.") for _ in range(num_variations)]
+
+def _store_imagen_image(response, index: int) -> str:
+    """Stores one image of an Imagen response and returns its URL (or a GenerationError). Blocking."""
+    image = response.images[index]
+    if not image._image_bytes:
+        print(f"Warning: Image {index+1} from Imagen response did not contain image bytes. Image object: {image}")
+        return GenerationError("Error: Image generation failed for this item (no bytes).")
+    digest = image_store.put(image._image_bytes, "image/png")
+    return image_store.url_for(digest)
+
+def _image_data_from_imagen_response(response, number_of_images: int) -> list[str]:
+    """
+    Stores the images of an Imagen response in the image store and returns their
+    URLs (or error strings). Blocking (image store I/O).
+    """
+    image_data_list = []
+    if response.images:
+        for i in range(min(number_of_images, len(response.images))): # Ensure we don't go out of bounds
+            image_data_list.append(_store_imagen_image(response, i))
+        
+        # If fewer images were returned than requested
+        if len(image_data_list) < number_of_images:
+            print(f"Warning: Requested {number_of_images} images, but Imagen returned {len(response.images)}.")
+            # Pad with error messages for the missing images
+            for _ in range(number_of_images - len(image_data_list)):
+                image_data_list.append(GenerationError("Error: Image not generated for this item (fewer returned than requested)."))
+        return image_data_list
+    else:
+        error_message = "Imagen response did not contain any images."
+        print(error_message)
+        return [GenerationError("Error: Image generation failed or no images returned.") for _ in range(number_of_images)]
+
+async def generate_ad_text_with_gemini_async(prompt: str, num_variations: int = 1) -> list[str]:
+    """
+    Generates ad text using the Gemini model. Expects a list of strings if
+    num_variations > 1. Uses the SDK's native async client so the event loop is
+    never blocked while waiting on Gemini. The call
+    goes through the "gemini" upstream scheduler lane (rate limits, priority,
+    retry on quota errors).
+    """
     if not PROJECT_ID:
-        return [f"Error: GCP_PROJECT_ID not configured. Cannot call Gemini for {num_variations} variations."]
+        return [GenerationError(f"Error: GCP_PROJECT_ID not configured. Cannot call Gemini for {num_variations} variations.") for _ in range(num_variations)]
     try:
-        # Log the prompt
-        logger.log_text(f"Gemini Prompt: {prompt}")
-        model = GenerativeModel(GEMINI_MODEL_NAME)
-        response = model.generate_content([prompt], generation_config=generation_config)
-        
-        if response.candidates and response.candidates[0].content.parts:
-            raw_text = response.candidates[0].content.parts[0].text
-            if num_variations > 1:
-                parsed_texts = parse_gemini_list_response(raw_text, num_variations)
-                if len(parsed_texts) == num_variations:
-                    return parsed_texts
-                elif parsed_texts: # Got some, but not all
-                     print(f"Warning: Expected {num_variations} ad texts, but parsed {len(parsed_texts)}. Response: {raw_text}")
-                     # Pad with error messages or handle as per requirements
-                     # For now, return what was parsed, router might need to check length
-                     return parsed_texts 
-                else: # Parsing failed completely
-                    print(f"Error: Failed to parse {num_variations} ad texts from Gemini response: {raw_text}")
-                    return [f"Error: Could not parse {num_variations} ad texts from response." for _ in range(num_variations)]
-            else: # Single variation requested
-                return [raw_text.strip()]
-        else:
-            print(f"Gemini response did not contain expected text: {response}")
-            return [f"Sorry, I couldn't generate ad text for {num_variations} variations at this moment." for _ in range(num_variations)]
+        # Queue the prompt for the audit log (no I/O here) and fetch the model
+        # (may block on first use, so it runs on the pool)
+        await audit_logger.record_async("gemini_prompt", model=GEMINI_MODEL_NAME, prompt=prompt)
+        model = await executors.run_blocking("vertex_ai", _get_gemini_model)
+        with metrics.span("gemini", model=GEMINI_MODEL_NAME, variations=num_variations) as span:
+            response = await upstream_scheduler.submit(
+                "gemini",
+                lambda: model.generate_content_async([prompt], generation_config=generation_config),
+            )
+            ad_texts = _ad_texts_from_gemini_response(response, num_variations)
+            if _has_errors(ad_texts):
+                span.outcome = "error"
+        await audit_logger.record_async("gemini_response", model=GEMINI_MODEL_NAME, ad_texts=ad_texts)
+        return ad_texts
     except Exception as e:
         print(f"Error calling Gemini API: {e}")
-        return [f"Error generating ad text for {num_variations} variations: {e}" for _ in range(num_variations)]
+        return [GenerationError(f"Error generating ad text for {num_variations} variations: {e}") for _ in range(num_variations)]
 
-def generate_ad_image_with_imagen(prompt: str, aspect_ratio: str = "1:1", number_of_images: int = 1) -> list[str]:
+async def stream_ad_text_with_gemini_async(prompt: str):
     """
-    Generates ad images using the Imagen model and returns a list of base64 encoded data URIs.
+    Async generator yielding chunks of Gemini output as they arrive (streaming API).
+    Unlike the non-streaming functions, errors are raised rather than returned as
+    GenerationError strings, since the caller may already have forwarded partial text.
     """
     if not PROJECT_ID:
-        return [f"Error: GCP_PROJECT_ID not configured. Cannot call Imagen for {number_of_images} images."]
-    
-    image_data_list = []
-    try:
-        # Log the prompt
-        logger.log_text(f"Imagen Prompt: {prompt}")
-        model = ImageGenerationModel.from_pretrained(IMAGEN_MODEL_NAME)
-        
-        # Imagen's generate_images can take number_of_images directly
-        response = model.generate_images(
-            prompt=prompt,
-            number_of_images=number_of_images, 
-            aspect_ratio=aspect_ratio,
-            # output_file_format="png", # Recommended
-            # safety_filter_level="block_most", # Example
+        raise RuntimeError("GCP_PROJECT_ID not configured. Cannot call Gemini.")
+    await audit_logger.record_async("gemini_prompt", model=GEMINI_MODEL_NAME, prompt=prompt, stream=True)
+    model = await executors.run_blocking("vertex_ai", _get_gemini_model)
+    # The scheduler admits (and retries) opening the stream; the slot is released
+    # once the stream is open.
+    chunks = []
+    with metrics.span("gemini_stream", model=GEMINI_MODEL_NAME):
+        responses = await upstream_scheduler.submit(
+            "gemini",
+            lambda: model.generate_content_async([prompt], generation_config=generation_config, stream=True),
         )
-        
-        if response.images:
-            for i in range(min(number_of_images, len(response.images))): # Ensure we don't go out of bounds
-                image = response.images[i]
-                if image._image_bytes:
-                    image_bytes = image._image_bytes
-                    base64_image = base64.b64encode(image_bytes).decode("utf-8")
-                    image_data_list.append(f"data:image/png;base64,{base64_image}")
-                else:
-                    print(f"Warning: Image {i+1} from Imagen response did not contain image bytes. Image object: {image}")
-                    image_data_list.append("Error: Image generation failed for this item (no bytes).")
-            
-            # If fewer images were returned than requested
-            if len(image_data_list) < number_of_images:
-                print(f"Warning: Requested {number_of_images} images, but Imagen returned {len(response.images)}.")
-                # Pad with error messages for the missing images
-                for _ in range(number_of_images - len(image_data_list)):
-                    image_data_list.append("Error: Image not generated for this item (fewer returned than requested).")
-            return image_data_list
-        else:
-            error_message = "Imagen response did not contain any images."
-            print(error_message)
-            return ["Error: Image generation failed or no images returned." for _ in range(number_of_images)]
-            
+        async for response in responses:
+            if response.candidates and response.candidates[0].content.parts:
+                chunks.append(response.candidates[0].content.parts[0].text)
+                yield chunks[-1]
+    await audit_logger.record_async("gemini_response", model=GEMINI_MODEL_NAME, text="".join(chunks), stream=True)
+
+async def generate_ad_image_with_imagen_async(prompt: str, aspect_ratio: str = "1:1", number_of_images: int = 1) -> list[str]:
+    """
+    Generates ad images using the Imagen model, stores them in the image store and
+    returns a list of image URLs (/api/v1/images/{digest}). The Imagen SDK has no
+    async API, so the blocking call runs on the bounded "vertex_ai" thread pool, admitted
+    through the "imagen" upstream scheduler lane (rate limits, priority, retry on
+    quota errors).
+    """
+    if not PROJECT_ID:
+        return [GenerationError(f"Error: GCP_PROJECT_ID not configured. Cannot call Imagen for {number_of_images} images.") for _ in range(number_of_images)]
+
+    try:
+        # Queue the prompt for the audit log (no I/O on the request path)
+        await audit_logger.record_async("imagen_prompt", model=IMAGEN_MODEL_NAME, prompt=prompt, number_of_images=number_of_images)
+        with metrics.span("imagen", model=IMAGEN_MODEL_NAME, variations=number_of_images):
+            response = await upstream_scheduler.submit(
+                "imagen",
+                lambda: executors.run_blocking("vertex_ai", _call_imagen, prompt, aspect_ratio, number_of_images),
+                blocking=True,
+            )
+        # Store the PNGs and build their URLs
+        with metrics.span("image_store", model=IMAGEN_MODEL_NAME, variations=number_of_images):
+            image_data_list = await executors.run_blocking("vertex_ai", _image_data_from_imagen_response, response, number_of_images)
+        # Start encoding the preview/thumbnail renditions the UI will ask for.
+        image_renditions.prepare_in_background(image_data_list)
+        await audit_logger.record_async("imagen_response", model=IMAGEN_MODEL_NAME, images=image_data_list)
+        return image_data_list
+
     except Exception as e:
         print(f"Error calling Imagen API: {e}")
-        # import traceback
-        # print(traceback.format_exc())
-        return [f"Error generating ad image: An unexpected error occurred. Details: {str(e)}" for _ in range(number_of_images)]
+        return [GenerationError(f"Error generating ad image: An unexpected error occurred. Details: {str(e)}") for _ in range(number_of_images)]
+
+async def stream_ad_images_with_imagen_async(prompt: str, aspect_ratio: str = "1:1", number_of_images: int = 1):
+    """
+    Async generator yielding (index, image URL or GenerationError) for each of
+    number_of_images images, as soon as that image is in the image store. All of
+    them come from a single Imagen request, i.e. one admission on the "imagen"
+    upstream scheduler lane, same as generate_ad_image_with_imagen_async.
+    """
+    if not PROJECT_ID:
+        for i in range(number_of_images):
+            yield i, GenerationError(f"Error: GCP_PROJECT_ID not configured. Cannot call Imagen for {number_of_images} images.")
+        return
+    try:
+        await audit_logger.record_async("imagen_prompt", model=IMAGEN_MODEL_NAME, prompt=prompt, number_of_images=number_of_images, stream=True)
+        with metrics.span("imagen", model=IMAGEN_MODEL_NAME, variations=number_of_images):
+            response = await upstream_scheduler.submit(
+                "imagen",
+                lambda: executors.run_blocking("vertex_ai", _call_imagen, prompt, aspect_ratio, number_of_images),
+                blocking=True,
+            )
+    except Exception as e:
+        print(f"Error calling Imagen API: {e}")
+        for i in range(number_of_images):
+            yield i, GenerationError(f"Error generating ad image: An unexpected error occurred. Details: {str(e)}")
+        return
+
+    returned = len(response.images or [])
+    if returned < number_of_images:
+        print(f"Warning: Requested {number_of_images} images, but Imagen returned {returned}.")
+    image_data_list = []
+    for i in range(number_of_images):
+        if i >= returned:
+            image = GenerationError("Error: Image not generated for this item (fewer returned than requested).")
+        else:
+            try:
+                with metrics.span("image_store", model=IMAGEN_MODEL_NAME, variations=1):
+                    image = await executors.run_blocking("vertex_ai", _store_imagen_image, response, i)
+            except Exception as e:
+                print(f"Error storing Imagen image {i+1}: {e}")
+                image = GenerationError(f"Error generating ad image: could not store the image. Details: {str(e)}")
+            if not is_generation_error(image):
+                image_renditions.prepare_in_background([image])
+        image_data_list.append(image)
+        yield i, image
+    await audit_logger.record_async("imagen_response", model=IMAGEN_MODEL_NAME, images=image_data_list, stream=True)
@@ -0,0 +1,269 @@
+"""
+Offline load test for the ad generator API.
+
+Runs app.main:app in-process against the fake Vertex AI / BigQuery / Cloud
+Logging backends (app/services/fakes.py) and drives it with concurrent HTTP
+requests, then reports latency percentiles, throughput, memory and event-loop
+lag. Nothing leaves the machine and no quota is used.
+
+Usage (from backend/):
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.load_test --scenario generate --concurrency 20 --requests 200
+    python -m benchmarks.load_test --scenario personas --concurrency 50 --duration 10
+    python -m benchmarks.load_test --url http://localhost:8000 --scenario mixed   # an already running server
+
+Fake latencies, payload size and error rates are set with the FAKE_* environment
+variables (see app/services/fakes.py) or the matching flags below.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+SCENARIOS = ("generate", "stream", "personas", "mixed")
+
+
+def _max_rss_mb() -> float:
+    # ru_maxrss is in bytes on macOS and in KiB on Linux.
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=SCENARIOS, default="generate")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent virtual users.")
+    parser.add_argument("--requests", type=int, default=100, help="Total requests (ignored if --duration is set).")
+    parser.add_argument("--duration", type=float, default=None, help="Run for this many seconds instead of a fixed request count.")
+    parser.add_argument("--variations", type=int, default=3, help="number_of_variations for generation requests.")
+    parser.add_argument("--unique-ratio", type=float, default=1.0, help="Fraction of generation requests with a unique product (1.0 = no cache hits).")
+    parser.add_argument("--url", default=None, help="Benchmark a running server instead of the in-process app (no memory/lag metrics).")
+    parser.add_argument("--gemini-latency", type=float, default=None)
+    parser.add_argument("--imagen-latency", type=float, default=None)
+    parser.add_argument("--image-size", type=int, default=None, help="Fake image width/height in pixels.")
+    parser.add_argument("--error-rate", type=float, default=None)
+    parser.add_argument("--quota-error-rate", type=float, default=None)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    return parser.parse_args(argv)
+
+
+def configure_environment(args) -> None:
+    """Points the app at the fake backends and throwaway local storage. Must run before importing app.main."""
+    scratch = tempfile.mkdtemp(prefix="ad-generator-bench-")
+    defaults = {
+        "USE_FAKE_BACKENDS": "true",
+        "BIGQUERY_DATASET": "fake_dataset",
+        "BIGQUERY_TABLE_PERSONA": "fake_personas",
+        "IMAGE_STORE_DIR": os.path.join(scratch, "images"),
+        "BULK_JOBS_DB": os.path.join(scratch, "bulk_jobs.sqlite3"),
+        # The benchmark measures the service, not the fake quota limits
+        "GEMINI_REQUESTS_PER_MINUTE": "0",
+        "IMAGEN_REQUESTS_PER_MINUTE": "0",
+        "GEMINI_MAX_CONCURRENCY": "1000",
+        "IMAGEN_MAX_CONCURRENCY": "1000",
+        "VERTEX_AI_MAX_WORKERS": "64",
+    }
+    for name, value in defaults.items():
+        os.environ.setdefault(name, value)
+    overrides = {
+        "FAKE_GEMINI_LATENCY_SECONDS": args.gemini_latency,
+        "FAKE_IMAGEN_LATENCY_SECONDS": args.imagen_latency,
+        "FAKE_IMAGEN_IMAGE_SIZE": args.image_size,
+        "FAKE_ERROR_RATE": args.error_rate,
+        "FAKE_QUOTA_ERROR_RATE": args.quota_error_rate,
+    }
+    for name, value in overrides.items():
+        if value is not None:
+            os.environ[name] = str(value)
+
+
+class EventLoopLagMonitor:
+    """Measures how late a periodic 10 ms timer fires; blocking work on the loop shows up as lag."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: list[float] = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+def make_request(args, sequence: int):
+    """Returns (method, path, json body, is_stream) for the next request of the scenario."""
+    scenario = args.scenario
+    if scenario == "mixed":
+        scenario = random.choices(["generate", "personas", "stream"], weights=[6, 3, 1])[0]
+    if scenario == "personas":
+        return "GET", f"/api/v1/persona-segments?limit=50&offset={random.randint(0, 100)}", None, False
+    unique = random.random() < args.unique_ratio
+    product = f"Benchmark product {sequence if unique else sequence % 5}"
+    body = {
+        "product": product,
+        "product_description": "A product used to exercise the generation pipeline.",
+        "persona_description": "Customers aged 25-34 interested in running.",
+        "number_of_variations": args.variations,
+    }
+    if scenario == "stream":
+        return "POST", "/api/v1/generate_ad_content/stream", body, True
+    return "POST", "/api/v1/generate_ad_content", body, False
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run(args) -> dict:
+    import httpx
+
+    lifespan = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=300)
+    else:
+        from app.main import app
+
+        lifespan = app.router.lifespan_context(app)
+        await lifespan.__aenter__()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=300)
+
+    latencies: list[float] = []
+    first_byte: list[float] = []
+    status_counts: dict[int, int] = {}
+    response_bytes = 0
+    sequence = 0
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    def next_sequence():
+        nonlocal sequence
+        if deadline is None and sequence >= args.requests:
+            return None
+        if deadline is not None and time.perf_counter() >= deadline:
+            return None
+        sequence += 1
+        return sequence
+
+    async def user():
+        nonlocal response_bytes
+        while (n := next_sequence()) is not None:
+            method, path, body, is_stream = make_request(args, n)
+            started = time.perf_counter()
+            try:
+                async with client.stream(method, path, json=body) as response:
+                    ttfb = None
+                    async for chunk in response.aiter_bytes():
+                        if ttfb is None:
+                            ttfb = time.perf_counter() - started
+                        response_bytes += len(chunk)
+                    status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+                ttfb = None
+            latencies.append(time.perf_counter() - started)
+            if ttfb is not None:
+                first_byte.append(ttfb)
+            status_counts[status] = status_counts.get(status, 0) + 1
+
+    lag_monitor = EventLoopLagMonitor()
+    if not args.url:
+        tracemalloc.start()
+        lag_monitor.start()
+    baseline_memory = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+    started = time.perf_counter()
+    await asyncio.gather(*[user() for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - started
+
+    report = {
+        "scenario": args.scenario,
+        "target": args.url or "in-process (fake backends)",
+        "concurrency": args.concurrency,
+        "requests": len(latencies),
+        "elapsed_seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "status_codes": status_counts,
+        "latency_seconds": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": statistics.fmean(latencies) if latencies else 0.0,
+            "max": max(latencies, default=0.0),
+        },
+        "time_to_first_byte_seconds": {
+            "p50": percentile(first_byte, 50),
+            "p95": percentile(first_byte, 95),
+        },
+        "response_bytes_per_request": response_bytes / len(latencies) if latencies else 0,
+        "max_rss_mb": _max_rss_mb(),
+    }
+    if not args.url:
+        await lag_monitor.stop()
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        report["python_heap_peak_mb"] = peak_memory / 2**20
+        # Peak heap growth during the run spread over the requests in flight at once.
+        report["heap_per_in_flight_request_kb"] = (peak_memory - baseline_memory) / max(1, args.concurrency) / 1024
+        report["event_loop_lag_seconds"] = {
+            "p50": percentile(lag_monitor.samples, 50),
+            "p99": percentile(lag_monitor.samples, 99),
+            "max": max(lag_monitor.samples, default=0.0),
+        }
+        stats = await client.get("/api/v1/stats")
+        report["service_stats"] = stats.json()
+
+    await client.aclose()
+    if lifespan is not None:
+        await lifespan.__aexit__(None, None, None)
+    return report
+
+
+def print_report(report: dict) -> None:
+    latency = report["latency_seconds"]
+    print(f"Scenario:        {report['scenario']} against {report['target']}")
+    print(f"Requests:        {report['requests']} in {report['elapsed_seconds']:.2f}s at concurrency {report['concurrency']}")
+    print(f"Throughput:      {report['requests_per_second']:.2f} req/s")
+    print(f"Status codes:    {report['status_codes']}")
+    print(f"Latency:         p50 {latency['p50']*1000:.1f} ms | p95 {latency['p95']*1000:.1f} ms | p99 {latency['p99']*1000:.1f} ms | max {latency['max']*1000:.1f} ms")
+    print(f"First byte:      p50 {report['time_to_first_byte_seconds']['p50']*1000:.1f} ms | p95 {report['time_to_first_byte_seconds']['p95']*1000:.1f} ms")
+    print(f"Response size:   {report['response_bytes_per_request']/1024:.1f} KiB per request")
+    print(f"Max RSS:         {report['max_rss_mb']:.1f} MiB")
+    if "event_loop_lag_seconds" in report:
+        lag = report["event_loop_lag_seconds"]
+        print(f"Python heap:     peak {report['python_heap_peak_mb']:.1f} MiB, ~{report['heap_per_in_flight_request_kb']:.1f} KiB per in-flight request")
+        print(f"Event-loop lag:  p50 {lag['p50']*1000:.2f} ms | p99 {lag['p99']*1000:.2f} ms | max {lag['max']*1000:.2f} ms")
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if not args.url:
+        configure_environment(args)
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2, default=str))
+    else:
+        print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+# Gunicorn configuration for running several Uvicorn worker processes per
+# instance (used by the Dockerfile):
+#   gunicorn -c gunicorn_conf.py app.main:app
+#
+# Each worker is a full copy of the app with its own event loop. State that has
+# to be seen by every worker (result cache, persona data, leases for background
+# work) goes through the SQLite shared cache (app/services/shared_cache.py),
+# which is switched on here whenever more than one worker runs.
+import os
+
+
+def _cpu_count() -> int:
+    # Respects CPU affinity / container CPU sets where the platform exposes them.
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# Generation is I/O-bound (each worker multiplexes many requests on its event
+# loop), so one worker per CPU is enough to use the instance.
+workers = int(os.getenv("WEB_CONCURRENCY", "0")) or _cpu_count()
+worker_class = "uvicorn_worker.UvicornWorker"
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+
+# Async workers heartbeat independently of request duration, so this only catches
+# a blocked event loop. graceful_timeout leaves room for the lifespan shutdown
+# (bulk jobs re-queued, audit log flushed).
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+accesslog = os.getenv("GUNICORN_ACCESS_LOG") or None
+
+# Upstream scheduler limits (app/services/upstream_scheduler.py) are enforced per
+# process. Configured values are treated as the budget of the whole instance and
+# split evenly between the workers, so adding workers does not multiply the
+# request rate sent to Vertex AI. Defaults must match upstream_scheduler.lanes.
+UPSTREAM_LIMIT_DEFAULTS = {
+    "GEMINI_REQUESTS_PER_MINUTE": "60",
+    "GEMINI_MAX_CONCURRENCY": "8",
+    "IMAGEN_REQUESTS_PER_MINUTE": "20",
+    "IMAGEN_MAX_CONCURRENCY": "4",
+}
+
+
+def _split_upstream_limits(worker_count: int) -> None:
+    for name, default in UPSTREAM_LIMIT_DEFAULTS.items():
+        # Remember the instance-wide value, so a config reload (SIGHUP) does not divide twice.
+        instance_value = os.environ.setdefault(f"{name}_PER_INSTANCE", os.getenv(name, default))
+        if name.endswith("_REQUESTS_PER_MINUTE"):
+            # 0 means unlimited and stays 0.
+            os.environ[name] = str(float(instance_value) / worker_count)
+        else:
+            os.environ[name] = str(max(1, int(instance_value) // worker_count))
+
+
+if workers > 1:
+    # Workers inherit the environment, so these apply before the app is imported.
+    os.environ.setdefault("SHARED_CACHE_ENABLED", "true")
+    # Every worker has its own image process pool; keep the total at about one per CPU.
+    os.environ.setdefault("IMAGE_PROCESS_WORKERS", "1")
+    _split_upstream_limits(workers)
@@ -0,0 +1,30 @@
+import os
+import shutil
+import tempfile
+
+# The app reads its configuration from the environment when its modules are
+# imported, so this has to run before any test module imports app.*: offline
+# fake backends with no latency, and every on-disk path (image store, bulk job
+# database, ...) under a temporary directory instead of the real defaults.
+_tmp = tempfile.mkdtemp(prefix="ad-generator-tests-")
+os.environ.update(
+    USE_FAKE_BACKENDS="true",
+    GCP_PROJECT_ID="local-fake-project",
+    FAKE_GEMINI_LATENCY_SECONDS="0",
+    FAKE_IMAGEN_LATENCY_SECONDS="0",
+    FAKE_IMAGEN_IMAGE_SIZE="16",
+    IMAGE_STORE_DIR=os.path.join(_tmp, "images"),
+    BULK_JOBS_DB=os.path.join(_tmp, "bulk_jobs.sqlite3"),
+    SHARED_CACHE_ENABLED="false",
+    SHARED_CACHE_DB=os.path.join(_tmp, "shared_cache.sqlite3"),
+    RESULT_CACHE_DIR="",
+    IMAGE_EAGER_RENDITIONS="false",
+    AUDIT_LOG_SINK="none",
+    GEMINI_REQUESTS_PER_MINUTE="0",
+    IMAGEN_REQUESTS_PER_MINUTE="0",
+    VARIATION_RETRY_BACKOFF_SECONDS="0",
+)
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_tmp, ignore_errors=True)
@@ -0,0 +1,160 @@
+import asyncio
+import os
+
+import pytest
+from app.services import ad_generation_service
+from app.services.fakes import FakeGenerativeModel, FakeImageGenerationModel
+
+
+class CallCounter:
+    """Counts calls to a patched fake model method and raises on the ones listed in fail_calls (1-based)."""
+
+    def __init__(self, fail_calls):
+        self.fail_calls = set(fail_calls)
+        self.calls = 0
+
+    def check(self):
+        self.calls += 1
+        if self.calls in self.fail_calls:
+            raise RuntimeError(f"injected failure on call {self.calls}")
+
+
+@pytest.fixture
+def fail_imagen(monkeypatch):
+    def install(*fail_calls):
+        counter = CallCounter(fail_calls)
+        original = FakeImageGenerationModel.generate_images
+
+        def generate_images(self, *args, **kwargs):
+            counter.check()
+            return original(self, *args, **kwargs)
+
+        monkeypatch.setattr(FakeImageGenerationModel, "generate_images", generate_images)
+        return counter
+    return install
+
+
+@pytest.fixture
+def fail_gemini(monkeypatch):
+    def install(*fail_calls):
+        counter = CallCounter(fail_calls)
+        original = FakeGenerativeModel.generate_content_async
+
+        async def generate_content_async(self, *args, **kwargs):
+            counter.check()
+            return await original(self, *args, **kwargs)
+
+        monkeypatch.setattr(FakeGenerativeModel, "generate_content_async", generate_content_async)
+        return counter
+    return install
+
+
+def test_per_variation_retries_only_the_failed_image(fail_imagen, fail_gemini):
+    imagen = fail_imagen(1)
+    gemini = fail_gemini()
+    creatives, statuses = asyncio.run(ad_generation_service.generate_creatives_per_variation(
+        "Retry shoe", "Image fails once", None, 1, bypass_cache=True
+    ))
+    assert statuses[0]["status"] == "ok"
+    assert statuses[0]["attempts"] == 2
+    assert imagen.calls == 2
+    assert gemini.calls == 1
+    assert creatives[0]["ad_image_data"].startswith("/api/v1/images/")
+
+
+def test_per_variation_retries_the_failed_text(fail_imagen, fail_gemini):
+    imagen = fail_imagen()
+    gemini = fail_gemini(1, 2)
+    creatives, statuses = asyncio.run(ad_generation_service.generate_creatives_per_variation(
+        "Retry shoe", "Text fails twice", None, 1, bypass_cache=True
+    ))
+    assert statuses[0]["status"] == "ok"
+    assert statuses[0]["attempts"] == 3
+    assert gemini.calls == 3
+    assert imagen.calls == 1
+    assert not ad_generation_service.is_generation_error(creatives[0]["ad_text"])
+
+
+def test_per_variation_reports_failure_after_max_attempts(fail_imagen):
+    imagen = fail_imagen(*range(1, 100))
+    with pytest.raises(ad_generation_service.AdGenerationError):
+        asyncio.run(ad_generation_service.generate_creatives_per_variation(
+            "Retry shoe", "Image always fails", None, 1, bypass_cache=True
+        ))
+    assert imagen.calls == ad_generation_service.VARIATION_MAX_ATTEMPTS
+
+
+def test_batched_generation_raises_on_upstream_exception(fail_imagen):
+    fail_imagen(1)
+    with pytest.raises(ad_generation_service.AdGenerationError):
+        asyncio.run(ad_generation_service.generate_creatives("Batched shoe", "Imagen raises", None, 2, bypass_cache=True))
+
+
+def test_failed_generations_are_not_cached(fail_imagen, fail_gemini):
+    from app.services.result_cache import result_cache
+
+    fail_imagen(*range(1, 100))
+    fail_gemini(*range(1, 100))
+    sets_before = result_cache.stats()["sets"]
+    with pytest.raises(ad_generation_service.AdGenerationError):
+        asyncio.run(ad_generation_service.generate_creatives("Uncached shoe", "Everything fails", None, 2))
+    with pytest.raises(ad_generation_service.AdGenerationError):
+        asyncio.run(ad_generation_service.generate_creatives_per_variation("Uncached shoe", "Everything fails", None, 1))
+
+    async def drain_stream():
+        return [event async for event in ad_generation_service.stream_creatives("Uncached shoe", "Everything fails", None, 2)]
+
+    events = asyncio.run(drain_stream())
+    assert events[-1][0] == "summary" and events[-1][1]["errors"] == 4
+    assert result_cache.stats()["sets"] == sets_before
+
+
+def test_cache_guard_rejects_error_payloads():
+    from app.services.vertex_ai_service import GenerationError
+
+    creatives = [{"ad_text": "Fine copy", "ad_image_data": GenerationError("Error generating ad image: boom")}]
+    assert asyncio.run(ad_generation_service._cache_creatives("guard-test", creatives)) is False
+
+
+def test_stream_requests_all_images_in_one_imagen_call(fail_imagen):
+    imagen = fail_imagen()
+
+    async def drain_stream():
+        return [event async for event in ad_generation_service.stream_creatives("Stream shoe", "One Imagen call", None, 3, bypass_cache=True)]
+
+    events = asyncio.run(drain_stream())
+    assert imagen.calls == 1
+    assert sorted(data["index"] for event, data in events if event == "image") == [0, 1, 2]
+    assert events[-1] == ("summary", {**events[-1][1], "errors": 0, "creatives": 3})
+
+
+def test_cache_hit_with_evicted_image_regenerates(fail_imagen):
+    from app.services.image_store import image_store
+
+    imagen = fail_imagen()
+    first = asyncio.run(ad_generation_service.generate_creatives("Evicted shoe", "Image evicted", None, 1))
+    assert asyncio.run(ad_generation_service.generate_creatives("Evicted shoe", "Image evicted", None, 1)) == first
+    assert imagen.calls == 1
+
+    digest = image_store.digest_from_url(first[0]["ad_image_data"])
+    os.remove(image_store.backend._find(digest)[0])
+
+    second = asyncio.run(ad_generation_service.generate_creatives("Evicted shoe", "Image evicted", None, 1))
+    assert imagen.calls == 2
+    assert image_store.get(image_store.digest_from_url(second[0]["ad_image_data"])) is not None
+
+
+def test_aborted_stream_leaves_no_tasks_behind(monkeypatch):
+    from app.services.fakes import fake_config
+
+    monkeypatch.setattr(fake_config, "imagen_latency_seconds", 0.2)
+
+    async def abort_after_first_event():
+        stream = ad_generation_service.stream_creatives("Aborted shoe", "Client goes away", None, 2, bypass_cache=True)
+        await stream.__anext__()
+        await stream.aclose()
+        return {task.get_coro().__name__ for task in asyncio.all_tasks() if task is not asyncio.current_task()}
+
+    # Only the Imagen call already running on the thread pool is left to finish (it
+    # cannot be interrupted); the producers and the pending queue read are gone.
+    assert asyncio.run(abort_after_first_event()) <= {"run_blocking"}
@@ -0,0 +1,20 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.models.ad_models import AdGenerationRequest
+from app.routers import ads
+from app.services import metrics
+
+
+@pytest.mark.parametrize("number_of_variations", [0, 5, 50])
+def test_out_of_range_variations_are_rejected_with_a_bounded_metric_label(number_of_variations):
+    request = AdGenerationRequest(product="Shoe", product_description="Label test", number_of_variations=number_of_variations)
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(ads.generate_ad_content_api(request))
+    assert excinfo.value.status_code == 400
+
+    rendered = metrics.registry.render()
+    assert f'variations="{number_of_variations}"' not in rendered
+    assert 'variations="invalid"' in rendered
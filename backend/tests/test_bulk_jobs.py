@@ -0,0 +1,47 @@
+import asyncio
+import os
+
+from app.services.bulk_jobs import BulkJobRunner, BulkJobStore
+
+
+def _runner(tmp_path, lease_available):
+    runner = BulkJobRunner(BulkJobStore(str(tmp_path / "bulk_jobs.sqlite3")), concurrency=1)
+
+    async def acquire(job_id):
+        return lease_available
+
+    runner._acquire = acquire
+    return runner
+
+
+def test_resume_reports_a_job_leased_by_another_worker(tmp_path):
+    runner = _runner(tmp_path, lease_available=False)
+    job_id = runner.store.create_job([{"product": "Shoe"}])
+    runner.store.set_job_status(job_id, "running")
+
+    assert asyncio.run(runner.resume(job_id)) == "leased"
+    assert runner.store.get_job(job_id)["status"] == "running"
+    assert job_id not in runner._tasks
+
+
+def test_resume_unknown_job(tmp_path):
+    runner = _runner(tmp_path, lease_available=True)
+    assert asyncio.run(runner.resume("missing")) == "not_found"
+
+
+def test_finished_items_keep_their_images_after_eviction(tmp_path):
+    from app.services.image_store import FilesystemImageBackend, image_store
+
+    archive = FilesystemImageBackend(str(tmp_path / "bulk_job_images"))
+    image_store.add_archive(archive)
+    try:
+        runner = BulkJobRunner(BulkJobStore(str(tmp_path / "bulk_jobs.sqlite3")), concurrency=1, image_archive=archive)
+        digest = image_store.put(b"bulk job image", "image/png")
+        runner._archive_images({"creatives": [{"ad_text": "Copy", "ad_image_data": image_store.url_for(digest)}]})
+
+        os.remove(image_store.backend._find(digest)[0])
+
+        assert image_store.get(digest) == (b"bulk job image", "image/png")
+        assert image_store.touch([image_store.url_for(digest)])
+    finally:
+        image_store.archives.remove(archive)
@@ -0,0 +1,60 @@
+import os
+import time
+
+from app.services.image_store import FilesystemImageBackend
+
+DIGESTS = [f"{i:02x}" * 32 for i in range(4)]
+
+
+def _put(backend, digest, size=100):
+    backend.put(digest, b"x" * size, "image/png")
+
+
+def _age(backend, digest, seconds):
+    path = os.path.join(backend.root, digest[:2], digest + ".png")
+    stamp = time.time() - seconds
+    os.utime(path, (stamp, stamp))
+
+
+def test_size_cap_evicts_least_recently_used_with_renditions(tmp_path):
+    backend = FilesystemImageBackend(str(tmp_path), max_bytes=350)
+    _put(backend, DIGESTS[0])
+    backend.put_rendition(DIGESTS[0], "preview.webp", b"p" * 10, "image/webp")
+    _put(backend, DIGESTS[1])
+    _put(backend, DIGESTS[2])
+    _age(backend, DIGESTS[0], 30)
+    _age(backend, DIGESTS[1], 20)
+    _age(backend, DIGESTS[2], 10)
+    backend.get(DIGESTS[0])  # read last: no longer the least recently used
+
+    _put(backend, DIGESTS[3])
+
+    assert backend.exists(DIGESTS[0])
+    assert backend.get_rendition(DIGESTS[0], "preview.webp") is not None
+    assert not backend.exists(DIGESTS[1])
+    assert backend.exists(DIGESTS[3])
+    assert backend.stats()["bytes"] <= 350 * 0.9
+
+
+def test_max_age_evicts_images_and_renditions(tmp_path):
+    backend = FilesystemImageBackend(str(tmp_path), max_age_seconds=60, sweep_interval_seconds=0)
+    _put(backend, DIGESTS[0])
+    backend.put_rendition(DIGESTS[0], "thumbnail.webp", b"t" * 10, "image/webp")
+    for name in os.listdir(os.path.join(backend.root, DIGESTS[0][:2])):
+        stamp = time.time() - 120
+        os.utime(os.path.join(backend.root, DIGESTS[0][:2], name), (stamp, stamp))
+
+    _put(backend, DIGESTS[1])
+
+    assert not backend.exists(DIGESTS[0])
+    assert backend.get_rendition(DIGESTS[0], "thumbnail.webp") is None
+    assert backend.exists(DIGESTS[1])
+    assert backend.stats()["evicted_images"] == 1
+
+
+def test_no_limits_never_sweeps(tmp_path):
+    backend = FilesystemImageBackend(str(tmp_path))
+    for digest in DIGESTS:
+        _put(backend, digest)
+    assert all(backend.exists(digest) for digest in DIGESTS)
+    assert backend.stats()["sweeps"] == 0
@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+from app.services import ad_generation_service
+from app.services.result_cache import ResultCache
+from app.services.shared_cache import SharedCache
+from app.services.vertex_ai_service import GenerationError
+
+CREATIVES = [{"ad_text": "Cached copy", "ad_image_data": "data:image/png;base64,AAAA"}]
+
+
+def test_disk_hit_is_promoted_to_memory(tmp_path):
+    writer = ResultCache(disk_dir=str(tmp_path))
+    asyncio.run(writer.set("key", CREATIVES))
+
+    # A fresh process: empty memory tier, same disk directory.
+    reader = ResultCache(disk_dir=str(tmp_path))
+    assert asyncio.run(reader.get("key")) == CREATIVES
+    assert asyncio.run(reader.get("key")) == CREATIVES
+    stats = reader.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["entries"]) == (1, 1, 1)
+
+
+def test_shared_hit_is_promoted_to_memory(tmp_path):
+    shared = SharedCache(str(tmp_path / "shared_cache.sqlite3"))
+    asyncio.run(ResultCache(shared=shared).set("key", CREATIVES))
+
+    other_worker = ResultCache(shared=shared)
+    assert asyncio.run(other_worker.get("key")) == CREATIVES
+    assert asyncio.run(other_worker.get("key")) == CREATIVES
+    stats = other_worker.stats()
+    assert (stats["shared_hits"], stats["memory_hits"]) == (1, 1)
+
+
+def test_entries_expire_after_the_ttl(tmp_path):
+    cache = ResultCache(ttl_seconds=0.05, disk_dir=str(tmp_path))
+    asyncio.run(cache.set("key", CREATIVES))
+    assert asyncio.run(cache.get("key")) == CREATIVES
+    time.sleep(0.1)
+    assert asyncio.run(cache.get("key")) is None
+    assert asyncio.run(cache.ttl("key")) is None
+    assert cache.stats()["expirations"] == 2  # memory and disk tier
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResultCache(max_entries=2)
+    for key in ("a", "b"):
+        asyncio.run(cache.set(key, CREATIVES))
+    asyncio.run(cache.get("a"))
+    asyncio.run(cache.set("c", CREATIVES))
+    assert asyncio.run(cache.get("b")) is None
+    assert asyncio.run(cache.get("a")) == CREATIVES
+    assert cache.stats()["evictions"] == 1
+
+
+def test_generation_errors_are_never_stored(monkeypatch):
+    cache = ResultCache()
+    monkeypatch.setattr(ad_generation_service, "result_cache", cache)
+    failed = [{"ad_text": GenerationError("Error generating ad text: boom"), "ad_image_data": "/api/v1/images/" + "0" * 64}]
+
+    assert asyncio.run(ad_generation_service._cache_creatives("key", failed)) is False
+    assert asyncio.run(ad_generation_service._cache_creatives("key", CREATIVES)) is True
+    assert cache.stats()["sets"] == 1
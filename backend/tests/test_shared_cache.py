@@ -0,0 +1,16 @@
+import time
+
+from app.services.shared_cache import SharedCache
+
+
+def test_stats_reports_entries_without_querying(tmp_path):
+    cache = SharedCache(str(tmp_path / "shared_cache.sqlite3"), max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.set("results", key, {"key": key}, time.time() + 60)
+    cache.trim()
+
+    def no_queries():
+        raise AssertionError("stats() must not query SQLite")
+
+    cache._connection = no_queries
+    assert cache.stats()["entries"] == 2
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+from app.services import ad_generation_service
+from app.services.fakes import FakeImageGenerationModel
+from app.services.single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight()
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"creatives": ["shared"]}
+
+    async def scenario():
+        return await asyncio.gather(*[flights.do("key", factory) for _ in range(5)])
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    stats = flights.stats()
+    assert (stats["leaders"], stats["coalesced"], stats["in_flight"]) == (1, 4, 0)
+
+
+def test_concurrent_callers_share_the_error():
+    flights = SingleFlight()
+
+    async def factory():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream failed")
+
+    async def scenario():
+        return await asyncio.gather(*[flights.do("key", factory) for _ in range(3)], return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert flights.stats()["errors"] == 1
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    flights = SingleFlight()
+
+    async def factory():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def scenario():
+        leader = asyncio.create_task(flights.do("key", factory))
+        follower = asyncio.create_task(flights.do("key", factory))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+
+    assert asyncio.run(scenario()) == "done"
+
+
+def test_identical_generation_requests_make_one_upstream_call(monkeypatch):
+    calls = []
+    original = FakeImageGenerationModel.generate_images
+
+    def generate_images(self, *args, **kwargs):
+        calls.append(1)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(FakeImageGenerationModel, "generate_images", generate_images)
+
+    async def scenario():
+        return await asyncio.gather(*[
+            ad_generation_service.generate_creatives("Coalesced shoe", "Same request", None, 2, bypass_cache=True)
+            for _ in range(3)
+        ])
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert results[0] == results[1] == results[2]
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from app.services import executors
+from app.services.fakes import FakeGenerativeModel, ResourceExhausted, fake_config
+from app.services.upstream_scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, UpstreamLane
+
+
+@pytest.fixture
+def fake_quota_errors(monkeypatch):
+    """Sets fake_config.quota_error_rate for the test, restoring it afterwards."""
+    monkeypatch.setattr(fake_config, "quota_error_rate", fake_config.quota_error_rate)
+    return fake_config
+
+
+def test_interactive_calls_go_ahead_of_queued_bulk_calls():
+    lane = UpstreamLane("test", requests_per_minute=0, max_concurrency=1)
+    order = []
+
+    async def scenario():
+        release_first = asyncio.Event()
+
+        async def call(name, wait=None):
+            order.append(name)
+            if wait is not None:
+                await wait.wait()
+
+        first = asyncio.create_task(lane.submit(lambda: call("first", release_first)))
+        await asyncio.sleep(0)
+        queued = [
+            asyncio.create_task(lane.submit(lambda: call("bulk-1"), priority=PRIORITY_BULK)),
+            asyncio.create_task(lane.submit(lambda: call("bulk-2"), priority=PRIORITY_BULK)),
+        ]
+        await asyncio.sleep(0)
+        queued.append(asyncio.create_task(lane.submit(lambda: call("interactive"), priority=PRIORITY_INTERACTIVE)))
+        await asyncio.sleep(0)
+        assert lane.stats()["queue_depth"] == 3
+        release_first.set()
+        await asyncio.gather(first, *queued)
+
+    asyncio.run(scenario())
+    assert order == ["first", "interactive", "bulk-1", "bulk-2"]
+
+
+def test_requests_per_minute_cap_spaces_call_starts():
+    # 600 RPM = one start every 0.1 s; the bucket holds max_concurrency (1) token.
+    lane = UpstreamLane("test", requests_per_minute=600, max_concurrency=1)
+    starts = []
+
+    async def call():
+        starts.append(time.monotonic())
+
+    async def scenario():
+        await asyncio.gather(*[lane.submit(call) for _ in range(4)])
+
+    asyncio.run(scenario())
+    gaps = [later - earlier for earlier, later in zip(starts, starts[1:])]
+    assert len(starts) == 4
+    assert all(gap >= 0.09 for gap in gaps), gaps
+
+
+def test_quota_error_pauses_the_lane_then_retries(fake_quota_errors):
+    lane = UpstreamLane("test", requests_per_minute=0, max_concurrency=2, backoff_base_seconds=0.1)
+    model = FakeGenerativeModel("fake-gemini")
+    starts = []
+
+    async def call():
+        starts.append(time.monotonic())
+        # Only the first attempt hits the injected 429.
+        fake_quota_errors.quota_error_rate = 1.0 if len(starts) == 1 else 0.0
+        return await model.generate_content_async(["Quota test"])
+
+    response = asyncio.run(lane.submit(call))
+    assert response.candidates[0].content.parts[0].text
+    assert len(starts) == 2
+    assert starts[1] - starts[0] >= 0.05  # jittered backoff: between half and all of the 0.1 s base
+    stats = lane.stats()
+    assert (stats["quota_errors"], stats["retries"], stats["succeeded"], stats["active"]) == (1, 1, 1, 0)
+
+
+def test_quota_errors_give_up_after_max_attempts(fake_quota_errors):
+    lane = UpstreamLane("test", requests_per_minute=0, max_concurrency=1, max_attempts=3, backoff_base_seconds=0.01)
+    model = FakeGenerativeModel("fake-gemini")
+    fake_quota_errors.quota_error_rate = 1.0
+
+    with pytest.raises(ResourceExhausted):
+        asyncio.run(lane.submit(lambda: model.generate_content_async(["Quota test"])))
+    stats = lane.stats()
+    assert (stats["started"], stats["quota_errors"], stats["failed"], stats["active"]) == (3, 3, 1, 0)
+
+
+def test_cancelled_blocking_call_keeps_its_slot_until_it_returns():
+    lane = UpstreamLane("test", requests_per_minute=0, max_concurrency=1)
+    started, finish = threading.Event(), threading.Event()
+
+    def blocking_call():
+        started.set()
+        finish.wait(5)
+        return "done"
+
+    async def scenario():
+        call = asyncio.create_task(lane.submit(lambda: executors.run_blocking("vertex_ai", blocking_call), blocking=True))
+        await asyncio.to_thread(started.wait, 5)
+        call.cancel()
+        await asyncio.sleep(0)
+        active_while_running = lane.stats()["active"]
+        finish.set()
+        for _ in range(100):
+            if lane.stats()["active"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        return active_while_running, lane.stats()["active"]
+
+    assert asyncio.run(scenario()) == (1, 0)
@@ -8,6 +8,7 @@ import { generateAdContent, AdGenerationRequestPayload, AdGenerationResponseData
 interface AdVariation {
   adText: string | null;
   adImageData: string | null;
+  adImagePreview?: string | null;
 }
 
 const initialAdVariations: AdVariation[] = [
@@ -75,7 +76,8 @@ function App() {
       if (response.creatives && response.creatives.length > 0) {
         const newAdVariations: AdVariation[] = response.creatives.map(creative => ({
           adText: creative.ad_text,
-          adImageData: creative.ad_image_data
+          adImageData: creative.ad_image_data,
+          adImagePreview: creative.ad_image_preview
         }));
         // Ensure we always have 3 variations for display, padding with nulls if fewer are returned
         const paddedVariations = [...newAdVariations];
@@ -147,6 +149,7 @@ function App() {
               key={index}
               adText={ad.adText}
               adImageData={ad.adImageData}
+              adImagePreview={ad.adImagePreview}
               isLoading={isLoading} // Pass global loading state; AdDisplay handles its internal view
             />
           ))}
@@ -1,17 +1,18 @@
 import React from 'react';
-import { Paper, Typography, Box, Card, CardMedia, CardContent, CircularProgress } from '@mui/material';
+import { Paper, Typography, Box, Card, CardMedia, CardContent, CircularProgress, Link } from '@mui/material';
 import ReactMarkdown from 'react-markdown';
 import remarkGfm from 'remark-gfm';
 
 interface AdDisplayProps {
   adText: string | null;
   adImageData: string | null; // Changed prop name
+  adImagePreview?: string | null; // Downscaled rendition shown in the card; adImageData stays the full-resolution download
   isLoading: boolean;
 }
 
-const AdDisplay: React.FC<AdDisplayProps> = ({ adText, adImageData, isLoading }) => {
-  // Check if adImageData looks like a valid data URI
-  const isValidDataUri = adImageData && adImageData.startsWith('data:image');
+const AdDisplay: React.FC<AdDisplayProps> = ({ adText, adImageData, adImagePreview, isLoading }) => {
+  // Check if adImageData looks like a valid image source (served image URL or legacy data URI)
+  const isValidDataUri = adImageData && (adImageData.startsWith('/api/v1/images/') || adImageData.startsWith('data:image'));
 
   // console.log("Is valid data uri : " + isValidDataUri);
 
@@ -65,7 +66,7 @@ const AdDisplay: React.FC<AdDisplayProps> = ({ adText, adImageData, isLoading })
             <CardMedia
               component="img"
               alt="Generated Ad Image"
-              image={adImageData} // Use adImageData
+              image={adImagePreview || adImageData || undefined}
               sx={{ 
                 maxHeight: '60%', 
                 width: '100%', 
@@ -73,11 +74,16 @@ const AdDisplay: React.FC<AdDisplayProps> = ({ adText, adImageData, isLoading })
                 mb: 1, 
               }}
             />
-          ) : adImageData ? ( // If adImageData exists but is not a valid data URI (e.g., an error message from backend)
+          ) : adImageData ? ( // If adImageData exists but is not a valid image source (e.g., an error message from backend)
             <Typography variant="caption" color="error" textAlign="center" sx={{ p:2, wordBreak: 'break-all' }}>
               Could not display image. Received: {adImageData}
             </Typography>
           ) : null}
+          {isValidDataUri && adImagePreview && (
+            <Link href={adImageData || undefined} download variant="caption" sx={{ display: 'block', textAlign: 'right', px: 1 }}>
+              Download full resolution
+            </Link>
+          )}
           <CardContent sx={{ flexGrow: 1, overflowY: 'auto', p: 1, textAlign: 'left', width: '100%' }}>
             {adText && (
               <ReactMarkdown remarkPlugins={[remarkGfm]}>
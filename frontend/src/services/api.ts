@@ -10,15 +10,30 @@ export interface AdGenerationRequestPayload {
   product_description: string;
   persona_description?: string; // Added to include the description of the selected persona
   number_of_variations?: number; // Added to specify how many ads to generate
+  bypass_cache?: boolean; // Skip the server-side result cache and generate fresh creatives
+  inline_images?: boolean; // Legacy: return images as base64 data URIs instead of URLs
+  generation_mode?: 'batched' | 'per_variation'; // per_variation retries failed variations individually
 }
 
 export interface AdCreative {
   ad_text: string;
-  ad_image_data: string; 
+  ad_image_data: string; // Image URL (/api/v1/images/{digest}) or a data URI in inline mode
+  ad_image_preview?: string | null; // Downscaled WebP/PNG rendition for display (image URLs only)
+  ad_image_thumbnail?: string | null; // Smaller rendition for lists and grids
+  variation_index?: number | null;
+}
+
+export interface VariationStatus {
+  index: number;
+  status: 'ok' | 'failed';
+  attempts: number;
+  cached: boolean;
+  error?: string | null;
 }
 
 export interface AdGenerationResponseData {
   creatives: AdCreative[]; // Expects a list of ad creatives
+  variations?: VariationStatus[] | null; // Only set in per_variation mode
 }
 
 /**
@@ -49,14 +64,34 @@ export interface PersonaSegmentsResponse {
   [key: string]: string[]; // A dictionary where keys are strings and values are arrays of strings
 }
 
+// Page size for /persona-segments (the backend accepts at most 1000 rows per request).
+const PERSONA_PAGE_SIZE = 1000;
+
 /**
- * Calls the backend API to fetch persona segments.
+ * Calls the backend API to fetch all persona segments. The endpoint is paginated,
+ * so pages are requested until the X-Total-Count header is reached and their
+ * column lists concatenated.
  * @returns A promise that resolves to the persona segments data.
  */
 export const getPersonaSegments = async (): Promise<PersonaSegmentsResponse> => {
   try {
-    const response = await axios.get<PersonaSegmentsResponse>(`${API_BASE_URL}/persona-segments`);
-    return response.data;
+    const data: PersonaSegmentsResponse = {};
+    let offset = 0;
+    let total = 0;
+    do {
+      const response = await axios.get<PersonaSegmentsResponse>(`${API_BASE_URL}/persona-segments`, {
+        params: { offset, limit: PERSONA_PAGE_SIZE },
+      });
+      let rows = 0;
+      for (const [column, values] of Object.entries(response.data)) {
+        data[column] = (data[column] || []).concat(values);
+        rows = Math.max(rows, values.length);
+      }
+      total = Number(response.headers['x-total-count'] ?? 0);
+      offset += rows;
+      if (rows === 0) break; // Never loop if the total changed while paging
+    } while (offset < total);
+    return data;
   } catch (error) {
     console.error('Error fetching persona segments:', error);
     if (axios.isAxiosError(error) && error.response) {